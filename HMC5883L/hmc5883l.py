@@ -6,21 +6,26 @@ Created on Thu Feb 22 22:09:54 2024
 """
 
 # sensor.py
-from i2c import I2CInterface
-from register_map import RegisterMap
+from i2c import I2CInterface, BitField, pack
+from HMC5883L.register_map import RegisterMap
 import numpy as np
 import ctypes
+import time
 
 class HMC5883L:
     """
     
     """
-    def __init__(self, address, bus_number=1):
+    def __init__(self, address, bus_number=1, i2c=None):
         self.address = address
-        self.i2c = I2CInterface(bus_number)
+        self.i2c = I2CInterface(bus_number) if i2c is None else i2c
         self.sr = 0
         self.mag = np.empty(3)
+        self.overflow = np.zeros(3, dtype=bool)
         self.gain = 0
+        self.shadow = {}
+        self.dirty = set()
+        self.hold = 0
         self.DEBUG = False
 
     def read_measurement(self, register):
@@ -44,7 +49,7 @@ class HMC5883L:
         
         reading = (high_byte << 8) | low_byte
 
-        return ctypes.c_int32(reading).value
+        return ctypes.c_int16(reading).value
 
     def read_data(self, register, output="int"):
         """       
@@ -63,13 +68,9 @@ class HMC5883L:
         """
         # Example: Read data from a specific register of the sensor
         data = self.i2c.read_byte(self.address, register)
-        data_bitstring = self.i2c.int_to_binary_string(data, 8)
-        
-        value = {
-            "int" : data,
-            "str" : data_bitstring
-            }
-        return value[output]
+        if output == "str":
+            return self.i2c.int_to_binary_string(data, 8)
+        return data
     
     def write_data(self, register, value):
         """
@@ -90,10 +91,14 @@ class HMC5883L:
         """
         # Example: Read data from a specific register of the sensor
         self.i2c.write_byte(self.address, register, value)
+        if register in RegisterMap.SHADOW_REGISTERS:
+            self.shadow[register] = value & ~RegisterMap.SHADOW_REGISTERS[register]
+            self.dirty.discard(register)
 
     def modify_register(self, register, value, position):
         """
         Function to modify a bit or a group of contiguous bits in a register.
+        Wrapper of field_set for bit strings indexed from the MSB.
 
         Parameters
         ----------
@@ -109,70 +114,219 @@ class HMC5883L:
         None.
 
         """
-        data = self.read_data(register)
-        bit_string = self.i2c.int_to_binary_string(data, 8)
-        new_string = self.i2c.modify_bit_string(bit_string, value, position)
-        new_data = self.i2c.binary_string_to_int(new_string)
+        offset = 8 - position - len(value)
+        if position < 0 or offset < 0:
+            raise ValueError(f"Invalid position {position} for a {len(value)} bit value")
+        self.field_set(BitField(register, offset, len(value)), int(value, 2))
+
+    def field_get(self, field):
+        """
+        Function to read the value of a register field.
+
+        Parameters
+        ----------
+        field : BitField
+            Field to read, see RegisterMap.
+
+        Returns
+        -------
+        int or str
+            Value of the field.
+
+        """
+        return field.decode(self.register_get(field.register))
+
+    def field_set(self, field, value):
+        """
+        Function to modify a register field.
+
+        Parameters
+        ----------
+        field : BitField
+            Field to modify, see RegisterMap.
+        value : int or str
+            New value of the field.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.fields_set({field : value})
+
+    def fields_set(self, values):
+        """
+        Function to modify several fields of the same register with a single
+        write. The current value is taken from the shadow copy, so only the
+        write goes on the bus (or nothing while the changes are held).
+
+        Parameters
+        ----------
+        values : dict
+            Mapping from BitField to the new value of the field.
+
+        Returns
+        -------
+        None.
+
+        """
+        register = next(iter(values)).register
+        data = self.register_get(register)
+        new_data = pack(values, data)
         if self.DEBUG:
-            print("Modifying register:", register, ":", bit_string, "->", new_string)
-        self.write_data(register, new_data)
+            print("Modifying register:", register, ":", f"{data:08b}", "->", f"{new_data:08b}")
+        self.register_set(register, new_data)
+
+    def register_set(self, register, value):
+        """
+        Function to write a register, or only its shadow copy while the
+        changes are held.
+
+        Parameters
+        ----------
+        register : hex
+            Address of the register.
+        value : int
+            New value of the register.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.hold and register in RegisterMap.SHADOW_REGISTERS:
+            if value != self.register_get(register):
+                self.shadow[register] = value
+                self.dirty.add(register)
+        else: self.write_data(register, value)
+
+    def register_get(self, register):
+        """
+        Function to get the value of a configuration register.
+        The shadow copy is used when available, otherwise the register is
+        red from the device and stored in the shadow copy.
+
+        Parameters
+        ----------
+        register : hex
+            Address of the register.
+
+        Returns
+        -------
+        int
+            Value of the register.
+
+        """
+        if register not in RegisterMap.SHADOW_REGISTERS:
+            return self.read_data(register)
+        if register not in self.shadow:
+            self.shadow[register] = self.read_data(register) & ~RegisterMap.SHADOW_REGISTERS[register]
+        return self.shadow[register]
+
+    def shadow_load(self):
+        """
+        Function to populate the shadow copy with the configuration registers
+        of the device.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.shadow_invalidate()
+        for register in RegisterMap.SHADOW_REGISTERS:
+            self.register_get(register)
+
+    def shadow_invalidate(self):
+        """
+        Function to discard the shadow copy and the pending changes.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.shadow = {}
+        self.dirty = set()
+
+    def hold_changes(self):
+        """
+        Function to hold the register modifications in the shadow copy until
+        apply_changes is called. Calls can be nested.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.hold += 1
+
+    def apply_changes(self):
+        """
+        Function to write the pending register modifications, each modified
+        register is written once.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.hold = max(self.hold - 1, 0)
+        if self.hold:
+            return
+        for register in sorted(self.dirty):
+            self.write_data(register, self.shadow[register])
 
     def avg_get(self):
 
-        value = self.read_data(RegisterMap.CRA, output="str")[1:3]
-        samples_avgd = list(RegisterMap.sample_average.keys())[list(RegisterMap.sample_average.values()).index(value)]
+        samples_avgd = self.field_get(RegisterMap.MA)
         print("No of samples averaged per measurement output:", samples_avgd)
     
     def avg_set(self, samples):
         
-        self.modify_register(RegisterMap.CRA, RegisterMap.sample_average[samples], 1)
+        self.field_set(RegisterMap.MA, samples)
     
     def output_rate_get(self):
 
-        value = self.read_data(RegisterMap.CRA, output="str")[3:7]
-        output_rate = list(RegisterMap.output_rate.keys())[list(RegisterMap.output_rate.values()).index(value)]
+        output_rate = self.field_get(RegisterMap.DO)
         print("Output rate(Hz):", output_rate)
 
     def output_rate_set(self, rate):
 
-        self.modify_register(RegisterMap.CRA, RegisterMap.output_rate[rate], 3)
+        self.field_set(RegisterMap.DO, rate)
     
     def meas_mode_get(self):
 
-        value = self.read_data(RegisterMap.CRA, output="str")[6:]
-        meas_mode = list(RegisterMap.measurement_mode.keys())[list(RegisterMap.measurement_mode.values()).index(value)]
+        meas_mode = self.field_get(RegisterMap.MS)
         print("Measurement mode", meas_mode)
 
     def meas_mode_set(self, int_val):
 
         meas_mode = list(RegisterMap.measurement_mode.keys())[int_val]
-        mode_str = list(RegisterMap.measurement_mode.values())[int_val]
-        self.modify_register(RegisterMap.CRA, RegisterMap.measurement_mode[mode_str], 6)
+        self.field_set(RegisterMap.MS, meas_mode)
         print("Setting the measurement mode to", meas_mode)
 
     def gain_get(self):
 
-        value = self.read_data(RegisterMap.CRB, output="str")[0:3]
+        value = f"{self.field_get(RegisterMap.GN):03b}"
         self.gain = RegisterMap.sensor_range[value][1]
         print("Sensor Field Range (Ga)", RegisterMap.sensor_range[value][0])
 
     def gain_set(self, range):
 
         idx = [i[0] for i in list(RegisterMap.sensor_range.values())].index(range)
-        bitstr = list(RegisterMap.sensor_range.keys())[idx]
-        self.write_data(RegisterMap.CRB, bitstr+"00000")
+        self.write_data(RegisterMap.CRB, RegisterMap.GN.encode(idx))
         self.gain = [i[1] for i in list(RegisterMap.sensor_range.values())][idx]
 
     def mode_get(self):
 
-        value = self.read_data(RegisterMap.MR, output="str")[6:]
-        print("Device is in", RegisterMap.operating_mode[value], "mode")
+        value = RegisterMap.MD.decode(self.read_data(RegisterMap.MR))
+        print("Device is in", value, "mode")
 
     def mode_set(self, int_val):
 
         meas_mode = list(RegisterMap.operating_mode.keys())[int_val]
-        mode_str = list(RegisterMap.operating_mode.values())[int_val]        
-        self.write_data(RegisterMap.MR, "000000"+mode_str)
+        self.write_data(RegisterMap.MR, RegisterMap.MD.encode(meas_mode))
         print("Setting the device to", meas_mode, "measurement mode")
 
     def read_mag_x(self):
@@ -196,12 +350,180 @@ class HMC5883L:
             print("Measurement Error in z-axis")
         else: self.mag[2] = raw_value/self.gain * 1000 #value in mGa
     
+    def read_raw(self):
+        """
+        Function to read the three axis in a single block read.
+        The 6 output bytes are red in one transaction, in register order, so
+        the device releases the data lock and updates the output registers.
+
+        Returns
+        -------
+        numpy.ndarray
+            Raw int16 values (x, y, z), -4096 on overflow.
+
+        """
+        data = self.i2c.read_block(self.address, RegisterMap.DXRA, RegisterMap.OUTPUT_LENGTH)
+        return np.frombuffer(data, dtype=">i2")[RegisterMap.OUTPUT_ORDER]
+
     def read_mag(self):
+        """
+        Function to read the magnetic field with one burst read.
+        The axis in overflow keep their previous value and are flagged in
+        the overflow mask.
 
-        self.read_mag_x()
-        self.read_mag_y()
-        self.read_mag_z()
+        Returns
+        -------
+        numpy.ndarray
+            Magnetic field x, y, z in mGa.
+
+        """
+        raw = self.read_raw()
+        self.overflow[:] = raw == RegisterMap.OVERFLOW
+        valid = ~self.overflow
+        self.mag[valid] = raw[valid]/self.gain * 1000 #value in mGa
+        if self.overflow.any():
+            print("Measurement Error in axis", [axis for axis, flag in zip("xyz", self.overflow) if flag])
+        return self.mag
+
+    def single_measurement_trigger(self):
+        """
+        Function to start a single measurement. The device measures once,
+        sets RDY and returns to idle mode.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.write_data(RegisterMap.MR, RegisterMap.MD.encode("Single"))
+
+    def data_ready_wait(self, timeout=0.01, interval=0.001):
+        """
+        Function to poll the RDY bit of the status register.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Maximum waiting time in seconds. The default is 0.01.
+        interval : float, optional
+            Time between two polls in seconds. The default is 0.001.
+
+        Returns
+        -------
+        bool
+            True if data is ready.
+
+        """
+        end = time.monotonic() + timeout
+        while not self.field_get(RegisterMap.RDY):
+            if time.monotonic() > end:
+                return False
+            time.sleep(interval)
+        return True
+
+    def single_measurement(self, timeout=0.01):
+        """
+        Function to trigger a single measurement and read it when ready.
+        A measurement takes about 6 ms.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Maximum waiting time in seconds. The default is 0.01.
+
+        Returns
+        -------
+        numpy.ndarray or None
+            Magnetic field x, y, z in mGa, None on timeout.
+
+        """
+        self.single_measurement_trigger()
+        if not self.data_ready_wait(timeout):
+            print("Single measurement timed out")
+            return None
+        return self.read_mag()
     
+    def read_high_rate(self, n, waiter=None, delay=0.006, timeout=0.01, out=None, max_missed=10):
+        """
+        Function to read the magnetic field above the 75 Hz of the continuous
+        mode (up to about 160 Hz) with back-to-back single measurements:
+        trigger, wait for data ready, burst read.
+        Data ready is taken from the waiter (e.g. gpio.GPIOInterrupt on the
+        DRDY pin, which goes low when the data is ready) or by polling RDY
+        in the status register after the conversion time. Sample averaging
+        is set to 1, as the higher averages lengthen the conversion.
+
+        Parameters
+        ----------
+        n : int
+            Number of measurements.
+        waiter : object, optional
+            Object with a wait(timeout) method returning True on data ready.
+            The default is None (status register polling).
+        delay : float, optional
+            Time before the first RDY poll in seconds. The default is 0.006.
+        timeout : float, optional
+            Maximum waiting time of a conversion in seconds, a measurement
+            not ready by then is counted as missed. The default is 0.01.
+        out : numpy.ndarray, optional
+            Preallocated array (n x 3) for the field. The default is None.
+        max_missed : int, optional
+            Number of consecutive missed conversions after which the read
+            stops (DRDY not wired, device unplugged or in another mode).
+            The default is 10.
+
+        Returns
+        -------
+        data : numpy.ndarray
+            Magnetic field x, y, z in mGa (m x 3, m < n if the read stopped
+            on missed conversions), NaN on overflow.
+        timestamps : numpy.ndarray
+            time.monotonic_ns() of the reads (m).
+        stats : dict
+            Achieved rate in Hz, missed conversions and overflows.
+
+        """
+        raw = np.empty((n, 3), dtype=np.int16)
+        timestamps = np.empty(n, dtype=np.int64)
+        self.field_set(RegisterMap.MA, 1)
+        trigger = RegisterMap.MD.encode("Single")
+        missed = 0
+        consecutive = 0
+        
+        start = time.monotonic_ns()
+        i = 0
+        while i < n and consecutive < max_missed:
+            self.write_data(RegisterMap.MR, trigger)
+            if waiter is not None:
+                ready = waiter.wait(timeout)
+            else:
+                time.sleep(delay)
+                ready = self.data_ready_wait(timeout - delay, interval=0.0002)
+            if not ready:
+                missed += 1
+                consecutive += 1
+                continue
+            consecutive = 0
+            raw[i] = self.read_raw()
+            timestamps[i] = time.monotonic_ns()
+            i += 1
+        elapsed = (time.monotonic_ns() - start)/1e9
+        
+        raw, timestamps = raw[:i], timestamps[:i]
+        overflow = raw == RegisterMap.OVERFLOW
+        data = (out if out is not None else np.empty((n, 3)))[:i]
+        np.divide(raw, self.gain/1000, out=data)
+        data[overflow] = np.nan
+        if i:
+            self.mag[:] = data[-1]
+        stats = {
+            "rate_hz" : i/elapsed if elapsed else 0.0,
+            "missed" : missed,
+            "overflows" : int(overflow.any(axis=1).sum())}
+        if self.DEBUG:
+            print("High rate read:", stats)
+        return data, timestamps, stats
+
     def identify(self):
 
         intA = self.read_data(RegisterMap.IRA)
@@ -223,9 +545,10 @@ class HMC5883L:
 
     def wakeup(self):
 
-        self.write_data(RegisterMap.CRA, self.i2c.binary_string_to_int("01110000")) #01110000 8 samples averaged ("11"), 15Hz output rate ("100"), normal measurement mode ("00"), 
-        self.write_data(RegisterMap.CRB, self.i2c.binary_string_to_int("10100000")) #10100000 Gain = "101" = 4.7 Ga
-        self.write_data(RegisterMap.MR, self.i2c.binary_string_to_int("00000000"))  #00000000 Continuous-measurement mode
+        self.write_data(RegisterMap.CRA, pack({RegisterMap.MA : 8, RegisterMap.DO : 15, RegisterMap.MS : "Normal"})) #01110000 8 samples averaged ("11"), 15Hz output rate ("100"), normal measurement mode ("00"), 
+        self.write_data(RegisterMap.CRB, RegisterMap.GN.encode(5)) #10100000 Gain = "101" = 4.7 Ga
+        self.gain = RegisterMap.sensor_range["101"][1]
+        self.write_data(RegisterMap.MR, RegisterMap.MD.encode("Continuous"))  #00000000 Continuous-measurement mode
 
     def self_test(self):
 
@@ -234,15 +557,15 @@ class HMC5883L:
         gain = 5
         axis = ["X", "Y", "Z"]
 
-        self.write_data(RegisterMap.CRA, self.i2c.binary_string_to_int("01110001")) #01110000 8 samples averaged ("11"), 15Hz output rate ("100"), positive bias mode ("01"), 
-        self.write_data(RegisterMap.CRB, self.i2c.binary_string_to_int(self.i2c.int_to_binary_string(gain,3)+"00000")) #10100000 Gain = 5("101") = 4.7 Ga
-        self.write_data(RegisterMap.MR, self.i2c.binary_string_to_int("00000000"))  #00000000 Continuous-measurement mode
+        self.write_data(RegisterMap.CRA, pack({RegisterMap.MA : 8, RegisterMap.DO : 15, RegisterMap.MS : "Positive bias"})) #01110001 8 samples averaged ("11"), 15Hz output rate ("100"), positive bias mode ("01"), 
+        self.write_data(RegisterMap.CRB, RegisterMap.GN.encode(gain)) #10100000 Gain = 5("101") = 4.7 Ga
+        self.write_data(RegisterMap.MR, RegisterMap.MD.encode("Continuous"))  #00000000 Continuous-measurement mode
         
         for gain in range(5, 8):
             
             self_test = 0
             print("Gain", gain)
-            self.write_data(RegisterMap.CRB, self.i2c.binary_string_to_int(self.i2c.int_to_binary_string(gain,3)+"00000")) #10100000 Gain = 5("101") = 4.7 Ga
+            self.write_data(RegisterMap.CRB, RegisterMap.GN.encode(gain)) #10100000 Gain = 5("101") = 4.7 Ga
             for i in range(2):
                 if self.status:
                     self.read_mag()
@@ -260,7 +583,7 @@ class HMC5883L:
 
             if self_test == 2:
                 print("Self Test Passed!")
-                self.write_data(RegisterMap.CRA, self.i2c.binary_string_to_int("01110000")) #01110000 8 samples averaged ("11"), 15Hz output rate ("100"), normal measurement mode ("00"), 
+                self.write_data(RegisterMap.CRA, pack({RegisterMap.MA : 8, RegisterMap.DO : 15, RegisterMap.MS : "Normal"})) #01110000 8 samples averaged ("11"), 15Hz output rate ("100"), normal measurement mode ("00"), 
                 break
             else:
                 print("Self Test Not Passed. Increasing Gain...")
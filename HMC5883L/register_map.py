@@ -8,22 +8,40 @@ Created on Thu Feb 22 21:24:10 2024
 # =============================================================================
 # REGISTER MAP DEFINITION
 # =============================================================================
+from i2c import BitField
 
 class RegisterMap:
     CRA = 0x00
     CRB = 0X01
     MR = 0X02
+    # output registers are ordered X, Z, Y
     DXRA = 0X03
     DXRB = 0X04
-    DYRA = 0X05
-    DYRB = 0X06
-    DZRA = 0X07
-    DZRB = 0X08
+    DZRA = 0X05
+    DZRB = 0X06
+    DYRA = 0X07
+    DYRB = 0X08
     SR = 0X09
     IRA = 0X0A
     IRB = 0X0B
     IRC = 0X0C
 
+    # number of data output registers, DXRA to DYRB
+    OUTPUT_LENGTH = 6
+    # position of X, Y and Z in the output block
+    OUTPUT_ORDER = [0, 2, 1]
+    # value of an axis after an overflow or underflow of the ADC
+    OVERFLOW = -4096
+    
+    # Configuration registers kept in the shadow copy of the device, with
+    # the mask of the bits that clear themselves after being written.
+    # MR is left out because the device returns to idle by itself after a
+    # single measurement.
+    SHADOW_REGISTERS = {
+        CRA : 0x00,
+        CRB : 0x00
+    }
+
     sample_average = {
         1 : "00",
         2 : "01",
@@ -62,4 +80,15 @@ class RegisterMap:
         "Continuous" : "00",
         "Single" : "01",
         "Idle" : "10"
-    }
\ No newline at end of file
+    }
+
+    # =========================================================================
+    # REGISTER FIELDS
+    # =========================================================================
+    MA = BitField(CRA, 5, 2, {samples : int(code, 2) for samples, code in sample_average.items()})
+    DO = BitField(CRA, 2, 3, {rate : int(code, 2) for rate, code in output_rate.items()})
+    MS = BitField(CRA, 0, 2, {mode : int(code, 2) for mode, code in measurement_mode.items()})
+    GN = BitField(CRB, 5, 3)
+    MD = BitField(MR, 0, 2, {mode : int(code, 2) for mode, code in operating_mode.items()})
+    RDY = BitField(SR, 0)
+    LOCK = BitField(SR, 1)
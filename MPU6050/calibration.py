@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+"""
+Calibration of the MPU6050: gyro bias, accel offset and scale fitted on
+sample batches, and profiles stored per device.
+"""
+
+# =============================================================================
+# CALIBRATION
+# =============================================================================
+import errno
+import json
+import os
+import time
+
+import numpy as np
+
+from MPU6050.register_map import RegisterMap
+
+ACCEL = ["accel_x", "accel_y", "accel_z"]
+GYRO = ["gyro_x", "gyro_y", "gyro_z"]
+
+# gravity in the six orientations of the accel calibration: +x, -x, +y, -y,
+# +z, -z pointing up
+ORIENTATIONS = np.vstack([np.eye(3), -np.eye(3)])[[0, 3, 1, 4, 2, 5]]
+
+class CalibrationProfile:
+    """
+    Calibration of one MPU6050:
+        accel = (measured - accel_offset)/accel_scale
+        gyro = measured - gyro_bias
+    with accel in g and gyro in º/s.
+    """
+    def __init__(self, gyro_bias=None, accel_offset=None, accel_scale=None, key=None, created=None):
+        self.gyro_bias = np.zeros(3) if gyro_bias is None else np.asarray(gyro_bias, dtype=float)
+        self.accel_offset = np.zeros(3) if accel_offset is None else np.asarray(accel_offset, dtype=float)
+        self.accel_scale = np.ones(3) if accel_scale is None else np.asarray(accel_scale, dtype=float)
+        self.key = key
+        self.created = time.time() if created is None else created
+
+    def adjust(self, channels, scale, offset):
+        """
+        Function to fold the calibration in the scale and offset vectors of a
+        batch, so that batch*scale + offset gives calibrated values.
+
+        Parameters
+        ----------
+        channels : list
+            Names of the columns of the batch.
+        scale : numpy.ndarray
+            Scale of each column, modified in place.
+        offset : numpy.ndarray
+            Offset of each column, modified in place.
+
+        Returns
+        -------
+        None.
+
+        """
+        for i, name in enumerate(channels):
+            if name in ACCEL:
+                k = ACCEL.index(name)
+                scale[i] /= self.accel_scale[k]
+                offset[i] = (offset[i] - self.accel_offset[k])/self.accel_scale[k]
+            elif name in GYRO:
+                offset[i] -= self.gyro_bias[GYRO.index(name)]
+
+    def apply(self, batch, channels):
+        """
+        Function to calibrate a batch of scaled samples with one fused
+        multiply-add.
+
+        Parameters
+        ----------
+        batch : numpy.ndarray
+            Samples in g, ºC and º/s (N x channels).
+        channels : list
+            Names of the columns of the batch.
+
+        Returns
+        -------
+        numpy.ndarray
+            Calibrated samples (N x channels).
+
+        """
+        scale = np.ones(len(channels))
+        offset = np.zeros(len(channels))
+        self.adjust(channels, scale, offset)
+        return batch*scale + offset
+
+    def to_dict(self):
+        return {
+            "gyro_bias" : self.gyro_bias.tolist(),
+            "accel_offset" : self.accel_offset.tolist(),
+            "accel_scale" : self.accel_scale.tolist(),
+            "key" : self.key,
+            "created" : self.created}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+def device_key(sensor):
+    """
+    Function to build the key of a device: bus number, address and WHO_AM_I.
+
+    Parameters
+    ----------
+    sensor : MPU6050
+        Sensor.
+
+    Returns
+    -------
+    str
+        Key of the device.
+
+    """
+    who_am_i = sensor.read_data(RegisterMap.WHO_AM_I)
+    return f"{sensor.i2c.bus_number}-{sensor.address:#04x}-{who_am_i:#04x}"
+
+class ProfileStore:
+    """
+    JSON file of calibration profiles keyed by device.
+    """
+    def __init__(self, path="~/.mpu6050_calibration.json"):
+        self.path = os.path.expanduser(path)
+
+    def profiles(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def load(self, key):
+        """
+        Function to load the profile of a device.
+
+        Parameters
+        ----------
+        key : str
+            Key of the device, see device_key.
+
+        Returns
+        -------
+        CalibrationProfile or None
+            Stored profile, None if the device has never been calibrated.
+
+        """
+        data = self.profiles().get(key)
+        return None if data is None else CalibrationProfile.from_dict(data)
+
+    def save(self, profile):
+        """
+        Function to store a profile, replacing the previous one of the device.
+
+        Parameters
+        ----------
+        profile : CalibrationProfile
+            Profile with its key.
+
+        Returns
+        -------
+        None.
+
+        """
+        profiles = self.profiles()
+        profiles[profile.key] = profile.to_dict()
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(profiles, f, indent=2)
+        os.replace(tmp, self.path)
+
+def collect(sensor, n, fifo=True, interval=0.02, rate=None, timeout=None):
+    """
+    Function to collect a batch of accel and gyro samples, through the FIFO or
+    with one burst read per sample.
+    The FIFO is drained at least twice per FIFO capacity at the sample rate,
+    and the FIFO configuration of the sensor is restored at the end. The
+    calibration of the sensor is suspended during the collection, so a new
+    profile is never fitted on calibrated samples.
+
+    Parameters
+    ----------
+    sensor : MPU6050
+        Sensor, with full scale ranges configured.
+    n : int
+        Number of samples.
+    fifo : bool, optional
+        Collect through the FIFO. The default is True.
+    interval : float, optional
+        Maximum time between two FIFO drains in seconds. The default is 0.02.
+    rate : float, optional
+        Sample rate in Hz programmed during the collection (see
+        MPU6050.output_rate_set), the previous one is restored at the end.
+        The default is None (the configured rate).
+    timeout : float, optional
+        Maximum duration in seconds. The default is None, twice the
+        duration at the sample rate plus one second.
+
+    Raises
+    ------
+    OSError
+        ETIMEDOUT if the samples are not collected in time, e.g. when the
+        bus is too slow to drain the FIFO at the sample rate.
+
+    Returns
+    -------
+    numpy.ndarray
+        Samples (n x 6) in g and º/s, columns ACCEL + GYRO, without
+        calibration.
+
+    """
+    if not sensor.accel_fs or not sensor.gyro_fs:
+        sensor.gyro_config_get()
+        sensor.accel_config_get()
+    previous = None
+    if rate is not None:
+        previous = (sensor.register_get(RegisterMap.SMPLRT_DIV), sensor.register_get(RegisterMap.CONFIG))
+        sensor.output_rate_set(rate)
+    elif not sensor.sr:
+        sensor.sample_rate_get()
+    rate = sensor.sr*1000
+    if timeout is None:
+        timeout = 2*n/rate + 1
+    end = time.monotonic() + timeout
+    raw = np.empty((n, 6), dtype=np.int16)
+    collected = 0
+    profile, sensor.calibration = sensor.calibration, None
+    try:
+        if fifo:
+            # 12 bytes frames of accel and gyro
+            frames = RegisterMap.FIFO_SIZE//12
+            collected = collect_fifo(sensor, raw, min(interval, frames/rate/2), end)
+        else:
+            for collected in range(n):
+                if time.monotonic() > end:
+                    break
+                raw[collected] = sensor.read_raw()[[0, 1, 2, 4, 5, 6]]
+                time.sleep(1/rate)
+            else: collected = n
+        samples = sensor.fifo_scale(raw[:collected], ACCEL + GYRO)
+    finally:
+        sensor.calibration = profile
+        if previous is not None:
+            sensor.hold_changes()
+            sensor.register_set(RegisterMap.SMPLRT_DIV, previous[0])
+            sensor.register_set(RegisterMap.CONFIG, previous[1])
+            sensor.apply_changes()
+            sensor.sample_rate_get()
+    if collected < n:
+        raise OSError(errno.ETIMEDOUT, f"Collected {collected} of {n} samples in {timeout:.1f} s")
+    return samples
+
+def collect_fifo(sensor, raw, interval, end):
+    # FIFO acquisition of collect, the FIFO configuration is restored
+    fifo_en = sensor.register_get(RegisterMap.FIFO_EN)
+    enabled = sensor.field_get(RegisterMap.USER_FIFO_EN)
+    channels, preallocated = sensor.fifo_channels, sensor.fifo_batch
+    collected = 0
+    try:
+        sensor.fifo_config_set(accel=True, gyro=True, temp=False)
+        sensor.fifo_enable()
+        while collected < len(raw) and time.monotonic() < end:
+            time.sleep(interval)
+            batch = sensor.fifo_read()
+            m = min(len(batch), len(raw) - collected)
+            raw[collected:collected + m] = batch[:m]
+            collected += m
+    finally:
+        sensor.fifo_disable()
+        sensor.register_set(RegisterMap.FIFO_EN, fifo_en)
+        sensor.fifo_channels, sensor.fifo_batch = channels, preallocated
+        if enabled:
+            sensor.fifo_enable()
+    return collected
+
+def gyro_bias(samples):
+    """
+    Function to estimate the gyro bias from samples of a still device.
+
+    Parameters
+    ----------
+    samples : numpy.ndarray
+        Samples (n x 6) returned by collect.
+
+    Returns
+    -------
+    numpy.ndarray
+        Bias of each gyro axis in º/s.
+
+    """
+    return samples[:, 3:6].mean(axis=0)
+
+def accel_level(samples, up=2):
+    """
+    Function to estimate the accel offset of a device lying still with one
+    axis pointing up, assuming unit scale.
+
+    Parameters
+    ----------
+    samples : numpy.ndarray
+        Samples (n x 6) returned by collect.
+    up : int, optional
+        Axis pointing up. The default is 2 (z).
+
+    Returns
+    -------
+    numpy.ndarray
+        Offset of each accel axis in g.
+
+    """
+    expected = np.zeros(3)
+    expected[up] = 1
+    return samples[:, 0:3].mean(axis=0) - expected
+
+def accel_six_position(means, orientations=ORIENTATIONS):
+    """
+    Function to fit accel offset and scale from the mean accel measured in
+    six orientations, with a least squares fit of
+        measured = scale*gravity + offset
+    solved for the three axis at once.
+
+    Parameters
+    ----------
+    means : numpy.ndarray
+        Mean accel of each orientation (6 x 3) in g.
+    orientations : numpy.ndarray, optional
+        Gravity in each orientation (6 x 3). The default is ORIENTATIONS
+        (+x, -x, +y, -y, +z, -z up).
+
+    Returns
+    -------
+    offset : numpy.ndarray
+        Offset of each axis in g.
+    scale : numpy.ndarray
+        Scale of each axis.
+
+    """
+    means = np.asarray(means, dtype=float)
+    # design matrix of each axis (3 x 6 x 2): [gravity, 1]
+    A = np.stack([orientations.T, np.ones_like(orientations.T)], axis=-1)
+    AtA = A.transpose(0, 2, 1) @ A
+    Atb = A.transpose(0, 2, 1) @ means.T[..., None]
+    solution = np.linalg.solve(AtA, Atb)[..., 0]
+    return solution[:, 1], solution[:, 0]
+
+def calibrate_six_position(sensor, n=500, wait=input, fifo=True, rate=200, store=None):
+    """
+    Function to run the six orientations calibration, asking the user to
+    turn the device between the acquisitions. As MPU6050.calibrate, the
+    profile is applied to every following read of the sensor.
+
+    Parameters
+    ----------
+    sensor : MPU6050
+        Sensor.
+    n : int, optional
+        Number of samples in each orientation. The default is 500.
+    wait : callable, optional
+        Function called with a message before each orientation.
+        The default is input.
+    fifo : bool, optional
+        Collect through the FIFO. The default is True.
+    rate : float, optional
+        Sample rate in Hz during the acquisitions. The default is 200.
+    store : ProfileStore, optional
+        Store where the profile is saved. The default is None.
+
+    Returns
+    -------
+    CalibrationProfile
+        Profile of the device.
+
+    """
+    labels = ["+x", "-x", "+y", "-y", "+z", "-z"]
+    means = np.empty((6, 3))
+    bias = []
+    for i, label in enumerate(labels):
+        wait(f"Place the device still with the {label} axis pointing up and press Enter")
+        samples = collect(sensor, n, fifo, rate=rate)
+        means[i] = samples[:, 0:3].mean(axis=0)
+        bias.append(gyro_bias(samples))
+    offset, scale = accel_six_position(means)
+    profile = CalibrationProfile(np.mean(bias, axis=0), offset, scale, key=device_key(sensor))
+    sensor.calibration = profile
+    if store is not None:
+        store.save(profile)
+    return profile
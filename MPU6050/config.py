@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+Snapshots of the MPU6050 configuration registers and the planner of the
+sample rate and DLPF settings.
+"""
+
+# =============================================================================
+# CONFIGURATION SNAPSHOT
+# =============================================================================
+import dataclasses
+
+from i2c import pack
+from MPU6050.register_map import RegisterMap
+
+def runs(registers):
+    """
+    Function to group register addresses in runs of consecutive addresses,
+    each transferred with a single block read or write.
+
+    Parameters
+    ----------
+    registers : iterable
+        Register addresses.
+
+    Returns
+    -------
+    list
+        (first register, length) of each run, in increasing address order.
+
+    """
+    groups = []
+    for register in sorted(registers):
+        if groups and groups[-1][0] + groups[-1][1] == register:
+            groups[-1][1] += 1
+        else: groups.append([register, 1])
+    return [tuple(group) for group in groups]
+
+@dataclasses.dataclass(frozen=True)
+class MPU6050Config:
+    """
+    Immutable copy of the configuration registers of a MPU6050 (the
+    RegisterMap.SHADOW_REGISTERS), as returned by MPU6050.config_snapshot
+    and written by MPU6050.config_apply.
+    The fields are the register values, the defaults are the values after a
+    reset. The bits that clear themselves (resets) are always 0.
+    Modified copies are built with with_fields, e.g.
+        config.with_fields({RegisterMap.DLPF_CFG : 1, RegisterMap.SLEEP : 0})
+    """
+    smplrt_div: int = 0x00
+    config: int = 0x00
+    gyro_config: int = 0x00
+    accel_config: int = 0x00
+    fifo_en: int = 0x00
+    i2c_mst_ctrl: int = 0x00
+    i2c_slv0_addr: int = 0x00
+    i2c_slv0_reg: int = 0x00
+    i2c_slv0_ctrl: int = 0x00
+    int_pin_cfg: int = 0x00
+    int_enable: int = 0x00
+    i2c_mst_delay_ctrl: int = 0x00
+    user_ctrl: int = 0x00
+    pwr_mgmt_1: int = 0x40
+    pwr_mgmt_2: int = 0x00
+
+    def __post_init__(self):
+        for field in dataclasses.fields(self):
+            register = getattr(RegisterMap, field.name.upper())
+            value = getattr(self, field.name)
+            if not isinstance(value, int) or not 0 <= value <= 0xFF:
+                raise ValueError(f"Invalid value {value!r} for register {field.name.upper()}")
+            # a snapshot never carries a pending reset
+            object.__setattr__(self, field.name, value & ~RegisterMap.SHADOW_REGISTERS[register])
+
+    @classmethod
+    def from_registers(cls, values):
+        """
+        Function to build a configuration from register values.
+
+        Parameters
+        ----------
+        values : dict
+            Mapping from register address to value, missing registers take
+            their reset value.
+
+        Returns
+        -------
+        MPU6050Config
+            The configuration.
+
+        """
+        return cls(**{field.name : values[getattr(RegisterMap, field.name.upper())]
+                      for field in dataclasses.fields(cls)
+                      if getattr(RegisterMap, field.name.upper()) in values})
+
+    def registers(self):
+        """
+        Function to get the register values.
+
+        Returns
+        -------
+        dict
+            Mapping from register address to value.
+
+        """
+        return {getattr(RegisterMap, field.name.upper()) : getattr(self, field.name)
+                for field in dataclasses.fields(self)}
+
+    def get(self, field):
+        """
+        Function to read a register field.
+
+        Parameters
+        ----------
+        field : BitField
+            Field to read, see RegisterMap.
+
+        Returns
+        -------
+        int
+            Value of the field.
+
+        """
+        return field.decode(self.registers()[field.register])
+
+    def with_fields(self, values):
+        """
+        Function to build a copy of the configuration with some fields
+        modified.
+
+        Parameters
+        ----------
+        values : dict
+            Mapping from BitField to the new value of the field.
+
+        Returns
+        -------
+        MPU6050Config
+            The modified configuration.
+
+        """
+        registers = self.registers()
+        for field, value in values.items():
+            registers[field.register] = pack({field : value}, registers[field.register])
+        return self.from_registers(registers)
+
+    def diff(self, other):
+        """
+        Function to get the registers that differ from another configuration.
+
+        Parameters
+        ----------
+        other : MPU6050Config
+            Configuration to compare with, e.g. the one of the device.
+
+        Returns
+        -------
+        dict
+            Mapping from register address to the value of this configuration,
+            for the registers whose value differs.
+
+        """
+        theirs = other.registers()
+        return {register : value for register, value in self.registers().items() if theirs[register] != value}
+
+    @property
+    def dlpf_cfg(self):
+        return RegisterMap.DLPF_CFG.decode(self.config)
+
+    @property
+    def sample_rate(self):
+        """Sample rate in Hz."""
+        gyro_rate = 8000 if self.dlpf_cfg in (0, 7) else 1000
+        return gyro_rate/(1 + self.smplrt_div)
+
+    @property
+    def fs_sel(self):
+        return RegisterMap.FS_SEL.decode(self.gyro_config)
+
+    @property
+    def afs_sel(self):
+        return RegisterMap.AFS_SEL.decode(self.accel_config)
+
+    @property
+    def gyro_range(self):
+        """Full scale range of the gyro in º/s."""
+        return 250*2**self.fs_sel
+
+    @property
+    def accel_range(self):
+        """Full scale range of the accel in g."""
+        return 2**(self.afs_sel + 1)
+
+    @property
+    def sleep(self):
+        return RegisterMap.SLEEP.decode(self.pwr_mgmt_1)
+
+    @property
+    def clksel(self):
+        return RegisterMap.CLKSEL.decode(self.pwr_mgmt_1)
+
+@dataclasses.dataclass(frozen=True)
+class RatePlan:
+    """
+    DLPF_CFG and SMPLRT_DIV chosen by rate_plan, with the achieved sample
+    rate (Hz), the rate of new accel samples (Hz, at most 1 kHz), the
+    bandwidths (Hz) and the delay (ms) of the filter.
+    """
+    dlpf_cfg: int
+    smplrt_div: int
+    rate: float
+    accel_rate: float
+    accel_bandwidth: float
+    gyro_bandwidth: float
+    delay: float
+
+def rate_plan(rate, bandwidth=None, accel=True):
+    """
+    Function to choose the DLPF and the sample rate divider for a target
+    output rate: the lowest achievable rate not below the target, then the
+    lowest bandwidth not below the requested one (less noise, less data).
+    Without a requested bandwidth only the settings with both bandwidths
+    below half their rate (no aliasing) are considered, if any.
+    The gyro output rate is 8 kHz without DLPF and 1 kHz with it, so rates
+    above 1 kHz are only reachable with DLPF_CFG 0. The accel outputs at
+    1 kHz in any case: above 1 kHz its samples are repeated, so these rates
+    are only planned for the gyro.
+
+    Parameters
+    ----------
+    rate : float
+        Target sample rate in Hz.
+    bandwidth : float, optional
+        Minimum bandwidth of both accel and gyro in Hz. The default is None,
+        the widest bandwidth below half the achieved rate (the lowest one
+        when the rate is below 10 Hz).
+    accel : bool, optional
+        The accel samples are used: rates above RegisterMap.ACCEL_RATE are
+        rejected. The default is True.
+
+    Raises
+    ------
+    ValueError
+        If no setting reaches the rate and the bandwidth, or the rate is above
+        the accel output rate with accel.
+
+    Returns
+    -------
+    RatePlan
+        The chosen setting.
+
+    """
+    if rate <= 0:
+        raise ValueError(f"Invalid sample rate {rate}")
+    if accel and rate > RegisterMap.ACCEL_RATE:
+        raise ValueError(f"The accel outputs {RegisterMap.ACCEL_RATE} Hz, {rate} Hz would repeat its samples "
+                         "(accel=False for the gyro only)")
+    plans = []
+    for dlpf_cfg, (accel_bandwidth, accel_delay, gyro_bandwidth, gyro_delay, gyro_rate) in RegisterMap.DLPF.items():
+        if gyro_rate < rate:
+            continue
+        divider = min(max(int(gyro_rate//rate) - 1, 0), 255)
+        if gyro_rate/(1 + divider) < rate:
+            divider -= 1
+        achieved = gyro_rate/(1 + divider)
+        plans.append(RatePlan(dlpf_cfg, divider, achieved, min(achieved, RegisterMap.ACCEL_RATE),
+                              accel_bandwidth, gyro_bandwidth, max(accel_delay, gyro_delay)))
+    if bandwidth is not None:
+        plans = [plan for plan in plans if min(plan.accel_bandwidth, plan.gyro_bandwidth) >= bandwidth]
+    if not plans:
+        raise ValueError(f"No DLPF setting reaches {rate} Hz" + (f" with {bandwidth} Hz of bandwidth" if bandwidth else ""))
+    if bandwidth is None:
+        # anti-aliasing: bandwidths below the Nyquist frequency of each plan
+        below = [plan for plan in plans if max(plan.accel_bandwidth, plan.gyro_bandwidth) <= plan.rate/2]
+        if below:
+            lowest = min(plan.rate for plan in below)
+            return max((plan for plan in below if plan.rate == lowest), key=lambda plan: plan.gyro_bandwidth)
+    lowest = min(plan.rate for plan in plans)
+    plans = [plan for plan in plans if plan.rate == lowest]
+    return min(plans, key=lambda plan: plan.gyro_bandwidth)
@@ -6,9 +6,15 @@ Created on Thu Feb 22 22:09:54 2024
 """
 
 # sensor.py
-from i2c import I2CInterface
-from register_map import RegisterMap
+from i2c import I2CInterface, BitField, pack
+from MPU6050.register_map import RegisterMap
+from MPU6050 import calibration
+from MPU6050.config import MPU6050Config, runs, rate_plan
+from HMC5883L.register_map import RegisterMap as HMCRegisterMap
+from timing import SampleClock
 import numpy as np
+import errno
+import time
 
 class MPU6050:
     """
@@ -30,6 +36,9 @@ class MPU6050:
         Last measurement of the accel i-axis.
     temp : float
         Last measurement of the temperature.
+    fifo_overflows : int
+        Number of FIFO overflows found by fifo_read, about a full FIFO of
+        frames is lost at each one.
         
     Methods
     -------
@@ -41,6 +50,18 @@ class MPU6050:
     
     modify_register:
         
+    field_get:
+        
+    field_set:
+        
+    fields_set:
+        
+    register_set:
+        
+    calibrate:
+        
+    calibration_load:
+        
     sample_rate_get:
         
     sample_rate_set:
@@ -49,6 +70,12 @@ class MPU6050:
     
     config_set:
         
+    output_rate_set:
+        
+    config_snapshot:
+        
+    config_apply:
+        
     gyro_config_get:
         
     gyro_config_set:
@@ -65,6 +92,12 @@ class MPU6050:
         
     reset:
         
+    signal_path_reset:
+        
+    first_sample_wait:
+        
+    bring_up:
+        
     cycle:
         
     temp_disable:
@@ -79,6 +112,30 @@ class MPU6050:
     
     read_accel:
         
+    read_raw:
+        
+    read_all:
+        
+    fifo_config_set:
+        
+    fifo_enable:
+        
+    fifo_disable:
+        
+    fifo_reset:
+        
+    fifo_count_get:
+        
+    fifo_read:
+        
+    fifo_read_timed:
+        
+    data_ready_interrupt_enable:
+        
+    data_ready_interrupt_disable:
+        
+    wait_sample:
+        
     selftest_gyro_i:
         
     selftest_gyro:
@@ -104,16 +161,56 @@ class MPU6050:
     standby_accel_off:
         
     mode_AOLP:
+        
+    register_get:
+        
+    shadow_load:
+        
+    shadow_invalidate:
+        
+    hold_changes:
+        
+    apply_changes:
+        
+    registers_write:
+        
+    aux_master_enable:
+        
+    aux_write:
+        
+    aux_read_set:
+        
+    aux_read_disable:
+        
+    aux_magnetometer_enable:
+        
+    read_raw_aux:
+        
+    sample_aux_get:
     """
-    def __init__(self, address, bus_number=1):
+    def __init__(self, address, bus_number=1, i2c=None):
         self.address = address
-        self.i2c = I2CInterface(bus_number)
+        self.i2c = I2CInterface(bus_number) if i2c is None else i2c
         self.sr = 0
         self.gyro = np.empty(3)
         self.accel = np.empty(3)
+        self.mag = np.empty(3)
         self.temp = 0
         self.gyro_fs = 0
         self.accel_fs = 0
+        self.fifo_channels = []
+        self.fifo_batch = np.empty((0, 0), dtype=np.int16)
+        self.int_read_clear = True
+        self.shadow = {}
+        self.dirty = set()
+        self.hold = 0
+        self.calibration = None
+        self.aux_columns = []
+        self.sample_clock = None
+        self.fifo_time = None
+        self.fifo_pending = 0
+        self.fifo_overflows = 0
+        self.mag_lsb = None
         self.DEBUG = False
         
     def read_measurement(self, register):
@@ -158,13 +255,9 @@ class MPU6050:
         """
         # Example: Read data from a specific register of the sensor
         data = self.i2c.read_byte(self.address, register)
-        data_bitstring = self.i2c.int_to_binary_string(data, 8)
-        
-        value = {
-            "int" : data,
-            "str" : data_bitstring
-            }
-        return value[output]
+        if output == "str":
+            return self.i2c.int_to_binary_string(data, 8)
+        return data
     
     def write_data(self, register, value):
         """
@@ -185,10 +278,14 @@ class MPU6050:
         """
         # Example: Read data from a specific register of the sensor
         self.i2c.write_byte(self.address, register, value)
+        if register in RegisterMap.SHADOW_REGISTERS:
+            self.shadow[register] = value & ~RegisterMap.SHADOW_REGISTERS[register]
+            self.dirty.discard(register)
         
     def modify_register(self, register, value, position):
         """
         Function to modify a bit or a group of contiguous bits in a register.
+        Wrapper of field_set for bit strings indexed from the MSB.
 
         Parameters
         ----------
@@ -204,17 +301,258 @@ class MPU6050:
         None.
 
         """
-        data = self.read_data(register)
-        bit_string = self.i2c.int_to_binary_string(data, 8)
-        new_string = self.i2c.modify_bit_string(bit_string, value, position)
-        new_data = self.i2c.binary_string_to_int(new_string)
+        offset = 8 - position - len(value)
+        if position < 0 or offset < 0:
+            raise ValueError(f"Invalid position {position} for a {len(value)} bit value")
+        self.field_set(BitField(register, offset, len(value)), int(value, 2))
+
+    def field_get(self, field):
+        """
+        Function to read the value of a register field.
+
+        Parameters
+        ----------
+        field : BitField
+            Field to read, see RegisterMap.
+
+        Returns
+        -------
+        int or str
+            Value of the field.
+
+        """
+        return field.decode(self.register_get(field.register))
+
+    def field_set(self, field, value):
+        """
+        Function to modify a register field.
+
+        Parameters
+        ----------
+        field : BitField
+            Field to modify, see RegisterMap.
+        value : int or str
+            New value of the field.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.fields_set({field : value})
+
+    def fields_set(self, values):
+        """
+        Function to modify several fields of the same register with a single
+        write. The current value is taken from the shadow copy, so only the
+        write goes on the bus (or nothing while the changes are held).
+
+        Parameters
+        ----------
+        values : dict
+            Mapping from BitField to the new value of the field.
+
+        Returns
+        -------
+        None.
+
+        """
+        register = next(iter(values)).register
+        data = self.register_get(register)
+        new_data = pack(values, data)
         if self.DEBUG:
-            print("Modifying register:", register, ":", bit_string, "->", new_string)
-        self.write_data(register, new_data)
+            print("Modifying register:", register, ":", f"{data:08b}", "->", f"{new_data:08b}")
+        self.register_set(register, new_data)
+
+    def register_set(self, register, value):
+        """
+        Function to write a register, or only its shadow copy while the
+        changes are held.
+
+        Parameters
+        ----------
+        register : hex
+            Address of the register.
+        value : int
+            New value of the register.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.hold and register in RegisterMap.SHADOW_REGISTERS:
+            if value != self.register_get(register):
+                self.shadow[register] = value
+                self.dirty.add(register)
+        else: self.write_data(register, value)
+
+    def register_get(self, register):
+        """
+        Function to get the value of a configuration register.
+        The shadow copy is used when available, otherwise the register is
+        red from the device and stored in the shadow copy.
+
+        Parameters
+        ----------
+        register : hex
+            Address of the register.
+
+        Returns
+        -------
+        int
+            Value of the register.
+
+        """
+        if register not in RegisterMap.SHADOW_REGISTERS:
+            return self.read_data(register)
+        if register not in self.shadow:
+            self.shadow[register] = self.read_data(register) & ~RegisterMap.SHADOW_REGISTERS[register]
+        return self.shadow[register]
+
+    def shadow_load(self):
+        """
+        Function to populate the shadow copy with the configuration registers
+        of the device.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.shadow_invalidate()
+        for register in RegisterMap.SHADOW_REGISTERS:
+            self.register_get(register)
+
+    def shadow_invalidate(self):
+        """
+        Function to discard the shadow copy and the pending changes.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.shadow = {}
+        self.dirty = set()
+
+    def hold_changes(self):
+        """
+        Function to hold the register modifications in the shadow copy until
+        apply_changes is called. Calls can be nested.
 
-    def calibrate(self):
-        # Example: Write calibration data to a specific register of the sensor
-        self.i2c.write_byte(self.address, RegisterMap.REGISTER_B, RegisterMap.REGISTER_B_VALUE_1)
+        Returns
+        -------
+        None.
+
+        """
+        self.hold += 1
+
+    def apply_changes(self):
+        """
+        Function to write the pending register modifications, each modified
+        register is written once, consecutive registers in one block write.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.hold = max(self.hold - 1, 0)
+        if self.hold:
+            return
+        self.registers_write({register : self.shadow[register] for register in self.dirty})
+
+    def registers_write(self, values):
+        """
+        Function to write several configuration registers with as few
+        transactions as possible: consecutive registers are written in one
+        block, and the unchanged registers between two written ones are
+        rewritten with their shadow value when that joins the blocks.
+
+        Parameters
+        ----------
+        values : dict
+            Mapping from register address to the new value.
+
+        Returns
+        -------
+        list
+            (first register, length) of the written blocks.
+
+        """
+        values = dict(values)
+        registers = sorted(values)
+        for low, high in zip(registers, registers[1:]):
+            gap = range(low + 1, high)
+            if all(register in self.shadow for register in gap):
+                values.update({register : self.shadow[register] for register in gap})
+        blocks = runs(values)
+        for first, length in blocks:
+            data = [values[register] for register in range(first, first + length)]
+            self.i2c.write_block(self.address, first, data)
+            for register, value in zip(range(first, first + length), data):
+                if register in RegisterMap.SHADOW_REGISTERS:
+                    self.shadow[register] = value & ~RegisterMap.SHADOW_REGISTERS[register]
+                    self.dirty.discard(register)
+        return blocks
+
+    def calibrate(self, samples=1000, store=None, fifo=True, up=2, rate=200):
+        """
+        Function to calibrate the gyro bias and the accel offset with the
+        device lying still, with one axis pointing up. The accel scale needs
+        the six orientations fit of calibration.calibrate_six_position.
+        The profile is applied to every following read.
+
+        Parameters
+        ----------
+        samples : int, optional
+            Number of samples. The default is 1000.
+        store : ProfileStore, optional
+            Store where the profile is saved. The default is None.
+        fifo : bool, optional
+            Collect the samples through the FIFO. The default is True.
+        up : int, optional
+            Axis pointing up. The default is 2 (z).
+        rate : float, optional
+            Sample rate in Hz during the acquisition, the configured one is
+            restored after. The default is 200, None keeps the configured one.
+
+        Returns
+        -------
+        CalibrationProfile
+            Profile of the device.
+
+        """
+        data = calibration.collect(self, samples, fifo, rate=rate)
+        profile = calibration.CalibrationProfile(
+            calibration.gyro_bias(data), calibration.accel_level(data, up), key=calibration.device_key(self))
+        self.calibration = profile
+        if store is not None:
+            store.save(profile)
+        return profile
+
+    def calibration_load(self, store):
+        """
+        Function to load the stored profile of the device, replacing the
+        calibration at start-up.
+
+        Parameters
+        ----------
+        store : ProfileStore
+            Store of the profiles.
+
+        Returns
+        -------
+        bool
+            True if a profile of the device was found.
+
+        """
+        profile = store.load(calibration.device_key(self))
+        if profile is None:
+            return False
+        self.calibration = profile
+        return True
         
     def sample_rate_get(self):
         """
@@ -224,22 +562,23 @@ class MPU6050:
 
         Returns
         -------
-        None.
+        float
+            Sample rate in kHz.
 
         """
         # read the register
-        divider = self.read_data(RegisterMap.SMPLRT_DIV)
+        divider = self.register_get(RegisterMap.SMPLRT_DIV)
         
         # calculate the sample rate
-        data = self.read_data(RegisterMap.CONFIG)
-        DLPF_CFG = self.i2c.int_to_binary_string(data, 8)[-3:]
-        DLPF = self.i2c.binary_string_to_int(DLPF_CFG)
+        DLPF = self.field_get(RegisterMap.DLPF_CFG)
         if DLPF == 0 or DLPF == 7:
             self.sr = 8/(1+divider)
         else: self.sr = 1/(1+divider)
                 
-        print("Present Configuration", self.i2c.int_to_binary_string(divider, 8))
-        print("Sample rate is", self.sr, "kHz")
+        if self.DEBUG:
+            print("Present Configuration", f"{divider:08b}")
+            print("Sample rate is", self.sr, "kHz")
+        return self.sr
         
     def sample_rate_set(self, divider):
         """
@@ -258,21 +597,16 @@ class MPU6050:
 
         """
         # calculate the sample rate
-        data = self.read_data(RegisterMap.CONFIG)
-        DLPF_CFG = self.i2c.int_to_binary_string(data, 8)[-3:]
-        DLPF = self.i2c.binary_string_to_int(DLPF_CFG)
+        DLPF = self.field_get(RegisterMap.DLPF_CFG)
         if DLPF == 0 or DLPF == 7:
             self.sr = 8/(1+divider)
         else: self.sr = 1/(1+divider)
                 
-        # calculate the new value
-        divider_bits = self.i2c.int_to_binary_string(divider, 8)
-        self.write_data(RegisterMap.SMPLRT_DIV, divider)
-        print("New Configuration", divider_bits)
-        print("Sample rate is", self.sr, "kHz")
-        
         # write in the register
-        self.write_data(RegisterMap.SMPLRT_DIV, divider)
+        self.register_set(RegisterMap.SMPLRT_DIV, divider)
+        if self.DEBUG:
+            print("New Configuration", f"{divider:08b}")
+            print("Sample rate is", self.sr, "kHz")
 
     def config_get(self):
         """
@@ -282,42 +616,73 @@ class MPU6050:
         
         Returns
         -------
-        None.
+        EXT_SYNC_SET : int
+            FSYNC pin sampling.
+        DLPF_CFG : int
+            DLPF setting.
 
         """
         # read the register
-        data = self.read_data(RegisterMap.CONFIG)
-        print("Present Configuration", self.i2c.int_to_binary_string(data, 8))
+        data = self.register_get(RegisterMap.CONFIG)
+        if self.DEBUG:
+            print("Present Configuration", self.i2c.int_to_binary_string(data, 8))
+        return RegisterMap.EXT_SYNC_SET.decode(data), RegisterMap.DLPF_CFG.decode(data)
         
     def config_set(self, DLPF_CFG, EXT_SYNC_SET=0):
         """
-        Getter function for the external Frame Synchronization (FSYNC) pin sampling and the Digital
+        Setter function for the external Frame Synchronization (FSYNC) pin sampling and the Digital
         Low Pass Filter (DLPF) setting for both the gyroscopes and accelerometers.
         See register 26 for more information.
+        The DLPF changes the gyroscope output rate, so the sample rate is updated.
         
         Parameters
         ----------
-        EXT_SYNC_SET: int [0:8] 
-            to be implemented
         DLPF_CFG: int [0:8] 
-            See register 26 for more information.
+            See register 26 for more information, see also output_rate_set.
+        EXT_SYNC_SET: int [0:8], optional
+            Data bit latching the FSYNC pin, 0 disables it. The default is 0.
 
         Returns
         -------
         None.
 
         """
-        # read the register
-        data = self.read_data(RegisterMap.CONFIG)
-        print("Present Configuration", self.i2c.int_to_binary_string(data, 8))
-        
-        # calculate the new value
-        value = self.i2c.int_to_binary_string(EXT_SYNC_SET, 3) + self.i2c.int_to_binary_string(DLPF_CFG, 3) 
-        new_bitstring = self.modify_register(RegisterMap.CONFIG, value, 2)
-        print("New Configuration", new_bitstring)
-        
-        # write in the register
-        self.write_data(RegisterMap.CONFIG, self.i2c.binary_string_to_int(new_bitstring))
+        self.fields_set({RegisterMap.EXT_SYNC_SET : EXT_SYNC_SET, RegisterMap.DLPF_CFG : DLPF_CFG})
+        self.sample_rate_get()
+
+    def output_rate_set(self, rate, bandwidth=None, accel=True):
+        """
+        Function to program the DLPF and the sample rate divider for a target
+        output rate, see config.rate_plan, with a single block write.
+        The lowest rate and bandwidth meeting the target keep the bus load and
+        the data to process to the minimum.
+
+        Parameters
+        ----------
+        rate : float
+            Target sample rate in Hz, the achieved rate is not lower.
+        bandwidth : float, optional
+            Minimum bandwidth of accel and gyro in Hz. The default is None,
+            the widest bandwidth below half the achieved rate.
+        accel : bool, optional
+            The accel samples are used, rates above 1 kHz are rejected.
+            The default is True.
+
+        Returns
+        -------
+        RatePlan
+            The achieved rate, bandwidths and filter delay.
+
+        """
+        plan = rate_plan(rate, bandwidth, accel)
+        self.hold_changes()
+        self.register_set(RegisterMap.SMPLRT_DIV, plan.smplrt_div)
+        self.field_set(RegisterMap.DLPF_CFG, plan.dlpf_cfg)
+        self.apply_changes()
+        self.sr = plan.rate/1000
+        if self.DEBUG:
+            print("Sample rate is", plan.rate, "Hz, bandwidth", plan.gyro_bandwidth, "Hz, delay", plan.delay, "ms")
+        return plan
         
     def gyro_config_get(self):
         """
@@ -326,19 +691,21 @@ class MPU6050:
 
         Returns
         -------
-        None.
+        tuple
+            XG_ST, YG_ST, ZG_ST and FS_SEL.
 
         """
-        data = self.read_data(RegisterMap.GYRO_CONFIG)
-        bit_string = self.i2c.int_to_binary_string(data, 8)
-        XG_ST = bit_string[0]
-        YG_ST = bit_string[1]
-        ZG_ST = bit_string[2]
-        FS_SEL = self.i2c.binary_string_to_int(bit_string[3:5])
+        data = self.register_get(RegisterMap.GYRO_CONFIG)
+        XG_ST = RegisterMap.XG_ST.decode(data)
+        YG_ST = RegisterMap.YG_ST.decode(data)
+        ZG_ST = RegisterMap.ZG_ST.decode(data)
+        FS_SEL = RegisterMap.FS_SEL.decode(data)
         self.gyro_fs = RegisterMap.GYRO_LSB[FS_SEL]
         
-        print("Self-Test activated on axis (x, y, z)", XG_ST, YG_ST, ZG_ST)
-        print("Gyro full scale range +/-", 250*2**FS_SEL, "º/s")
+        if self.DEBUG:
+            print("Self-Test activated on axis (x, y, z)", XG_ST, YG_ST, ZG_ST)
+            print("Gyro full scale range +/-", 250*2**FS_SEL, "º/s")
+        return XG_ST, YG_ST, ZG_ST, FS_SEL
         
     def gyro_config_set(self, XG_ST, YG_ST, ZG_ST, FS_SEL):
         """
@@ -361,12 +728,17 @@ class MPU6050:
         None.
 
         """
-        bit_string = str(XG_ST) + str(YG_ST) + str(ZG_ST) + self.i2c.int_to_binary_string(FS_SEL, 2) + "000"
-        self.write_data(RegisterMap.GYRO_CONFIG, self.i2c.binary_string_to_int(bit_string))
+        data = pack({
+            RegisterMap.XG_ST : XG_ST,
+            RegisterMap.YG_ST : YG_ST,
+            RegisterMap.ZG_ST : ZG_ST,
+            RegisterMap.FS_SEL : FS_SEL})
+        self.write_data(RegisterMap.GYRO_CONFIG, data)
         self.gyro_fs = RegisterMap.GYRO_LSB[FS_SEL]
         
-        print("Activation of Self-Test on axis (x, y, z)", XG_ST, YG_ST, ZG_ST)
-        print("Setting the Gyro full scale range +/-", 250*2**FS_SEL, "º/s")
+        if self.DEBUG:
+            print("Activation of Self-Test on axis (x, y, z)", XG_ST, YG_ST, ZG_ST)
+            print("Setting the Gyro full scale range +/-", 250*2**FS_SEL, "º/s")
 
     def accel_config_get(self):
         """
@@ -376,19 +748,21 @@ class MPU6050:
 
         Returns
         -------
-        None.
+        tuple
+            XA_ST, YA_ST, ZA_ST and AFS_SEL.
 
         """
-        data = self.read_data(RegisterMap.ACCEL_CONFIG)
-        bit_string = self.i2c.int_to_binary_string(data, 8)
-        XA_ST = bit_string[0]
-        YA_ST = bit_string[1]
-        ZA_ST = bit_string[2]
-        AFS_SEL = self.i2c.binary_string_to_int(bit_string[3:5])
+        data = self.register_get(RegisterMap.ACCEL_CONFIG)
+        XA_ST = RegisterMap.XA_ST.decode(data)
+        YA_ST = RegisterMap.YA_ST.decode(data)
+        ZA_ST = RegisterMap.ZA_ST.decode(data)
+        AFS_SEL = RegisterMap.AFS_SEL.decode(data)
         self.accel_fs = RegisterMap.ACCEL_LSB[AFS_SEL]
         
-        print("Self-Test activated on axis (x, y, z)", XA_ST, YA_ST, ZA_ST)
-        print("Accel full scale range +/-", 2**(AFS_SEL+1), "g")
+        if self.DEBUG:
+            print("Self-Test activated on axis (x, y, z)", XA_ST, YA_ST, ZA_ST)
+            print("Accel full scale range +/-", 2**(AFS_SEL+1), "g")
+        return XA_ST, YA_ST, ZA_ST, AFS_SEL
         
     def accel_config_set(self, XA_ST, YA_ST, ZA_ST, AFS_SEL):
         """
@@ -412,12 +786,92 @@ class MPU6050:
         None.
 
         """
-        bit_string = str(XA_ST) + str(YA_ST) + str(ZA_ST) + self.i2c.int_to_binary_string(AFS_SEL, 2) + "000"
-        self.write_data(RegisterMap.ACCEL_CONFIG, self.i2c.binary_string_to_int(bit_string))
+        data = pack({
+            RegisterMap.XA_ST : XA_ST,
+            RegisterMap.YA_ST : YA_ST,
+            RegisterMap.ZA_ST : ZA_ST,
+            RegisterMap.AFS_SEL : AFS_SEL})
+        self.write_data(RegisterMap.ACCEL_CONFIG, data)
         self.accel_fs = RegisterMap.ACCEL_LSB[AFS_SEL]
         
-        print("Activation of Self-Test on Accel axis (x, y, z)", XA_ST, YA_ST, ZA_ST)
-        print("Setting the Accel full scale range +/-", 2**(AFS_SEL+1), "g")
+        if self.DEBUG:
+            print("Activation of Self-Test on Accel axis (x, y, z)", XA_ST, YA_ST, ZA_ST)
+            print("Setting the Accel full scale range +/-", 2**(AFS_SEL+1), "g")
+
+    def config_snapshot(self):
+        """
+        Function to read the configuration registers of the device with one
+        block read per run of consecutive registers (SMPLRT_DIV..ACCEL_CONFIG,
+        FIFO_EN..I2C_SLV0_CTRL, INT_PIN_CFG..INT_ENABLE, I2C_MST_DELAY_CTRL,
+        USER_CTRL..PWR_MGMT_2).
+        The shadow copy, the sample rate and the full scale ranges are
+        updated, pending changes are discarded.
+
+        Returns
+        -------
+        MPU6050Config
+            Configuration of the device.
+
+        """
+        values = {}
+        for first, length in runs(RegisterMap.SHADOW_REGISTERS):
+            data = self.i2c.read_block(self.address, first, length)
+            values.update(zip(range(first, first + length), data))
+        config = MPU6050Config.from_registers(values)
+        self.shadow = config.registers()
+        self.dirty = set()
+        self.config_track(config)
+        return config
+
+    def config_apply(self, config, verify=False):
+        """
+        Function to bring the device to a configuration writing only the
+        registers that differ from the shadow copy (read with config_snapshot
+        if incomplete), consecutive registers in one block write.
+        While the changes are held the registers are written by apply_changes.
+
+        Parameters
+        ----------
+        config : MPU6050Config
+            Configuration to apply, e.g. a modified config_snapshot.
+        verify : bool, optional
+            Read back the written registers. The default is False.
+
+        Raises
+        ------
+        OSError
+            EIO if a register read back differs from the written value.
+
+        Returns
+        -------
+        None.
+
+        """
+        if len(self.shadow) < len(RegisterMap.SHADOW_REGISTERS):
+            self.config_snapshot()
+        self.hold_changes()
+        for register, value in config.registers().items():
+            self.register_set(register, value)
+        held = self.hold > 1
+        blocks = [] if held else runs(self.dirty)
+        self.apply_changes()
+        self.config_track(config)
+        if not verify or held:
+            return
+        for first, length in blocks:
+            data = self.i2c.read_block(self.address, first, length)
+            for register, value in zip(range(first, first + length), data):
+                value &= ~RegisterMap.SHADOW_REGISTERS[register]
+                written = self.shadow[register]
+                if value != written:
+                    self.shadow_invalidate()
+                    raise OSError(errno.EIO, f"Register {register:#04x} reads {value:#04x}, written {written:#04x}")
+
+    def config_track(self, config):
+        # sample rate and full scale ranges used to scale the samples
+        self.sr = config.sample_rate/1000
+        self.gyro_fs = RegisterMap.GYRO_LSB[config.fs_sel]
+        self.accel_fs = RegisterMap.ACCEL_LSB[config.afs_sel]
         
     def who_am_i(self):
         """
@@ -426,27 +880,30 @@ class MPU6050:
 
         Returns
         -------
-        None.
+        bool
+            True if the device is a MPU6050.
 
         """
         data = self.read_data(RegisterMap.WHO_AM_I)
-        bit_string = self.i2c.int_to_binary_string(data, 8)
-        new_value = hex(self.i2c.binary_string_to_int(bit_string))
-        if new_value == '0x68':
-            print("I'm a MPU-6050!")
-        else: print("I'm not a MPU-6050 :(, my name is", new_value)
+        if self.DEBUG:
+            if data == 0x68:
+                print("I'm a MPU-6050!")
+            else: print("I'm not a MPU-6050 :(, my name is", hex(data))
+        return data == 0x68
         
     def wakeup(self):
         """
-        Function to wake up the MPU6050.
+        Function to wake up the MPU6050, clearing SLEEP only: the clock
+        source is unchanged (bring_up selects the PLL).
 
         Returns
         -------
         None.
 
         """
-        print("MPU6050 is ON")
-        self.modify_register(RegisterMap.PWR_MGMT_1, "0", 1)
+        if self.DEBUG:
+            print("MPU6050 is ON")
+        self.field_set(RegisterMap.SLEEP, 0)
         
     def sleep(self):
         """
@@ -457,18 +914,152 @@ class MPU6050:
         None.
 
         """
-        self.modify_register(RegisterMap.PWR_MGMT_1, "1", 1)
+        self.field_set(RegisterMap.SLEEP, 1)
         
-    def reset(self):
+    def reset(self, timeout=0.1, interval=0.001):
+        """
+        Function to reset the MPU6050 and wait for the DEVICE_RESET bit to
+        clear itself. All the registers go back to their default value,
+        which become the shadow copy.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Maximum waiting time in seconds, None to return without waiting.
+            The default is 0.1.
+        interval : float, optional
+            Time between two polls in seconds. The default is 0.001.
+
+        Raises
+        ------
+        OSError
+            ETIMEDOUT if the reset does not complete in time.
+
+        Returns
+        -------
+        None.
+
         """
-        Function to reset the MPU6050.
+        self.write_data(RegisterMap.PWR_MGMT_1, RegisterMap.DEVICE_RESET.mask)
+        self.shadow = MPU6050Config().registers()
+        self.dirty = set()
+        if self.sample_clock is not None:
+            self.sample_clock.reset()
+        if timeout is None:
+            return
+        end = time.monotonic() + timeout
+        while True:
+            try:
+                if not self.read_data(RegisterMap.PWR_MGMT_1) & RegisterMap.DEVICE_RESET.mask:
+                    return
+            except OSError:
+                # the device may not acknowledge while resetting
+                pass
+            if time.monotonic() > end:
+                raise OSError(errno.ETIMEDOUT, "MPU6050 reset timed out")
+            time.sleep(interval)
+
+    def signal_path_reset(self):
+        """
+        Function to reset the analog and digital signal paths of gyro, accel
+        and temperature sensors, clearing their data registers.
 
         Returns
         -------
         None.
 
         """
-        self.modify_register(RegisterMap.PWR_MGMT_1, "1", 0)
+        self.write_data(RegisterMap.SIGNAL_PATH_RESET, pack({
+            RegisterMap.GYRO_RESET : 1,
+            RegisterMap.ACCEL_RESET : 1,
+            RegisterMap.TEMP_RESET : 1}))
+
+    def first_sample_wait(self, timeout=0.2, interval=0.001):
+        """
+        Function to wait for the first sample after a reset, polling the data
+        registers with burst reads until they are no longer cleared.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Maximum waiting time in seconds. The default is 0.2.
+        interval : float, optional
+            Time between two polls in seconds. The default is 0.001.
+
+        Raises
+        ------
+        OSError
+            ETIMEDOUT if no sample is produced in time.
+
+        Returns
+        -------
+        numpy.ndarray
+            Raw int16 values of the sample, see read_raw.
+
+        """
+        end = time.monotonic() + timeout
+        while True:
+            raw = self.read_raw()
+            if raw.any():
+                return raw
+            if time.monotonic() > end:
+                raise OSError(errno.ETIMEDOUT, "MPU6050 produced no sample")
+            time.sleep(interval)
+
+    def bring_up(self, config=None, clock=RegisterMap.CLOCK_PLL, verify=False, timeout=0.2, interval=0.001):
+        """
+        Function to bring the MPU6050 from any state to a known configuration:
+        device reset (polled until complete), signal path reset, configuration
+        applied in bulk with the device awake on the given clock, wait for
+        the first sample.
+        Since the registers after the reset are known, the configuration
+        costs only the block writes of the registers that differ from the
+        defaults.
+
+        Parameters
+        ----------
+        config : MPU6050Config, optional
+            Configuration to apply, SLEEP and CLKSEL are overridden.
+            The default is None (reset values).
+        clock : int [0:8], optional
+            CLKSEL. The default is RegisterMap.CLOCK_PLL.
+        verify : bool, optional
+            Read back the written registers. The default is False.
+        timeout : float, optional
+            Maximum waiting time of the reset and of the first sample, in
+            seconds. The default is 0.2.
+        interval : float, optional
+            Time between two polls in seconds. The default is 0.001.
+
+        Raises
+        ------
+        OSError
+            ETIMEDOUT if the reset or the first sample does not come in time,
+            EIO if the verification fails.
+
+        Returns
+        -------
+        dict
+            Durations in ms of the reset ("reset_ms"), of the configuration
+            ("config_ms"), from the wake up to the first sample
+            ("first_sample_ms") and of the whole bring-up ("total_ms").
+
+        """
+        start = time.monotonic_ns()
+        self.reset(timeout, interval)
+        self.signal_path_reset()
+        reset_done = time.monotonic_ns()
+        config = MPU6050Config() if config is None else config
+        config = config.with_fields({RegisterMap.SLEEP : 0, RegisterMap.CYCLE : 0, RegisterMap.CLKSEL : clock})
+        self.config_apply(config, verify)
+        configured = time.monotonic_ns()
+        self.read_all(self.first_sample_wait(timeout, interval))
+        sampled = time.monotonic_ns()
+        return {
+            "reset_ms" : (reset_done - start)/1e6,
+            "config_ms" : (configured - reset_done)/1e6,
+            "first_sample_ms" : (sampled - configured)/1e6,
+            "total_ms" : (sampled - start)/1e6}
 
     def cycle_enable(self, LP_WAKE_CTRL=0):
         """
@@ -484,9 +1075,10 @@ class MPU6050:
         None.
 
         """
-        self.modify_register(RegisterMap.PWR_MGMT_1, "1", 2)
-        data = self.i2c.int_to_binary_string(LP_WAKE_CTRL, 2)
-        self.modify_register(RegisterMap.PWR_MGMT_2, data, 0)
+        self.hold_changes()
+        self.field_set(RegisterMap.CYCLE, 1)
+        self.field_set(RegisterMap.LP_WAKE_CTRL, LP_WAKE_CTRL)
+        self.apply_changes()
         
     def temp_disable(self):
         """
@@ -497,8 +1089,9 @@ class MPU6050:
         None.
 
         """
-        self.modify_register(RegisterMap.PWR_MGMT_1, "1", 4)
-        print("Temperature Sensor disabled")
+        self.field_set(RegisterMap.TEMP_DIS, 1)
+        if self.DEBUG:
+            print("Temperature Sensor disabled")
         
     def temp_enable(self):
         """
@@ -509,8 +1102,9 @@ class MPU6050:
         None.
 
         """
-        self.modify_register(RegisterMap.PWR_MGMT_1, "0", 4)
-        print("Temperature Sensor enabled")
+        self.field_set(RegisterMap.TEMP_DIS, 0)
+        if self.DEBUG:
+            print("Temperature Sensor enabled")
     
     def standby_accel_x_on(self):
         """
@@ -521,7 +1115,7 @@ class MPU6050:
         None.
 
         """
-        self.modify_register(RegisterMap.PWR_MGMT_2, "1", 2)
+        self.field_set(RegisterMap.STBY_XA, 1)
         
     def standby_accel_y_on(self):
         """
@@ -532,7 +1126,7 @@ class MPU6050:
         None.
 
         """
-        self.modify_register(RegisterMap.PWR_MGMT_2, "1", 3)
+        self.field_set(RegisterMap.STBY_YA, 1)
  
     def standby_accel_z_on(self):
         """
@@ -543,7 +1137,7 @@ class MPU6050:
         None.
 
         """
-        self.modify_register(RegisterMap.PWR_MGMT_2, "1", 4)
+        self.field_set(RegisterMap.STBY_ZA, 1)
         
     def standby_accel_on(self):
         """
@@ -554,9 +1148,11 @@ class MPU6050:
         None.
 
         """
+        self.hold_changes()
         self.standby_accel_x_on()
         self.standby_accel_y_on()
         self.standby_accel_z_on()
+        self.apply_changes()
     
     def standby_accel_x_off(self):
         """
@@ -567,7 +1163,7 @@ class MPU6050:
         None.
 
         """
-        self.modify_register(RegisterMap.PWR_MGMT_2, "0", 2)
+        self.field_set(RegisterMap.STBY_XA, 0)
         
     def standby_accel_y_off(self):
         """
@@ -578,7 +1174,7 @@ class MPU6050:
         None.
 
         """
-        self.modify_register(RegisterMap.PWR_MGMT_2, "0", 3)
+        self.field_set(RegisterMap.STBY_YA, 0)
  
     def standby_accel_z_off(self):
         """
@@ -589,7 +1185,7 @@ class MPU6050:
         None.
 
         """
-        self.modify_register(RegisterMap.PWR_MGMT_2, "0", 4)
+        self.field_set(RegisterMap.STBY_ZA, 0)
         
     def standby_accel_off(self):
         """
@@ -600,9 +1196,11 @@ class MPU6050:
         None.
 
         """
+        self.hold_changes()
         self.standby_accel_x_off()
         self.standby_accel_y_off()
         self.standby_accel_z_off()
+        self.apply_changes()
         
     def standby_gyro_x_on(self):
         """
@@ -613,7 +1211,7 @@ class MPU6050:
         None.
 
         """
-        self.modify_register(RegisterMap.PWR_MGMT_2, "1", 5)
+        self.field_set(RegisterMap.STBY_XG, 1)
         
     def standby_gyro_y_on(self):
         """
@@ -624,7 +1222,7 @@ class MPU6050:
         None.
 
         """
-        self.modify_register(RegisterMap.PWR_MGMT_2, "1", 6)
+        self.field_set(RegisterMap.STBY_YG, 1)
  
     def standby_gyro_z_on(self):
         """
@@ -635,7 +1233,7 @@ class MPU6050:
         None.
 
         """
-        self.modify_register(RegisterMap.PWR_MGMT_2, "1", 7)
+        self.field_set(RegisterMap.STBY_ZG, 1)
         
     def standby_gyro_on(self):
         """
@@ -646,9 +1244,11 @@ class MPU6050:
         None.
 
         """
+        self.hold_changes()
         self.standby_gyro_x_on()
         self.standby_gyro_y_on()
         self.standby_gyro_z_on()
+        self.apply_changes()
     
     def standby_gyro_x_off(self):
         """
@@ -659,7 +1259,7 @@ class MPU6050:
         None.
 
         """
-        self.modify_register(RegisterMap.PWR_MGMT_2, "0", 5)
+        self.field_set(RegisterMap.STBY_XG, 0)
         
     def standby_gyro_y_off(self):
         """
@@ -670,7 +1270,7 @@ class MPU6050:
         None.
 
         """
-        self.modify_register(RegisterMap.PWR_MGMT_2, "0", 6)
+        self.field_set(RegisterMap.STBY_YG, 0)
  
     def standby_gyro_z_off(self):
         """
@@ -681,7 +1281,7 @@ class MPU6050:
         None.
 
         """
-        self.modify_register(RegisterMap.PWR_MGMT_2, "0", 7)
+        self.field_set(RegisterMap.STBY_ZG, 0)
         
     def standby_gyro_off(self):
         """
@@ -692,13 +1292,16 @@ class MPU6050:
         None.
 
         """
+        self.hold_changes()
         self.standby_gyro_x_off()
         self.standby_gyro_y_off()
         self.standby_gyro_z_off()
+        self.apply_changes()
         
     def mode_AOLP(self):
         """
-        Function to put the MPU6050 in the Accelerometer Only Low Power mode.
+        Function to put the MPU6050 in the Accelerometer Only Low Power mode,
+        on the internal oscillator since the gyros are in standby.
         See register 108 for more information.
 
         Returns
@@ -706,10 +1309,13 @@ class MPU6050:
         None.
 
         """
+        self.hold_changes()
         self.cycle_enable()
         self.wakeup()
+        self.field_set(RegisterMap.CLKSEL, RegisterMap.CLOCK_INTERNAL)
         self.temp_disable()
         self.standby_gyro_on()
+        self.apply_changes()
         
     def read_gyro_x(self):
         """
@@ -820,6 +1426,44 @@ class MPU6050:
         self.read_accel_x()
         self.read_accel_y()
         self.read_accel_z()
+
+    def read_raw(self):
+        """
+        Function to read accel, temperature and gyro in a single block read.
+        The 14 bytes from ACCEL_XOUT_H to GYRO_ZOUT_L are transferred in one
+        I2C transaction, so all the axis belong to the same sample.
+
+        Returns
+        -------
+        numpy.ndarray
+            Raw int16 values (accel x, y, z, temp, gyro x, y, z).
+
+        """
+        data = self.i2c.read_block(self.address, RegisterMap.ACCEL_XOUT_H, RegisterMap.MOTION_LENGTH)
+        return np.frombuffer(data, dtype=">i2")
+
+    def read_all(self, raw=None):
+        """
+        Function to read accel, temperature and gyro with one burst read.
+
+        Parameters
+        ----------
+        raw : numpy.ndarray, optional
+            Raw sample already red (see read_raw). The default is None.
+
+        Returns
+        -------
+        None.
+
+        """
+        if raw is None:
+            raw = self.read_raw()
+        self.accel[:] = raw[0:3]/self.accel_fs
+        self.temp = raw[3]/340 + 36.53
+        self.gyro[:] = raw[4:7]/self.gyro_fs
+        if self.calibration is not None:
+            self.accel[:] = (self.accel - self.calibration.accel_offset)/self.calibration.accel_scale
+            self.gyro -= self.calibration.gyro_bias
         
     def selftest_gyro_x(self):
         """
@@ -841,8 +1485,7 @@ class MPU6050:
         
         STR = gyro_selftest_enabled - gyro_selftest_disabled
         
-        data = self.read_data(RegisterMap.SELF_TEST_X)
-        XG_TEST = self.i2c.binary_string_to_int(self.i2c.int_to_binary_string(data, 8)[3:])
+        XG_TEST = RegisterMap.XG_TEST.decode(self.read_data(RegisterMap.SELF_TEST_X))
         if XG_TEST == 0:
             FT = 0 
         else: FT = 25 * 131 * 1.046**(XG_TEST-1)
@@ -872,8 +1515,7 @@ class MPU6050:
         
         STR = gyro_selftest_enabled - gyro_selftest_disabled
         
-        data = self.read_data(RegisterMap.SELF_TEST_Y)
-        YG_TEST = self.i2c.binary_string_to_int(self.i2c.int_to_binary_string(data, 8)[3:])
+        YG_TEST = RegisterMap.YG_TEST.decode(self.read_data(RegisterMap.SELF_TEST_Y))
         if YG_TEST == 0:
             FT = 0 
         else: FT = - 25 * 131 * 1.046**(YG_TEST-1)
@@ -903,8 +1545,7 @@ class MPU6050:
         
         STR = gyro_selftest_enabled - gyro_selftest_disabled
         
-        data = self.read_data(RegisterMap.SELF_TEST_Z)
-        ZG_TEST = self.i2c.binary_string_to_int(self.i2c.int_to_binary_string(data, 8)[3:])
+        ZG_TEST = RegisterMap.ZG_TEST.decode(self.read_data(RegisterMap.SELF_TEST_Z))
         if ZG_TEST == 0:
             FT = 0 
         else: FT = - 25 * 131 * 1.046**(ZG_TEST-1)
@@ -948,10 +1589,8 @@ class MPU6050:
         
         STR = accel_selftest_enabled - accel_selftest_disabled
         
-        data = self.read_data(RegisterMap.SELF_TEST_X)
-        high_bits = self.i2c.binary_string_to_int(self.i2c.int_to_binary_string(data, 8)[:3])
-        data = self.read_data(RegisterMap.SELF_TEST_A)
-        low_bits = self.i2c.binary_string_to_int(self.i2c.int_to_binary_string(data, 8)[2:4])
+        high_bits = RegisterMap.XA_TEST_H.decode(self.read_data(RegisterMap.SELF_TEST_X))
+        low_bits = RegisterMap.XA_TEST_L.decode(self.read_data(RegisterMap.SELF_TEST_A))
         
         XA_TEST = self.i2c.combine_bits(high_bits, low_bits, num_bits=2)
         if XA_TEST == 0:
@@ -983,10 +1622,8 @@ class MPU6050:
         
         STR = accel_selftest_enabled - accel_selftest_disabled
         
-        data = self.read_data(RegisterMap.SELF_TEST_Y)
-        high_bits = self.i2c.binary_string_to_int(self.i2c.int_to_binary_string(data, 8)[:3])
-        data = self.read_data(RegisterMap.SELF_TEST_A)
-        low_bits = self.i2c.binary_string_to_int(self.i2c.int_to_binary_string(data, 8)[2:4])
+        high_bits = RegisterMap.YA_TEST_H.decode(self.read_data(RegisterMap.SELF_TEST_Y))
+        low_bits = RegisterMap.YA_TEST_L.decode(self.read_data(RegisterMap.SELF_TEST_A))
         
         YA_TEST = self.i2c.combine_bits(high_bits, low_bits, num_bits=2)
         if YA_TEST == 0:
@@ -1018,10 +1655,8 @@ class MPU6050:
         
         STR = accel_selftest_enabled - accel_selftest_disabled
         
-        data = self.read_data(RegisterMap.SELF_TEST_Z)
-        high_bits = self.i2c.binary_string_to_int(self.i2c.int_to_binary_string(data, 8)[:3])
-        data = self.read_data(RegisterMap.SELF_TEST_A)
-        low_bits = self.i2c.binary_string_to_int(self.i2c.int_to_binary_string(data, 8)[2:4])
+        high_bits = RegisterMap.ZA_TEST_H.decode(self.read_data(RegisterMap.SELF_TEST_Z))
+        low_bits = RegisterMap.ZA_TEST_L.decode(self.read_data(RegisterMap.SELF_TEST_A))
         
         ZA_TEST = self.i2c.combine_bits(high_bits, low_bits, num_bits=2)
         if ZA_TEST == 0:
@@ -1048,6 +1683,293 @@ class MPU6050:
         self.selftest_accel_y()
         self.selftest_accel_z()
        
+    def fifo_config_set(self, accel=True, gyro=True, temp=False, slv0=False):
+        """
+        Function to select the measurements written in the FIFO buffer.
+        See register 35 for more information.
+        A batch able to hold a full FIFO is preallocated for fifo_read.
+
+        Parameters
+        ----------
+        accel : bool, optional
+            Write the 3 accel axis in the FIFO. The default is True.
+        gyro : bool, optional
+            Write the 3 gyro axis in the FIFO. The default is True.
+        temp : bool, optional
+            Write the temperature in the FIFO. The default is False.
+        slv0 : bool, optional
+            Write the data of the auxiliary slave 0 (see aux_read_set) in the
+            FIFO. The default is False.
+
+        Returns
+        -------
+        None.
+
+        """
+        if slv0 and not self.aux_columns:
+            raise ValueError("Slave 0 is not configured, see aux_read_set")
+        enabled = {
+            "accel" : accel,
+            "temp" : temp,
+            "gyro_x" : gyro,
+            "gyro_y" : gyro,
+            "gyro_z" : gyro,
+            "slv0" : slv0}
+        
+        data = 0
+        self.fifo_channels = []
+        for name, (bit, columns) in RegisterMap.FIFO_CHANNELS.items():
+            if enabled[name]:
+                data |= bit
+                self.fifo_channels += columns if name != "slv0" else self.aux_columns
+        self.write_data(RegisterMap.FIFO_EN, data)
+        
+        frames = RegisterMap.FIFO_SIZE // max(2*len(self.fifo_channels), 1)
+        self.fifo_batch = np.empty((frames, len(self.fifo_channels)), dtype=np.int16)
+        if self.DEBUG:
+            print("FIFO channels:", self.fifo_channels)
+
+    def fifo_enable(self):
+        """
+        Function to reset and enable the FIFO buffer.
+        See register 106 for more information.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.field_set(RegisterMap.USER_FIFO_EN, 1)
+        self.fifo_reset()
+        
+    def fifo_disable(self):
+        """
+        Function to disable the FIFO buffer.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.field_set(RegisterMap.USER_FIFO_EN, 0)
+        
+    def fifo_reset(self):
+        """
+        Function to empty the FIFO buffer.
+        The FIFO_RESET bit clears itself once the buffer is reset.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.field_set(RegisterMap.FIFO_RESET, 1)
+        if self.sample_clock is not None:
+            self.sample_clock.reset()
+
+    def fifo_count_get(self):
+        """
+        Function to read the number of bytes stored in the FIFO buffer.
+        FIFO_COUNTH and FIFO_COUNTL are red in a single block read.
+
+        Returns
+        -------
+        int
+            Number of bytes in the FIFO.
+
+        """
+        data = self.i2c.read_block(self.address, RegisterMap.FIFO_COUNTH, 2)
+        return (data[0] << 8) | data[1]
+
+    def fifo_scale(self, batch, channels=None):
+        """
+        Function to convert a batch of raw FIFO frames in physical units
+        (g, ºC, º/s and mGa for the magnetometer of aux_magnetometer_enable,
+        other auxiliary data is left raw). The calibration profile, if any, is folded in the
+        scale and offset, so the conversion stays a single multiply-add.
+
+        Parameters
+        ----------
+        batch : numpy.ndarray
+            Raw int16 frames (N x channels).
+        channels : list, optional
+            Names of the columns of the batch, e.g. RegisterMap.MOTION_COLUMNS
+            for the frames of read_raw. The default is the FIFO channels.
+
+        Returns
+        -------
+        numpy.ndarray
+            Scaled float frames (N x channels).
+
+        """
+        if channels is None:
+            channels = self.fifo_channels
+        scale = np.empty(len(channels))
+        offset = np.zeros(len(channels))
+        for i, name in enumerate(channels):
+            if name.startswith("accel"):
+                scale[i] = 1/self.accel_fs
+            elif name.startswith("gyro"):
+                scale[i] = 1/self.gyro_fs
+            elif name == "temp":
+                scale[i] = 1/340
+                offset[i] = 36.53
+            elif name.startswith("mag") and self.mag_lsb:
+                scale[i] = 1000/self.mag_lsb
+            else:
+                scale[i] = 1
+        if self.calibration is not None:
+            self.calibration.adjust(channels, scale, offset)
+        data = batch*scale + offset
+        # magnetometer axis in overflow, as HMC5883L.read_high_rate
+        mag = [i for i, name in enumerate(channels) if name.startswith("mag")]
+        if mag:
+            data[:, mag] = np.where(batch[:, mag] == HMCRegisterMap.OVERFLOW, np.nan, data[:, mag])
+        return data
+
+    def fifo_read(self, out=None, scaled=False):
+        """
+        Function to drain the FIFO buffer.
+        Only complete frames are red, with block reads of FIFO_R_W, and parsed
+        in the preallocated batch. On overflow the FIFO is reset, since the
+        frame alignment is lost, an empty batch is returned and
+        fifo_overflows is incremented.
+        The frames are counted by the sample clock of fifo_read_timed, so
+        the two functions can be mixed.
+
+        Parameters
+        ----------
+        out : numpy.ndarray, optional
+            int16 array (N x channels) where the frames are stored.
+            The default is the batch preallocated by fifo_config_set.
+        scaled : bool, optional
+            Return the frames in physical units instead of raw int16.
+            The default is False.
+
+        Returns
+        -------
+        numpy.ndarray
+            Frames red from the FIFO (n x channels).
+
+        """
+        if out is None:
+            out = self.fifo_batch
+        frame = 2*len(self.fifo_channels)
+        
+        t0 = time.monotonic_ns()
+        count = self.fifo_count_get()
+        self.fifo_time = (t0 + time.monotonic_ns())//2
+        if count >= RegisterMap.FIFO_SIZE:
+            self.fifo_overflows += 1
+            self.fifo_reset()
+            count = 0
+        n = min(count // frame, len(out)) if frame else 0
+        self.fifo_pending = count // frame - n if frame else 0
+        
+        if n:
+            data = self.i2c.read_block(self.address, RegisterMap.FIFO_R_W, n*frame, increment=False)
+            out[:n] = np.frombuffer(data, dtype=">i2").reshape(n, len(self.fifo_channels))
+        if self.sample_clock is not None:
+            self.sample_clock.advance(n, self.fifo_time, self.fifo_pending)
+        if scaled:
+            return self.fifo_scale(out[:n])
+        return out[:n]
+
+    def fifo_read_timed(self, out=None, scaled=False):
+        """
+        Function to drain the FIFO buffer with the timestamps of the frames.
+        The timestamps come from the sample clock of the device, fitted on
+        the FIFO counts and the host time of the count reads (see
+        timing.SampleClock), so the drift of the device oscillator is
+        tracked without reading the clock for each sample.
+
+        Parameters
+        ----------
+        out : numpy.ndarray, optional
+            int16 array (N x channels) where the frames are stored.
+            The default is the batch preallocated by fifo_config_set.
+        scaled : bool, optional
+            Return the frames in physical units instead of raw int16.
+            The default is False.
+
+        Returns
+        -------
+        timestamps : numpy.ndarray
+            time.monotonic_ns() of the frames (n).
+        data : numpy.ndarray
+            Frames red from the FIFO (n x channels).
+
+        """
+        rate = self.sr*1000
+        if self.sample_clock is None or self.sample_clock.rate != rate:
+            self.sample_clock = SampleClock(rate)
+        # fifo_read counts the frames
+        data = self.fifo_read(out, scaled)
+        return self.sample_clock.timestamps(self.sample_clock.count - len(data), len(data)), data
+
+    def data_ready_interrupt_enable(self, latch=True, read_clear=True):
+        """
+        Function to enable the Data Ready interrupt on the INT pin.
+        See registers 55 and 56 for more information.
+
+        Parameters
+        ----------
+        latch : bool, optional
+            Hold the INT pin high until the interrupt is cleared.
+            The default is True.
+        read_clear : bool, optional
+            Clear the interrupt on any read operation, so the burst read of
+            the sample clears it. Otherwise INT_STATUS is red after each
+            sample. The default is True.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.fields_set({
+            RegisterMap.LATCH_INT_EN : latch,
+            RegisterMap.INT_RD_CLEAR : read_clear})
+        self.field_set(RegisterMap.DATA_RDY_EN, 1)
+        self.int_read_clear = read_clear
+        
+    def data_ready_interrupt_disable(self):
+        """
+        Function to disable the Data Ready interrupt.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.field_set(RegisterMap.DATA_RDY_EN, 0)
+
+    def wait_sample(self, waiter, timeout=None):
+        """
+        Function to wait for the Data Ready interrupt and read the new sample
+        with a single burst read.
+
+        Parameters
+        ----------
+        waiter : object
+            Interrupt source with a wait(timeout) method returning False on
+            timeout, e.g. gpio.GPIOInterrupt or gpio.EventInterrupt.
+        timeout : float, optional
+            Maximum waiting time in seconds. The default is None (no timeout).
+
+        Returns
+        -------
+        tuple or None
+            accel, temp and gyro of the new sample, None on timeout.
+
+        """
+        if not waiter.wait(timeout):
+            return None
+        self.read_all()
+        if not self.int_read_clear:
+            self.read_data(RegisterMap.INT_STATUS)
+        return self.accel, self.temp, self.gyro
+
     def temp_get(self):
         
         self.read_temperature()
@@ -1058,6 +1980,8 @@ class MPU6050:
     def gyro_get(self):
         
         self.read_gyro()
+        if self.calibration is not None:
+            self.gyro -= self.calibration.gyro_bias
         if self.DEBUG:
             print("Gyro: º/s", self.gyro)
         return self.gyro
@@ -1065,24 +1989,226 @@ class MPU6050:
     def accel_get(self):
         
         self.read_accel()
+        if self.calibration is not None:
+            self.accel[:] = (self.accel - self.calibration.accel_offset)/self.calibration.accel_scale
         if self.DEBUG:
             print("Accel: g", self.accel)
         return self.accel
+
+    def sample_get(self):
+        
+        self.read_all()
+        if self.DEBUG:
+            print("Accel: g", self.accel, "Temperature: ºC", self.temp, "Gyro: º/s", self.gyro)
+        return self.accel, self.temp, self.gyro
     
     def pass_through_mode_set(self, state):
         
         if state == True:
-            self.modify_register(RegisterMap.INT_PIN_CFG, "1", 6)
-            self.modify_register(RegisterMap.USER_CTRL, "0", 2)
+            self.field_set(RegisterMap.I2C_BYPASS_EN, 1)
+            self.field_set(RegisterMap.I2C_MST_EN, 0)
         else: 
-            self.modify_register(RegisterMap.INT_PIN_CFG, "0", 6)
-            self.modify_register(RegisterMap.USER_CTRL, "1", 2)
+            self.field_set(RegisterMap.I2C_BYPASS_EN, 0)
+            self.field_set(RegisterMap.I2C_MST_EN, 1)
     
     def pass_through_mode_get(self):
-        I2C_BYPASS_EN = self.read_data(RegisterMap.INT_PIN_CFG, "str")[6]
-        I2C_MST_EN = self.read_data(RegisterMap.USER_CTRL, "str")[2]
-        
-        if I2C_BYPASS_EN == "1" and I2C_MST_EN == "0":
-            print("Pass-Through Mode Enabled")
-        if I2C_BYPASS_EN == "0":
-            print("Pass-Through Mode Disabled")
\ No newline at end of file
+        """
+        Function to get the state of the pass-through mode (auxiliary I2C bus
+        connected to the main one).
+
+        Returns
+        -------
+        bool
+            True if the pass-through mode is enabled.
+
+        """
+        I2C_BYPASS_EN = self.field_get(RegisterMap.I2C_BYPASS_EN)
+        I2C_MST_EN = self.field_get(RegisterMap.I2C_MST_EN)
+        state = I2C_BYPASS_EN == 1 and I2C_MST_EN == 0
+        if self.DEBUG:
+            print("Pass-Through Mode", "Enabled" if state else "Disabled")
+        return state
+            
+    def aux_master_enable(self, clock=13):
+        """
+        Function to enable the I2C master of the auxiliary bus, with the
+        pass-through mode disabled. The data ready interrupt waits for the
+        external sensor data, so a sample and its slave data stay aligned.
+
+        Parameters
+        ----------
+        clock : int, optional
+            I2C_MST_CLK, 13 is 400 kHz. The default is 13.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.hold_changes()
+        self.field_set(RegisterMap.I2C_BYPASS_EN, 0)
+        self.fields_set({RegisterMap.I2C_MST_CLK : clock, RegisterMap.WAIT_FOR_ES : 1})
+        self.field_set(RegisterMap.DELAY_ES_SHADOW, 1)
+        self.field_set(RegisterMap.I2C_MST_EN, 1)
+        self.apply_changes()
+
+    def aux_write(self, address, register, value, timeout=0.05):
+        """
+        Function to write a register of a device of the auxiliary bus with
+        a single transfer of slave 4.
+
+        Parameters
+        ----------
+        address : hex
+            Address of the auxiliary device.
+        register : hex
+            Register of the auxiliary device.
+        value : int
+            Value to write.
+        timeout : float, optional
+            Maximum time to wait for the transfer in seconds. The default is 0.05.
+
+        Raises
+        ------
+        OSError
+            If the device does not acknowledge or the transfer does not end.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.write_data(RegisterMap.I2C_SLV4_ADDR, address & 0x7F)
+        self.write_data(RegisterMap.I2C_SLV4_REG, register)
+        self.write_data(RegisterMap.I2C_SLV4_DO, value)
+        self.write_data(RegisterMap.I2C_SLV4_CTRL, RegisterMap.I2C_SLV4_EN.mask)
+        end = time.monotonic() + timeout
+        while True:
+            status = self.read_data(RegisterMap.I2C_MST_STATUS)
+            if status & RegisterMap.I2C_SLV4_NACK.mask:
+                raise OSError(errno.EREMOTEIO, f"Auxiliary device {address:#x} did not acknowledge")
+            if status & RegisterMap.I2C_SLV4_DONE.mask:
+                return
+            if time.monotonic() > end:
+                raise OSError(errno.ETIMEDOUT, f"Auxiliary write to {address:#x} timed out")
+            time.sleep(0.001)
+
+    def aux_read_set(self, address, register, columns):
+        """
+        Function to program slave 0 to read a device of the auxiliary bus at
+        every sample. The data is copied in EXT_SENS_DATA, right after the
+        gyro registers, so read_raw_aux gets it in the same burst read, and
+        can be written in the FIFO with fifo_config_set(slv0=True).
+
+        Parameters
+        ----------
+        address : hex
+            Address of the auxiliary device.
+        register : hex
+            First register to read.
+        columns : list
+            Names of the big-endian int16 words red, in register order.
+
+        Returns
+        -------
+        None.
+
+        """
+        length = 2*len(columns)
+        if not 0 < length <= 15:
+            raise ValueError("Slave 0 reads from 1 to 7 words")
+        self.hold_changes()
+        self.fields_set({RegisterMap.I2C_SLV0_RW : 1, RegisterMap.I2C_SLV0_ID : address})
+        self.register_set(RegisterMap.I2C_SLV0_REG, register)
+        self.fields_set({RegisterMap.I2C_SLV0_EN : 1, RegisterMap.I2C_SLV0_LEN : length})
+        self.apply_changes()
+        self.aux_columns = list(columns)
+
+    def aux_read_disable(self):
+        """
+        Function to stop the reads of slave 0.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.field_set(RegisterMap.I2C_SLV0_EN, 0)
+        self.aux_columns = []
+
+    def aux_magnetometer_enable(self, address=0x1E, gain=1, rate=75, fifo=False):
+        """
+        Function to read a HMC5883L on the auxiliary bus through the I2C
+        master: the magnetometer is configured in continuous mode with
+        slave 4 and its 6 output bytes are red by slave 0 at every sample.
+        A 9-axis sample then takes a single burst read (see sample_aux_get).
+
+        Parameters
+        ----------
+        address : hex, optional
+            Address of the HMC5883L. The default is 0x1E.
+        gain : int, optional
+            GN code of the HMC5883L. The default is 1 (1090 LSB/Ga).
+        rate : float, optional
+            Output rate of the HMC5883L in Hz. The default is 75.
+        fifo : bool, optional
+            Write accel, gyro and magnetometer in the FIFO. The default is False.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.aux_master_enable()
+        self.aux_write(address, HMCRegisterMap.CRA, pack({HMCRegisterMap.DO : rate}))
+        self.aux_write(address, HMCRegisterMap.CRB, pack({HMCRegisterMap.GN : gain}))
+        self.aux_write(address, HMCRegisterMap.MR, pack({HMCRegisterMap.MD : "Continuous"}))
+        # output registers are ordered X, Z, Y
+        self.aux_read_set(address, HMCRegisterMap.DXRA, ["mag_x", "mag_z", "mag_y"])
+        self.mag_lsb = HMCRegisterMap.sensor_range[f"{gain:03b}"][1]
+        if fifo:
+            self.fifo_config_set(accel=True, gyro=True, slv0=True)
+
+    def read_raw_aux(self):
+        """
+        Function to read accel, temperature, gyro and the slave 0 data in a
+        single block read from ACCEL_XOUT_H.
+
+        Returns
+        -------
+        numpy.ndarray
+            Raw int16 values, columns MOTION_COLUMNS + aux_columns.
+
+        """
+        length = RegisterMap.MOTION_LENGTH + 2*len(self.aux_columns)
+        data = self.i2c.read_block(self.address, RegisterMap.ACCEL_XOUT_H, length)
+        return np.frombuffer(data, dtype=">i2")
+
+    def sample_aux_get(self):
+        """
+        Function to get accel, temperature, gyro and magnetometer of the same
+        sample with one burst read, see aux_magnetometer_enable.
+
+        Returns
+        -------
+        tuple
+            accel (g), temperature (ºC), gyro (º/s) and magnetometer x, y, z
+            (mGa), NaN on the axis in overflow.
+
+        Raises
+        ------
+        ValueError
+            The magnetometer gain is unknown, it was not enabled with
+            aux_magnetometer_enable.
+
+        """
+        if self.mag_lsb is None:
+            raise ValueError("Magnetometer gain unknown, enable it with aux_magnetometer_enable")
+        raw = self.read_raw_aux()
+        self.read_all(raw[:7])
+        columns = RegisterMap.MOTION_COLUMNS + self.aux_columns
+        mag = raw[[columns.index(name) for name in ("mag_x", "mag_y", "mag_z")]]
+        self.mag[:] = np.where(mag == HMCRegisterMap.OVERFLOW, np.nan, mag/self.mag_lsb*1000)
+        if self.DEBUG:
+            print("Accel: g", self.accel, "Temperature: ºC", self.temp, "Gyro: º/s", self.gyro, "Mag: mGa", self.mag)
+        return self.accel, self.temp, self.gyro, self.mag
@@ -8,6 +8,7 @@ Created on Thu Feb 22 21:24:10 2024
 # =============================================================================
 # REGISTER MAP DEFINITION
 # =============================================================================
+from i2c import BitField
 
 class RegisterMap:
     SELF_TEST_X = 0x0D
@@ -61,6 +62,8 @@ class RegisterMap:
     GYRO_YOUT_L = 0x46
     GYRO_ZOUT_H = 0x47
     GYRO_ZOUT_L = 0x48
+    MOTION_LENGTH = 14
+    MOTION_COLUMNS = ["accel_x", "accel_y", "accel_z", "temp", "gyro_x", "gyro_y", "gyro_z"]
     
     EXT_SENS_DATA_00 = 0x49
     EXT_SENS_DATA_01 = 0x4A
@@ -104,6 +107,46 @@ class RegisterMap:
     FIFO_R_W = 0x74
     WHO_AM_I = 0x75
     
+    FIFO_SIZE = 1024
+    
+    # CLKSEL of the internal 8 MHz oscillator, selected after a reset and
+    # required when the gyros are in standby, and of the PLL with the X axis
+    # gyroscope reference, more stable.
+    CLOCK_INTERNAL = 0
+    CLOCK_PLL = 1
+    
+    # Configuration registers kept in the shadow copy of the device, with
+    # the mask of the bits that clear themselves after being written.
+    SHADOW_REGISTERS = {
+        SMPLRT_DIV : 0x00,
+        CONFIG : 0x00,
+        GYRO_CONFIG : 0x00,
+        ACCEL_CONFIG : 0x00,
+        FIFO_EN : 0x00,
+        I2C_MST_CTRL : 0x00,
+        I2C_SLV0_ADDR : 0x00,
+        I2C_SLV0_REG : 0x00,
+        I2C_SLV0_CTRL : 0x00,
+        INT_PIN_CFG : 0x00,
+        I2C_MST_DELAY_CTRL : 0x00,
+        INT_ENABLE : 0x00,
+        USER_CTRL : 0x07,
+        PWR_MGMT_1 : 0x80,
+        PWR_MGMT_2 : 0x00}
+    
+    # FIFO_EN bit and number of int16 words of each channel, in the order
+    # the channels are written in the FIFO frame.
+    FIFO_CHANNELS = {
+        "accel" : [0x08, ["accel_x", "accel_y", "accel_z"]],
+        "temp" : [0x80, ["temp"]],
+        "gyro_x" : [0x40, ["gyro_x"]],
+        "gyro_y" : [0x20, ["gyro_y"]],
+        "gyro_z" : [0x10, ["gyro_z"]],
+        "slv0" : [0x01, []]}
+    
+    # number of EXT_SENS_DATA registers
+    EXT_SENS_LENGTH = 24
+    
     GYRO_LSB = {
         0 : 131,
         1 : 65.5,
@@ -114,4 +157,116 @@ class RegisterMap:
         0 : 16384,
         1 : 8192,
         2 : 4096,
-        3 : 2048}
\ No newline at end of file
+        3 : 2048}
+    
+    # Output rate of the accel in Hz, whatever the DLPF: at higher sample
+    # rates the accel samples are repeated.
+    ACCEL_RATE = 1000
+    
+    # DLPF_CFG settings: accel bandwidth (Hz) and delay (ms), gyro bandwidth
+    # (Hz) and delay (ms), gyro output rate (Hz). DLPF_CFG 7 is reserved.
+    DLPF = {
+        0 : (260, 0.0, 256, 0.98, 8000),
+        1 : (184, 2.0, 188, 1.9, 1000),
+        2 : (94, 3.0, 98, 2.8, 1000),
+        3 : (44, 4.9, 42, 4.8, 1000),
+        4 : (21, 8.5, 20, 8.3, 1000),
+        5 : (10, 13.8, 10, 13.4, 1000),
+        6 : (5, 19.0, 5, 18.6, 1000)}
+    
+    # =========================================================================
+    # REGISTER FIELDS
+    # =========================================================================
+    XA_TEST_H = BitField(SELF_TEST_X, 5, 3)
+    XG_TEST = BitField(SELF_TEST_X, 0, 5)
+    YA_TEST_H = BitField(SELF_TEST_Y, 5, 3)
+    YG_TEST = BitField(SELF_TEST_Y, 0, 5)
+    ZA_TEST_H = BitField(SELF_TEST_Z, 5, 3)
+    ZG_TEST = BitField(SELF_TEST_Z, 0, 5)
+    XA_TEST_L = BitField(SELF_TEST_A, 4, 2)
+    YA_TEST_L = BitField(SELF_TEST_A, 2, 2)
+    ZA_TEST_L = BitField(SELF_TEST_A, 0, 2)
+    
+    EXT_SYNC_SET = BitField(CONFIG, 3, 3)
+    DLPF_CFG = BitField(CONFIG, 0, 3)
+    
+    XG_ST = BitField(GYRO_CONFIG, 7)
+    YG_ST = BitField(GYRO_CONFIG, 6)
+    ZG_ST = BitField(GYRO_CONFIG, 5)
+    FS_SEL = BitField(GYRO_CONFIG, 3, 2)
+    
+    XA_ST = BitField(ACCEL_CONFIG, 7)
+    YA_ST = BitField(ACCEL_CONFIG, 6)
+    ZA_ST = BitField(ACCEL_CONFIG, 5)
+    AFS_SEL = BitField(ACCEL_CONFIG, 3, 2)
+    
+    SLV0_FIFO_EN = BitField(FIFO_EN, 0)
+    
+    MULT_MST_EN = BitField(I2C_MST_CTRL, 7)
+    WAIT_FOR_ES = BitField(I2C_MST_CTRL, 6)
+    SLV_3_FIFO_EN = BitField(I2C_MST_CTRL, 5)
+    I2C_MST_P_NSR = BitField(I2C_MST_CTRL, 4)
+    I2C_MST_CLK = BitField(I2C_MST_CTRL, 0, 4)
+    
+    I2C_SLV0_RW = BitField(I2C_SLV0_ADDR, 7)
+    I2C_SLV0_ID = BitField(I2C_SLV0_ADDR, 0, 7)
+    I2C_SLV0_EN = BitField(I2C_SLV0_CTRL, 7)
+    I2C_SLV0_BYTE_SW = BitField(I2C_SLV0_CTRL, 6)
+    I2C_SLV0_REG_DIS = BitField(I2C_SLV0_CTRL, 5)
+    I2C_SLV0_GRP = BitField(I2C_SLV0_CTRL, 4)
+    I2C_SLV0_LEN = BitField(I2C_SLV0_CTRL, 0, 4)
+    
+    I2C_SLV4_RW = BitField(I2C_SLV4_ADDR, 7)
+    I2C_SLV4_ID = BitField(I2C_SLV4_ADDR, 0, 7)
+    I2C_SLV4_EN = BitField(I2C_SLV4_CTRL, 7)
+    I2C_MST_DLY = BitField(I2C_SLV4_CTRL, 0, 5)
+    
+    PASS_THROUGH = BitField(I2C_MST_STATUS, 7)
+    I2C_SLV4_DONE = BitField(I2C_MST_STATUS, 6)
+    I2C_LOST_ARB = BitField(I2C_MST_STATUS, 5)
+    I2C_SLV4_NACK = BitField(I2C_MST_STATUS, 4)
+    I2C_SLV0_NACK = BitField(I2C_MST_STATUS, 0)
+    
+    DELAY_ES_SHADOW = BitField(I2C_MST_DELAY_CTRL, 7)
+    I2C_SLV0_DLY_EN = BitField(I2C_MST_DELAY_CTRL, 0)
+    
+    INT_LEVEL = BitField(INT_PIN_CFG, 7)
+    INT_OPEN = BitField(INT_PIN_CFG, 6)
+    LATCH_INT_EN = BitField(INT_PIN_CFG, 5)
+    INT_RD_CLEAR = BitField(INT_PIN_CFG, 4)
+    FSYNC_INT_LEVEL = BitField(INT_PIN_CFG, 3)
+    FSYNC_INT_EN = BitField(INT_PIN_CFG, 2)
+    I2C_BYPASS_EN = BitField(INT_PIN_CFG, 1)
+    
+    FIFO_OFLOW_EN = BitField(INT_ENABLE, 4)
+    I2C_MST_INT_EN = BitField(INT_ENABLE, 3)
+    DATA_RDY_EN = BitField(INT_ENABLE, 0)
+    
+    FIFO_OFLOW_INT = BitField(INT_STATUS, 4)
+    I2C_MST_INT = BitField(INT_STATUS, 3)
+    DATA_RDY_INT = BitField(INT_STATUS, 0)
+    
+    USER_FIFO_EN = BitField(USER_CTRL, 6)
+    I2C_MST_EN = BitField(USER_CTRL, 5)
+    I2C_IF_DIS = BitField(USER_CTRL, 4)
+    FIFO_RESET = BitField(USER_CTRL, 2)
+    I2C_MST_RESET = BitField(USER_CTRL, 1)
+    SIG_COND_RESET = BitField(USER_CTRL, 0)
+    
+    GYRO_RESET = BitField(SIGNAL_PATH_RESET, 2)
+    ACCEL_RESET = BitField(SIGNAL_PATH_RESET, 1)
+    TEMP_RESET = BitField(SIGNAL_PATH_RESET, 0)
+    
+    DEVICE_RESET = BitField(PWR_MGMT_1, 7)
+    SLEEP = BitField(PWR_MGMT_1, 6)
+    CYCLE = BitField(PWR_MGMT_1, 5)
+    TEMP_DIS = BitField(PWR_MGMT_1, 3)
+    CLKSEL = BitField(PWR_MGMT_1, 0, 3)
+    
+    LP_WAKE_CTRL = BitField(PWR_MGMT_2, 6, 2)
+    STBY_XA = BitField(PWR_MGMT_2, 5)
+    STBY_YA = BitField(PWR_MGMT_2, 4)
+    STBY_ZA = BitField(PWR_MGMT_2, 3)
+    STBY_XG = BitField(PWR_MGMT_2, 2)
+    STBY_YG = BitField(PWR_MGMT_2, 1)
+    STBY_ZG = BitField(PWR_MGMT_2, 0)
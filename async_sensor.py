@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio interface of the MPU6050 and HMC5883L drivers, the bus
+transactions run in one executor thread per I2C bus.
+"""
+
+# =============================================================================
+# ASYNCIO SENSOR INTERFACE
+# =============================================================================
+import abc
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from MPU6050.register_map import RegisterMap
+
+# executor of each bus number, the sensors of a bus share it even through
+# different I2CInterface objects
+executors = {}
+executors_lock = threading.Lock()
+
+def bus_executor(i2c):
+    """
+    Function to get the executor of an I2C bus.
+    Every bus number has a single worker thread, so the transactions of the
+    sensors sharing the bus never interleave, whether they share the
+    I2CInterface or each opened its own.
+
+    Parameters
+    ----------
+    i2c : I2CInterface
+        Interface of the bus.
+
+    Returns
+    -------
+    ThreadPoolExecutor
+        Executor of the bus.
+
+    """
+    with executors_lock:
+        executor = executors.get(i2c.bus_number)
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"i2c-{i2c.bus_number}")
+            executors[i2c.bus_number] = executor
+    return executor
+
+class AsyncSensor(abc.ABC):
+    """
+    Base class of the asyncio interfaces. The blocking methods of the sensor
+    run on the executor of its bus, off the event loop. Subclasses implement
+    read_batch.
+    """
+    def __init__(self, sensor, executor=None):
+        """
+        Method to initialize the AsyncSensor object.
+
+        Parameters
+        ----------
+        sensor : MPU6050 or HMC5883L
+            Sensor to wrap.
+        executor : Executor, optional
+            Executor of the bus. The default is the bus_executor of the sensor.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.sensor = sensor
+        self.executor = bus_executor(sensor.i2c) if executor is None else executor
+
+    async def run(self, func, *args):
+        """
+        Function to run a blocking function on the bus executor.
+        If the calling task is cancelled the transaction in progress is still
+        completed, so the bus is never left in the middle of a transfer.
+
+        Parameters
+        ----------
+        func : callable
+            Blocking function.
+        *args
+            Arguments of the function.
+
+        Returns
+        -------
+        object
+            Result of the function.
+
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def call(self, name, *args):
+        """
+        Function to call any method of the sensor off the event loop,
+        e.g. await sensor.call("sample_rate_set", 9).
+
+        Parameters
+        ----------
+        name : str
+            Name of the method.
+        *args
+            Arguments of the method.
+
+        Returns
+        -------
+        object
+            Result of the method.
+
+        """
+        return await self.run(getattr(self.sensor, name), *args)
+
+    @abc.abstractmethod
+    def read_batch(self):
+        """
+        Function, run on the bus executor, returning the new samples as a
+        (n x channels) array owned by the caller.
+        """
+
+    async def stream(self, rate, batch=1):
+        """
+        Asynchronous iterator of sample batches:
+            async for data in sensor.stream(rate=200, batch=10): ...
+        The reads are scheduled on absolute deadlines at the given rate. The
+        next read starts only when the consumer asks for the next batch, so a
+        slow consumer slows the acquisition down instead of growing a queue.
+
+        Parameters
+        ----------
+        rate : float
+            Read rate in Hz.
+        batch : int, optional
+            Number of reads collected in each yielded batch. The default is 1.
+
+        Yields
+        ------
+        numpy.ndarray
+            Batch of samples (n x channels).
+
+        """
+        loop = asyncio.get_running_loop()
+        period = 1/rate
+        deadline = loop.time()
+        chunks = []
+        n = 0
+        while True:
+            data = await self.run(self.read_batch)
+            if len(data):
+                chunks.append(data)
+                n += 1
+            if n >= batch:
+                yield np.concatenate(chunks)
+                chunks = []
+                n = 0
+            deadline += period
+            delay = deadline - loop.time()
+            if delay < 0:
+                # late, restart the schedule instead of bursting
+                deadline = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
+
+class AsyncMPU6050(AsyncSensor):
+    """
+    asyncio interface of the MPU6050.
+    """
+    def __init__(self, sensor, executor=None, fifo=False, scaled=True):
+        """
+        Method to initialize the AsyncMPU6050 object.
+
+        Parameters
+        ----------
+        sensor : MPU6050
+            Sensor to wrap.
+        executor : Executor, optional
+            Executor of the bus. The default is the bus_executor of the sensor.
+        fifo : bool, optional
+            Stream the content of the FIFO (configured with fifo_config_set and
+            fifo_enable) instead of one burst read per period.
+            The default is False.
+        scaled : bool, optional
+            Stream values in physical units instead of raw int16.
+            The default is True.
+
+        Returns
+        -------
+        None.
+
+        """
+        super().__init__(sensor, executor)
+        self.fifo = fifo
+        self.scaled = scaled
+
+    def read_batch(self):
+        if self.fifo:
+            data = self.sensor.fifo_read()
+            return self.sensor.fifo_scale(data) if self.scaled else data.copy()
+        data = self.sensor.read_raw().reshape(1, -1)
+        if self.scaled:
+            return self.sensor.fifo_scale(data, RegisterMap.MOTION_COLUMNS)
+        return data.copy()
+
+    # the copies are taken on the bus thread, before the next read can
+    # overwrite the arrays of the sensor
+    async def sample_get(self):
+        def read():
+            accel, temp, gyro = self.sensor.sample_get()
+            return accel.copy(), temp, gyro.copy()
+        return await self.run(read)
+
+    async def gyro_get(self):
+        return await self.run(lambda: self.sensor.gyro_get().copy())
+
+    async def accel_get(self):
+        return await self.run(lambda: self.sensor.accel_get().copy())
+
+    async def temp_get(self):
+        return await self.run(self.sensor.temp_get)
+
+class AsyncHMC5883L(AsyncSensor):
+    """
+    asyncio interface of the HMC5883L.
+    """
+    def read_batch(self):
+        self.sensor.read_mag()
+        return self.sensor.mag.reshape(1, -1).copy()
+
+    async def read_mag(self):
+        return (await self.run(self.read_batch))[0]
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the acquisition paths against the simulated bus.
+Example: python benchmark.py --latency 150 --byte-time 22 --output bench.json
+"""
+
+import argparse
+import json
+import platform
+import time
+
+import numpy as np
+
+from i2c import I2CInterface
+from MPU6050.mpu6050 import MPU6050
+from MPU6050.register_map import RegisterMap
+from simulated_bus import SimulatedBus, MPU6050Model
+
+def make_sensors(bus, addresses, divider):
+    """
+    Function to connect and configure simulated MPU6050s.
+
+    Parameters
+    ----------
+    bus : SimulatedBus
+        Bus where the devices are connected.
+    addresses : list
+        Addresses of the devices.
+    divider : int
+        SMPLRT_DIV of the devices.
+
+    Returns
+    -------
+    list
+        Configured MPU6050 objects.
+
+    """
+    i2c = I2CInterface(1, bus=bus)
+    sensors = []
+    for address in addresses:
+        bus.add_device(address, MPU6050Model(noise=4, seed=address))
+        sensor = MPU6050(address, i2c=i2c)
+        sensor.wakeup()
+        sensor.gyro_config_set(0, 0, 0, 0)
+        sensor.accel_config_set(0, 0, 0, 0)
+        sensor.field_set(RegisterMap.DLPF_CFG, 1)
+        sensor.sample_rate_set(divider)
+        sensors.append(sensor)
+    return sensors
+
+def run_path(bus, read, duration, period=None, wait=None):
+    """
+    Function to run a read path for a given time and measure it.
+    Each call of the read path is a poll, the samples per second count only
+    the delivered samples.
+
+    Parameters
+    ----------
+    bus : SimulatedBus
+        Bus used by the read path.
+    read : callable
+        Read path, returns the number of delivered samples (0 when no new
+        sample is ready).
+    duration : float
+        Duration of the run in seconds.
+    period : float, optional
+        Sample period of buffered paths (FIFO). The latency of each sample
+        is then its age at delivery instead of the duration of the read.
+        The default is None.
+    wait : callable, optional
+        Called before each read and not timed, e.g. the sleep between two
+        FIFO drains. The default is None.
+
+    Returns
+    -------
+    dict
+        Measured figures.
+
+    """
+    latencies = []
+    samples = 0
+    polls = 0
+    transactions = bus.transactions
+    n_bytes = bus.bytes
+    busy = bus.busy_time
+    cpu = time.process_time()
+    start = time.perf_counter()
+    end = start + duration
+    while True:
+        if wait is not None:
+            wait()
+        t0 = time.perf_counter()
+        if t0 >= end:
+            break
+        n = read()
+        t1 = time.perf_counter()
+        polls += 1
+        samples += n
+        if period is None:
+            latencies += [t1 - t0]*n
+        elif n:
+            # the newest sample is at most as old as the read
+            latencies += list(t1 - t0 + period*np.arange(n)[::-1])
+    elapsed = time.perf_counter() - start
+    # the simulated bus spins during the transactions, a real bus sleeps
+    cpu = time.process_time() - cpu - (bus.busy_time - busy)
+    transactions = bus.transactions - transactions
+    n_bytes = bus.bytes - n_bytes
+
+    per_sample = max(samples, 1)
+    latencies = np.array(latencies) if latencies else np.zeros(1)
+    return {
+        "samples" : samples,
+        "samples_per_s" : samples/elapsed,
+        "polls_per_s" : polls/elapsed,
+        "transactions_per_sample" : transactions/per_sample,
+        "bytes_per_sample" : n_bytes/per_sample,
+        "cpu_us_per_sample" : cpu/per_sample*1e6,
+        "latency_p50_us" : float(np.percentile(latencies, 50)*1e6),
+        "latency_p99_us" : float(np.percentile(latencies, 99)*1e6)}
+
+def benchmark(latency=0.0, byte_time=0.0, duration=1.0, divider=0, fifo_interval=0.005):
+    """
+    Function to benchmark every read path.
+
+    Parameters
+    ----------
+    latency : float, optional
+        Time of each I2C transaction, in seconds. The default is 0.0.
+    byte_time : float, optional
+        Time of each transferred byte, in seconds. The default is 0.0.
+    duration : float, optional
+        Duration of each run in seconds. The default is 1.0.
+    divider : int, optional
+        SMPLRT_DIV of the simulated sensors (DLPF enabled, 1 kHz gyro
+        output rate). The default is 0.
+    fifo_interval : float, optional
+        Time between two FIFO drains in seconds. The default is 0.005.
+
+    Returns
+    -------
+    dict
+        Results by read path.
+
+    """
+    results = {}
+
+    bus = SimulatedBus(latency=latency, byte_time=byte_time)
+    sensor, = make_sensors(bus, [0x68], divider)
+
+    # the polling paths read a sample only when Data Ready is set
+    def per_axis():
+        if not sensor.field_get(RegisterMap.DATA_RDY_INT):
+            return 0
+        sensor.temp_get()
+        sensor.gyro_get()
+        sensor.accel_get()
+        return 1
+    results["per_axis"] = run_path(bus, per_axis, duration)
+
+    def full_sample():
+        if not sensor.field_get(RegisterMap.DATA_RDY_INT):
+            return 0
+        sensor.sample_get()
+        return 1
+    results["full_sample"] = run_path(bus, full_sample, duration)
+
+    sensor.fifo_config_set(accel=True, gyro=True, temp=True)
+    sensor.fifo_enable()
+    def fifo_drain():
+        return len(sensor.fifo_read())
+    results["fifo_drain"] = run_path(bus, fifo_drain, duration, period=(1 + divider)/1000,
+                                     wait=lambda: time.sleep(fifo_interval))
+    sensor.fifo_disable()
+
+    bus = SimulatedBus(latency=latency, byte_time=byte_time)
+    sensors = make_sensors(bus, [0x68, 0x69], divider)
+    def multi_device():
+        n = 0
+        for sensor in sensors:
+            if sensor.field_get(RegisterMap.DATA_RDY_INT):
+                sensor.read_raw()
+                n += 1
+        return n
+    results["multi_device"] = run_path(bus, multi_device, duration)
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the MPU6050 read paths on the simulated bus")
+    parser.add_argument("--latency", type=float, default=0.0, help="time per I2C transaction in us")
+    parser.add_argument("--byte-time", type=float, default=0.0, help="time per transferred byte in us")
+    parser.add_argument("--duration", type=float, default=1.0, help="duration of each run in s")
+    parser.add_argument("--divider", type=int, default=0, help="SMPLRT_DIV of the simulated sensors")
+    parser.add_argument("--output", help="JSON file where the results are saved")
+    args = parser.parse_args()
+
+    results = benchmark(args.latency*1e-6, args.byte_time*1e-6, args.duration, args.divider)
+
+    print(f"{'path':14} {'samples/s':>10} {'polls/s':>10} {'trans/smp':>10} {'bytes/smp':>10} {'cpu us/smp':>11} {'p50 us':>9} {'p99 us':>9}")
+    for name, r in results.items():
+        print(f"{name:14} {r['samples_per_s']:10.0f} {r['polls_per_s']:10.0f} {r['transactions_per_sample']:10.2f} {r['bytes_per_sample']:10.1f}"
+              f" {r['cpu_us_per_sample']:11.1f} {r['latency_p50_us']:9.1f} {r['latency_p99_us']:9.1f}")
+
+    if args.output:
+        report = {
+            "time" : time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python" : platform.python_version(),
+            "machine" : platform.machine(),
+            "config" : vars(args),
+            "results" : results}
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -7,35 +7,45 @@ Created on Sun Feb 25 16:57:55 2024
 
 from MPU6050.mpu6050 import MPU6050
 from MPU6050.register_map import RegisterMap
+from MPU6050.calibration import ProfileStore
+from scheduler import DeadlineScheduler
 import numpy as np
-import time
 
 sensor = MPU6050(0x68)
-sensor.wakeup()
-sensor.who_am_i()
-sensor.sample_rate_get()
-sensor.config_get()
-sensor.gyro_config_get()
-sensor.accel_config_get()
+timings = sensor.bring_up()
+print("Bring-up in", timings["total_ms"], "ms")
+if not sensor.who_am_i():
+    print("The device at 0x68 is not a MPU-6050")
+config = sensor.config_snapshot()
+print("Sample rate is", config.sample_rate, "Hz")
+print("Gyro full scale range +/-", config.gyro_range, "º/s")
+print("Accel full scale range +/-", config.accel_range, "g")
 
-sensor.pass_through_mode_get()
+# load the stored calibration, calibrate only on the first boot
+store = ProfileStore()
+if not sensor.calibration_load(store):
+    sensor.calibrate(samples=1000, store=store)
+
+print("Pass-Through Mode", sensor.pass_through_mode_get())
 sensor.pass_through_mode_set(True)
-sensor.pass_through_mode_get()
+print("Pass-Through Mode", sensor.pass_through_mode_get())
 
 t = []
 gy = []
 a = []
 
-for i in range(200):
+# one reading every 0.1 s on absolute deadlines
+scheduler = DeadlineScheduler(10)
+for i, deadline in enumerate(scheduler.ticks(200)):
     #print(i)
     sensor.temp_get()
     sensor.gyro_get()
     sensor.accel_get()
     if i >= 100:
         t.append(sensor.temp)
-        gy.append(sensor.gyro)
-        a.append(sensor.accel)
-    time.sleep(.1)
+        gy.append(sensor.gyro.copy())
+        a.append(sensor.accel.copy())
+print("Missed deadlines", scheduler.missed, "jitter", scheduler.stats()["p99_us"], "us (p99)")
         
 print("values temp gy_x gy_y gy_z a_x a_y a_z norm")
 t_mean = np.array(t).mean(axis=0)
@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming FIR and biquad low pass filters with integer decimation, for the
+high rate batches of the FIFO.
+"""
+
+# =============================================================================
+# STREAMING FILTERS AND DECIMATION
+# =============================================================================
+import abc
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+def fir_lowpass(cutoff, rate, taps=63, window=np.hamming):
+    """
+    Function to design a linear phase low pass FIR (windowed sinc), with unit
+    gain at DC.
+
+    Parameters
+    ----------
+    cutoff : float
+        Cutoff frequency in Hz.
+    rate : float
+        Sample rate in Hz.
+    taps : int, optional
+        Number of taps, odd for an integer delay. The default is 63.
+    window : callable, optional
+        Window function of the number of taps. The default is np.hamming.
+
+    Returns
+    -------
+    numpy.ndarray
+        Taps of the filter.
+
+    """
+    if not 0 < cutoff < rate/2:
+        raise ValueError(f"Invalid cutoff {cutoff} Hz at {rate} Hz")
+    fc = cutoff/rate
+    m = np.arange(taps) - (taps - 1)/2
+    h = 2*fc*np.sinc(2*fc*m)*window(taps)
+    return h/h.sum()
+
+def biquad_lowpass(cutoff, rate, q=1/math.sqrt(2)):
+    """
+    Function to design a second order low pass section (bilinear transform
+    with the cutoff prewarped).
+
+    Parameters
+    ----------
+    cutoff : float
+        Cutoff frequency in Hz.
+    rate : float
+        Sample rate in Hz.
+    q : float, optional
+        Quality factor. The default is 1/sqrt(2) (Butterworth).
+
+    Returns
+    -------
+    numpy.ndarray
+        Coefficients b0, b1, b2, a1, a2 (a0 = 1).
+
+    """
+    if not 0 < cutoff < rate/2:
+        raise ValueError(f"Invalid cutoff {cutoff} Hz at {rate} Hz")
+    w0 = 2*math.pi*cutoff/rate
+    alpha = math.sin(w0)/(2*q)
+    cos = math.cos(w0)
+    a0 = 1 + alpha
+    return np.array([(1 - cos)/2, 1 - cos, (1 - cos)/2, -2*cos, 1 - alpha])/a0
+
+def butterworth_lowpass(cutoff, rate, order=4):
+    """
+    Function to design a Butterworth low pass filter as a cascade of second
+    order sections (and a first order one for odd orders).
+
+    Parameters
+    ----------
+    cutoff : float
+        Cutoff (-3 dB) frequency in Hz.
+    rate : float
+        Sample rate in Hz.
+    order : int, optional
+        Order of the filter. The default is 4.
+
+    Returns
+    -------
+    numpy.ndarray
+        Coefficients b0, b1, b2, a1, a2 of each section (order/2 x 5).
+
+    """
+    sections = [biquad_lowpass(cutoff, rate, 1/(2*math.cos((2*k - 1)*math.pi/(2*order))))
+                for k in range(1, order//2 + 1)]
+    if order % 2:
+        K = math.tan(math.pi*cutoff/rate)
+        sections.append(np.array([K/(1 + K), K/(1 + K), 0.0, (K - 1)/(K + 1), 0.0]))
+    return np.array(sections)
+
+def columns(batch):
+    # batch as float columns (N x channels), and whether it was 1-D
+    x = np.asarray(batch, dtype=float)
+    return x.reshape(len(x), -1), x.ndim == 1
+
+class StreamFilter(abc.ABC):
+    """
+    Base class of the streaming filters. Each call of process filters a batch
+    of samples (N x channels) and the state is carried to the next batch, so
+    a stream gives the same output whatever its chunks. The output is
+    decimated by an integer factor: the samples kept are one every factor
+    samples of the stream, across batches.
+    The state is initialized with the first sample as a constant past input
+    (initial="first"), so signals with an offset, as gravity on the accel,
+    start without a transient, or with zeros (initial="zero").
+    Subclasses implement process.
+    """
+    def __init__(self, factor=1, initial="first"):
+        if factor < 1 or int(factor) != factor:
+            raise ValueError(f"Invalid decimation factor {factor}")
+        if initial not in ("first", "zero"):
+            raise ValueError(f"Invalid initial state {initial!r}")
+        self.factor = int(factor)
+        self.initial = initial
+        self.reset()
+
+    def reset(self):
+        self.consumed = 0
+
+    def phase(self, n):
+        # first kept sample of a batch of n samples
+        start = (-self.consumed) % self.factor
+        self.consumed += n
+        return start
+
+    @abc.abstractmethod
+    def process(self, batch):
+        """
+        Function to filter and decimate a batch of samples.
+
+        Parameters
+        ----------
+        batch : numpy.ndarray
+            Samples (N x channels) or (N), e.g. from fifo_read(scaled=True).
+
+        Returns
+        -------
+        numpy.ndarray
+            Filtered samples kept by the decimation (about N/factor).
+
+        """
+
+    def process_timed(self, timestamps, batch):
+        """
+        Function to filter and decimate a batch of timestamped samples, e.g.
+        the output of MPU6050.fifo_read_timed.
+
+        Parameters
+        ----------
+        timestamps : numpy.ndarray
+            Timestamps of the samples (N).
+        batch : numpy.ndarray
+            Samples (N x channels).
+
+        Returns
+        -------
+        timestamps : numpy.ndarray
+            Timestamps of the kept samples. The filter delays the signal,
+            see the delay of the FIRFilter.
+        data : numpy.ndarray
+            Filtered samples.
+
+        """
+        start = (-self.consumed) % self.factor
+        return np.asarray(timestamps)[start::self.factor], self.process(batch)
+
+class FIRFilter(StreamFilter):
+    """
+    FIR filter with decimation. Only the kept outputs are computed, each as
+    the dot product of the taps with a window of the input (a view, not a
+    copy), so the cost per input sample is taps/factor.
+    """
+    def __init__(self, taps, factor=1, initial="first"):
+        """
+        Method to initialize the FIRFilter object.
+
+        Parameters
+        ----------
+        taps : numpy.ndarray
+            Taps of the filter, see fir_lowpass.
+        factor : int, optional
+            Decimation factor. The default is 1.
+        initial : str, optional
+            "first" or "zero", see StreamFilter. The default is "first".
+
+        Returns
+        -------
+        None.
+
+        """
+        self.taps = np.asarray(taps, dtype=float)
+        # windows are in time order, the taps in delay order
+        self.kernel = self.taps[::-1].copy()
+        super().__init__(factor, initial)
+
+    def reset(self):
+        super().reset()
+        self.history = None
+
+    @property
+    def delay(self):
+        """Delay of a linear phase filter, in input samples."""
+        return (len(self.taps) - 1)/2
+
+    def process(self, batch):
+        x, flat = columns(batch)
+        if self.history is None:
+            if not len(x):
+                return np.empty((0,) if flat else (0, x.shape[1]))
+            past = x[:1] if self.initial == "first" else np.zeros((1, x.shape[1]))
+            self.history = np.repeat(past, len(self.taps) - 1, axis=0)
+        start = self.phase(len(x))
+        data = np.concatenate([self.history, x])
+        windows = sliding_window_view(data, len(self.taps), axis=0)[start::self.factor]
+        out = windows @ self.kernel
+        self.history = data[len(data) - len(self.taps) + 1:].copy()
+        return out[:, 0] if flat else out
+
+class BiquadFilter(StreamFilter):
+    """
+    Cascade of second order IIR sections with decimation after the last one.
+    The recursion is evaluated in blocks: the response of each block to its
+    input, with zero initial state, is one matrix product for the whole
+    batch; only the two last outputs of each block are propagated in a
+    Python loop (one iteration per block), then the response to the
+    initial state is added to all the blocks at once.
+    """
+    def __init__(self, sections, factor=1, initial="first", block=64):
+        """
+        Method to initialize the BiquadFilter object.
+
+        Parameters
+        ----------
+        sections : numpy.ndarray
+            Coefficients b0, b1, b2, a1, a2 of each section (sections x 5),
+            see biquad_lowpass and butterworth_lowpass.
+        factor : int, optional
+            Decimation factor. The default is 1.
+        initial : str, optional
+            "first" or "zero", see StreamFilter. The default is "first".
+        block : int, optional
+            Length of the blocks of the recursion. The default is 64.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.sections = np.atleast_2d(np.asarray(sections, dtype=float))
+        self.block = block
+        # impulse response h and responses g1, g2 to the past outputs
+        # y[-1] = 1 and y[-2] = 1 of each section, on one block
+        self.responses = []
+        for b0, b1, b2, a1, a2 in self.sections:
+            y = np.zeros((3, block + 2))
+            y[0, 2] = 1
+            y[1, 1] = 1
+            y[2, 0] = 1
+            for k in range(2, block + 2):
+                y[:, k] += -a1*y[:, k - 1] - a2*y[:, k - 2]
+            h, g1, g2 = y[:, 2:]
+            T = np.zeros((block, block))
+            for k in range(block):
+                T[k, :k + 1] = h[k::-1]
+            self.responses.append((T, g1, g2))
+        super().__init__(factor, initial)
+
+    def reset(self):
+        super().reset()
+        self.state = None
+
+    def initial_state(self, x0):
+        # past inputs and outputs of each section: x[-2], x[-1], y[-2], y[-1]
+        self.state = []
+        for b0, b1, b2, a1, a2 in self.sections:
+            if self.initial == "zero":
+                x0 = np.zeros_like(x0)
+            y0 = x0*(b0 + b1 + b2)/(1 + a1 + a2)
+            self.state.append(np.array([x0, x0, y0, y0]))
+            x0 = y0
+
+    def section(self, i, x):
+        b0, b1, b2, a1, a2 = self.sections[i]
+        T, g1, g2 = self.responses[i]
+        state = self.state[i]
+        n, L = len(x), self.block
+        xe = np.concatenate([state[:2], x])
+        v = b0*xe[2:] + b1*xe[1:-1] + b2*xe[:-2]
+        blocks = -(-n//L)
+        V = np.zeros((blocks*L, x.shape[1]))
+        V[:n] = v
+        forced = T @ V.reshape(blocks, L, -1)
+        # past outputs of each block
+        starts = np.empty((blocks, 2, x.shape[1]))
+        y2, y1 = state[2], state[3]
+        for b in range(blocks):
+            starts[b, 0] = y1
+            starts[b, 1] = y2
+            y1, y2 = (forced[b, L - 1] + g1[L - 1]*y1 + g2[L - 1]*y2,
+                      forced[b, L - 2] + g1[L - 2]*y1 + g2[L - 2]*y2)
+        y = forced + g1[None, :, None]*starts[:, None, 0] + g2[None, :, None]*starts[:, None, 1]
+        y = y.reshape(blocks*L, -1)[:n]
+        ye = np.concatenate([state[2:], y])
+        self.state[i] = np.array([xe[-2], xe[-1], ye[-2], ye[-1]])
+        return y
+
+    def process(self, batch):
+        x, flat = columns(batch)
+        if not len(x):
+            return np.empty((0,) if flat else (0, x.shape[1]))
+        if self.state is None:
+            self.initial_state(x[0])
+        start = self.phase(len(x))
+        for i in range(len(self.sections)):
+            x = self.section(i, x)
+        out = x[start::self.factor]
+        return out[:, 0] if flat else out
+
+class FilterChain(StreamFilter):
+    """
+    Stages applied in sequence, e.g. a BiquadFilter decimating 8 kHz to
+    1 kHz followed by a FIRFilter decimating to 200 Hz. The decimation
+    factor of the chain is the product of the factors of the stages.
+    """
+    def __init__(self, *stages, initial=None):
+        """
+        Method to initialize the FilterChain object.
+
+        Parameters
+        ----------
+        *stages : StreamFilter
+            Stages, in processing order.
+        initial : str, optional
+            "first" or "zero", see StreamFilter, set on all the stages.
+            The default is None, the initial state of each stage is kept.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.stages = stages
+        super().__init__(math.prod(stage.factor for stage in stages), "first" if initial is None else initial)
+        self.initial = initial
+        if initial is not None:
+            for stage in stages:
+                stage.initial = initial
+
+    def reset(self):
+        super().reset()
+        for stage in self.stages:
+            stage.reset()
+
+    def process(self, batch):
+        self.phase(len(batch))
+        for stage in self.stages:
+            batch = stage.process(batch)
+        return batch
+
+def decimator(rate, output_rate, cutoff=None, order=4):
+    """
+    Function to build an anti-alias low pass and decimation stage between
+    two sample rates.
+
+    Parameters
+    ----------
+    rate : float
+        Input sample rate in Hz, e.g. sensor.sr*1000.
+    output_rate : float
+        Output sample rate in Hz, rate/output_rate must be an integer.
+    cutoff : float, optional
+        Cutoff frequency in Hz. The default is None, 0.4*output_rate.
+    order : int, optional
+        Order of the Butterworth filter. The default is 4.
+
+    Returns
+    -------
+    BiquadFilter
+        The filter.
+
+    """
+    factor = rate/output_rate
+    if abs(factor - round(factor)) > 1e-9 or factor < 1:
+        raise ValueError(f"{rate} Hz is not an integer multiple of {output_rate} Hz")
+    cutoff = 0.4*output_rate if cutoff is None else cutoff
+    return BiquadFilter(butterworth_lowpass(cutoff, rate, order), factor=int(round(factor)))
@@ -0,0 +1,439 @@
+# -*- coding: utf-8 -*-
+"""
+Attitude estimation over sample batches: complementary, Mahony and
+Madgwick filters.
+"""
+
+# =============================================================================
+# ATTITUDE ESTIMATION
+# =============================================================================
+import abc
+import math
+
+import numpy as np
+
+def quaternion_to_euler(q):
+    """
+    Function to convert quaternions in roll, pitch and yaw (ZYX convention).
+
+    Parameters
+    ----------
+    q : numpy.ndarray
+        Quaternions w, x, y, z (N x 4).
+
+    Returns
+    -------
+    numpy.ndarray
+        Roll, pitch and yaw in º (N x 3).
+
+    """
+    q = np.atleast_2d(q)
+    w, x, y, z = q.T
+    roll = np.arctan2(2*(w*x + y*z), 1 - 2*(x*x + y*y))
+    pitch = np.arcsin(np.clip(2*(w*y - z*x), -1, 1))
+    yaw = np.arctan2(2*(w*z + x*y), 1 - 2*(y*y + z*z))
+    return np.degrees(np.stack([roll, pitch, yaw], axis=1))
+
+def euler_to_quaternion(angles):
+    """
+    Function to convert roll, pitch and yaw (ZYX convention) in quaternions.
+
+    Parameters
+    ----------
+    angles : numpy.ndarray
+        Roll, pitch and yaw in º (N x 3).
+
+    Returns
+    -------
+    numpy.ndarray
+        Quaternions w, x, y, z (N x 4).
+
+    """
+    half = np.radians(np.atleast_2d(angles))/2
+    cr, cp, cy = np.cos(half).T
+    sr, sp, sy = np.sin(half).T
+    return np.stack([
+        cr*cp*cy + sr*sp*sy,
+        sr*cp*cy - cr*sp*sy,
+        cr*sp*cy + sr*cp*sy,
+        cr*cp*sy - sr*sp*cy], axis=1)
+
+def tilt(accel):
+    """
+    Function to compute roll and pitch from the gravity measured by the accel.
+
+    Parameters
+    ----------
+    accel : numpy.ndarray
+        Accel (N x 3), any unit.
+
+    Returns
+    -------
+    numpy.ndarray
+        Roll and pitch in º (N x 2).
+
+    """
+    ax, ay, az = np.atleast_2d(accel).T
+    return np.degrees(np.stack([np.arctan2(ay, az), np.arctan2(-ax, np.hypot(ay, az))], axis=1))
+
+def heading(mag, roll, pitch):
+    """
+    Function to compute the tilt compensated heading.
+
+    Parameters
+    ----------
+    mag : numpy.ndarray
+        Magnetic field in the accel frame (N x 3), any unit.
+    roll : numpy.ndarray
+        Roll in º (N).
+    pitch : numpy.ndarray
+        Pitch in º (N).
+
+    Returns
+    -------
+    numpy.ndarray
+        Yaw in º (N).
+
+    """
+    mx, my, mz = np.atleast_2d(mag).T
+    r = np.radians(roll)
+    p = np.radians(pitch)
+    xh = mx*np.cos(p) + my*np.sin(r)*np.sin(p) + mz*np.cos(r)*np.sin(p)
+    yh = my*np.cos(r) - mz*np.sin(r)
+    return np.degrees(np.arctan2(-yh, xh))
+
+def samples(gyro, accel, dt, mag=None):
+    # common input handling: gyro in rad/s, dt as one value per sample
+    gyro = np.radians(np.atleast_2d(gyro))
+    accel = np.atleast_2d(accel)
+    dt = np.broadcast_to(np.asarray(dt, dtype=float), (len(gyro),))
+    if mag is not None:
+        mag = np.atleast_2d(mag)
+    return gyro, accel, dt, mag
+
+class AttitudeFilter(abc.ABC):
+    """
+    Base class of the attitude filters. Each call of update processes a
+    batch of samples and the state is carried to the next batch, so a stream
+    can be processed in chunks of any length. Subclasses implement update.
+
+    Attributes
+    ----------
+    q : numpy.ndarray
+        Last quaternion w, x, y, z.
+    """
+    def __init__(self, q=None):
+        self.q = np.array([1.0, 0.0, 0.0, 0.0]) if q is None else np.asarray(q, dtype=float)
+
+    def reset(self, q=None):
+        self.q = np.array([1.0, 0.0, 0.0, 0.0]) if q is None else np.asarray(q, dtype=float)
+
+    @abc.abstractmethod
+    def update(self, gyro, accel, dt, mag=None):
+        """
+        Function to process a batch of samples.
+
+        Parameters
+        ----------
+        gyro : numpy.ndarray
+            Gyro in º/s (N x 3).
+        accel : numpy.ndarray
+            Accel (N x 3), any unit.
+        dt : float or numpy.ndarray
+            Sample period in s, or time since the previous sample (N).
+        mag : numpy.ndarray, optional
+            Magnetic field in the accel frame (N x 3), any unit.
+            The default is None (no heading correction).
+
+        Returns
+        -------
+        numpy.ndarray
+            Quaternion after each sample (N x 4).
+
+        """
+
+    def euler(self):
+        return quaternion_to_euler(self.q)[0]
+
+class ComplementaryFilter(AttitudeFilter):
+    """
+    Complementary filter on roll, pitch and yaw:
+        angle = alpha*(angle + rate*dt) + (1 - alpha)*measured
+    with the angles measured by the accel (and the magnetometer for the yaw,
+    otherwise the yaw is the integrated gyro). The gyro rates are used as
+    Euler rates, which holds for small roll and pitch.
+    The recursion is linear, so it is solved in closed form on blocks of
+    samples with cumulative sums, without a Python loop per sample. The
+    blocks are shortened so that alpha**block does not underflow, and alpha
+    close to 0 falls back to the recursion sample by sample.
+    """
+    BLOCK = 128
+
+    def __init__(self, alpha=0.98, q=None):
+        super().__init__(q)
+        self.alpha = alpha
+        self.angles = quaternion_to_euler(self.q)[0]
+
+    def reset(self, q=None):
+        super().reset(q)
+        self.angles = quaternion_to_euler(self.q)[0]
+
+    def update(self, gyro, accel, dt, mag=None):
+        gyro, accel, dt, mag = samples(gyro, accel, dt, mag)
+        # without magnetometer the yaw has zero weight, but must be finite
+        measured = np.zeros((len(gyro), 3))
+        measured[:, 0:2] = tilt(accel)
+        if mag is not None:
+            measured[:, 2] = heading(mag, measured[:, 0], measured[:, 1])
+        # unwrap the measures around the state, so the mix never crosses +/-180
+        measured[0] = self.angles + (measured[0] - self.angles + 180) % 360 - 180
+        measured = np.degrees(np.unwrap(np.radians(measured), axis=0))
+        weight = np.full(3, 1 - self.alpha)
+        if mag is None:
+            weight[2] = 0
+        increments = np.degrees(gyro)*dt[:, None]
+        a = 1 - weight
+        u = a*increments + weight*measured
+
+        angles = np.empty((len(gyro), 3))
+        # blocks short enough to keep a^block above 1e-100, far from the
+        # underflow of a^k and the overflow of u/a^k
+        smallest = a.min()
+        if smallest**self.BLOCK > 1e-100:
+            block = self.BLOCK
+        elif smallest > 0:
+            block = int(-100/math.log10(smallest))
+        else:
+            block = 0
+        if block < 2:
+            for k in range(len(gyro)):
+                self.angles = a*self.angles + u[k]
+                angles[k] = self.angles
+        else:
+            for start in range(0, len(gyro), block):
+                stop = min(start + block, len(gyro))
+                # x[k] = a*x[k-1] + u[k] => x[k] = a^k*(x[0] + sum_j u[j]/a^j)
+                k = np.arange(1, stop - start + 1)[:, None]
+                power = a**k
+                angles[start:stop] = power*(self.angles + np.cumsum(u[start:stop]/power, axis=0))
+                self.angles = angles[stop - 1]
+        angles = (angles + 180) % 360 - 180
+        self.angles = angles[-1]
+        quaternions = euler_to_quaternion(angles)
+        self.q = quaternions[-1]
+        return quaternions
+
+class MahonyFilter(AttitudeFilter):
+    """
+    Mahony filter: the gyro is corrected by a PI controller on the error
+    between the measured and the estimated gravity (and magnetic field).
+    """
+    def __init__(self, kp=1.0, ki=0.0, q=None):
+        super().__init__(q)
+        self.kp = kp
+        self.ki = ki
+        self.integral = np.zeros(3)
+
+    def reset(self, q=None):
+        super().reset(q)
+        self.integral = np.zeros(3)
+
+    def update(self, gyro, accel, dt, mag=None):
+        gyro, accel, dt, mag = samples(gyro, accel, dt, mag)
+        n = len(gyro)
+        out = np.empty((n, 4))
+        q0, q1, q2, q3 = self.q.tolist()
+        ix, iy, iz = self.integral.tolist()
+        two_kp = 2*self.kp
+        two_ki = 2*self.ki
+        sqrt = math.sqrt
+        # plain floats are much faster than 3 element arrays in the loop
+        gyro = gyro.tolist()
+        accel = accel.tolist()
+        mags = mag.tolist() if mag is not None else None
+        dts = dt.tolist()
+        for i in range(n):
+            gx, gy, gz = gyro[i]
+            ax, ay, az = accel[i]
+            h = dts[i]
+            norm = sqrt(ax*ax + ay*ay + az*az)
+            if norm > 0:
+                ax /= norm
+                ay /= norm
+                az /= norm
+                q0q0 = q0*q0
+                q0q1 = q0*q1
+                q0q2 = q0*q2
+                q0q3 = q0*q3
+                q1q1 = q1*q1
+                q1q2 = q1*q2
+                q1q3 = q1*q3
+                q2q2 = q2*q2
+                q2q3 = q2*q3
+                q3q3 = q3*q3
+                # estimated gravity
+                vx = q1q3 - q0q2
+                vy = q0q1 + q2q3
+                vz = q0q0 - 0.5 + q3q3
+                ex = ay*vz - az*vy
+                ey = az*vx - ax*vz
+                ez = ax*vy - ay*vx
+                if mags is not None:
+                    mx, my, mz = mags[i]
+                    norm = sqrt(mx*mx + my*my + mz*mz)
+                    if norm > 0:
+                        mx /= norm
+                        my /= norm
+                        mz /= norm
+                        # reference field in the earth frame
+                        hx = 2*(mx*(0.5 - q2q2 - q3q3) + my*(q1q2 - q0q3) + mz*(q1q3 + q0q2))
+                        hy = 2*(mx*(q1q2 + q0q3) + my*(0.5 - q1q1 - q3q3) + mz*(q2q3 - q0q1))
+                        bx = sqrt(hx*hx + hy*hy)
+                        bz = 2*(mx*(q1q3 - q0q2) + my*(q2q3 + q0q1) + mz*(0.5 - q1q1 - q2q2))
+                        # estimated field
+                        wx = bx*(0.5 - q2q2 - q3q3) + bz*(q1q3 - q0q2)
+                        wy = bx*(q1q2 - q0q3) + bz*(q0q1 + q2q3)
+                        wz = bx*(q0q2 + q1q3) + bz*(0.5 - q1q1 - q2q2)
+                        ex += my*wz - mz*wy
+                        ey += mz*wx - mx*wz
+                        ez += mx*wy - my*wx
+                if two_ki > 0:
+                    ix += two_ki*ex*h
+                    iy += two_ki*ey*h
+                    iz += two_ki*ez*h
+                    gx += ix
+                    gy += iy
+                    gz += iz
+                gx += two_kp*ex
+                gy += two_kp*ey
+                gz += two_kp*ez
+            gx *= 0.5*h
+            gy *= 0.5*h
+            gz *= 0.5*h
+            q0, q1, q2, q3 = (
+                q0 - q1*gx - q2*gy - q3*gz,
+                q1 + q0*gx + q2*gz - q3*gy,
+                q2 + q0*gy - q1*gz + q3*gx,
+                q3 + q0*gz + q1*gy - q2*gx)
+            norm = sqrt(q0*q0 + q1*q1 + q2*q2 + q3*q3)
+            q0 /= norm
+            q1 /= norm
+            q2 /= norm
+            q3 /= norm
+            out[i] = q0, q1, q2, q3
+        self.integral = np.array([ix, iy, iz])
+        if n:
+            self.q = out[-1].copy()
+        return out
+
+class MadgwickFilter(AttitudeFilter):
+    """
+    Madgwick filter: the gyro integration is corrected by a gradient descent
+    step towards the orientation matching the gravity (and magnetic field).
+    """
+    def __init__(self, beta=0.1, q=None):
+        super().__init__(q)
+        self.beta = beta
+
+    def update(self, gyro, accel, dt, mag=None):
+        gyro, accel, dt, mag = samples(gyro, accel, dt, mag)
+        n = len(gyro)
+        out = np.empty((n, 4))
+        q0, q1, q2, q3 = self.q.tolist()
+        beta = self.beta
+        sqrt = math.sqrt
+        gyro = gyro.tolist()
+        accel = accel.tolist()
+        mags = mag.tolist() if mag is not None else None
+        dts = dt.tolist()
+        for i in range(n):
+            gx, gy, gz = gyro[i]
+            ax, ay, az = accel[i]
+            h = dts[i]
+            # rate of change of the quaternion from the gyro
+            d0 = 0.5*(-q1*gx - q2*gy - q3*gz)
+            d1 = 0.5*(q0*gx + q2*gz - q3*gy)
+            d2 = 0.5*(q0*gy - q1*gz + q3*gx)
+            d3 = 0.5*(q0*gz + q1*gy - q2*gx)
+            norm = sqrt(ax*ax + ay*ay + az*az)
+            m = mags[i] if mags is not None else None
+            if m is not None and not (m[0] or m[1] or m[2]):
+                m = None
+            if norm > 0:
+                ax /= norm
+                ay /= norm
+                az /= norm
+                if m is None:
+                    s0, s1, s2, s3 = self.step_imu(q0, q1, q2, q3, ax, ay, az)
+                else:
+                    mx, my, mz = m
+                    norm = sqrt(mx*mx + my*my + mz*mz)
+                    s0, s1, s2, s3 = self.step_marg(q0, q1, q2, q3, ax, ay, az, mx/norm, my/norm, mz/norm)
+                norm = sqrt(s0*s0 + s1*s1 + s2*s2 + s3*s3)
+                if norm > 0:
+                    d0 -= beta*s0/norm
+                    d1 -= beta*s1/norm
+                    d2 -= beta*s2/norm
+                    d3 -= beta*s3/norm
+            q0 += d0*h
+            q1 += d1*h
+            q2 += d2*h
+            q3 += d3*h
+            norm = sqrt(q0*q0 + q1*q1 + q2*q2 + q3*q3)
+            q0 /= norm
+            q1 /= norm
+            q2 /= norm
+            q3 /= norm
+            out[i] = q0, q1, q2, q3
+        if n:
+            self.q = out[-1].copy()
+        return out
+
+    @staticmethod
+    def step_imu(q0, q1, q2, q3, ax, ay, az):
+        # gradient of the gravity error
+        q0q0 = q0*q0
+        q1q1 = q1*q1
+        q2q2 = q2*q2
+        q3q3 = q3*q3
+        s0 = 4*q0*q2q2 + 2*q2*ax + 4*q0*q1q1 - 2*q1*ay
+        s1 = 4*q1*q3q3 - 2*q3*ax + 4*q0q0*q1 - 2*q0*ay - 4*q1 + 8*q1*q1q1 + 8*q1*q2q2 + 4*q1*az
+        s2 = 4*q0q0*q2 + 2*q0*ax + 4*q2*q3q3 - 2*q3*ay - 4*q2 + 8*q2*q1q1 + 8*q2*q2q2 + 4*q2*az
+        s3 = 4*q1q1*q3 - 2*q1*ax + 4*q2q2*q3 - 2*q2*ay
+        return s0, s1, s2, s3
+
+    @staticmethod
+    def step_marg(q0, q1, q2, q3, ax, ay, az, mx, my, mz):
+        # gradient of the gravity and magnetic field errors
+        q0q0 = q0*q0
+        q0q1 = q0*q1
+        q0q2 = q0*q2
+        q0q3 = q0*q3
+        q1q1 = q1*q1
+        q1q2 = q1*q2
+        q1q3 = q1*q3
+        q2q2 = q2*q2
+        q2q3 = q2*q3
+        q3q3 = q3*q3
+        hx = (mx*q0q0 - 2*q0*my*q3 + 2*q0*mz*q2 + mx*q1q1 + 2*q1*my*q2 + 2*q1*mz*q3
+              - mx*q2q2 - mx*q3q3)
+        hy = (2*q0*mx*q3 + my*q0q0 - 2*q0*mz*q1 + 2*q1*mx*q2 - my*q1q1 + my*q2q2
+              + 2*q2*mz*q3 - my*q3q3)
+        bx = math.sqrt(hx*hx + hy*hy)
+        bz = (-2*q0*mx*q2 + 2*q0*my*q1 + mz*q0q0 + 2*q1*mx*q3 - mz*q1q1 + 2*q2*my*q3
+              - mz*q2q2 + mz*q3q3)
+        # errors of gravity and field
+        fx = 2*(q1q3 - q0q2) - ax
+        fy = 2*(q0q1 + q2q3) - ay
+        fz = 1 - 2*(q1q1 + q2q2) - az
+        gx = bx*(1 - 2*(q2q2 + q3q3)) + 2*bz*(q1q3 - q0q2) - mx
+        gy = 2*bx*(q1q2 - q0q3) + 2*bz*(q0q1 + q2q3) - my
+        gz = 2*bx*(q0q2 + q1q3) + bz*(1 - 2*(q1q1 + q2q2)) - mz
+        # transposed jacobian times the errors
+        s0 = -2*q2*fx + 2*q1*fy - 2*bz*q2*gx + (-2*bx*q3 + 2*bz*q1)*gy + 2*bx*q2*gz
+        s1 = (2*q3*fx + 2*q0*fy - 4*q1*fz + 2*bz*q3*gx + (2*bx*q2 + 2*bz*q0)*gy
+              + (2*bx*q3 - 4*bz*q1)*gz)
+        s2 = (-2*q0*fx + 2*q3*fy - 4*q2*fz + (-4*bx*q2 - 2*bz*q0)*gx
+              + (2*bx*q1 + 2*bz*q3)*gy + (2*bx*q0 - 4*bz*q2)*gz)
+        s3 = 2*q1*fx + 2*q2*fy + (-4*bx*q3 + 2*bz*q1)*gx + (-2*bx*q0 + 2*bz*q2)*gy + 2*bx*q1*gz
+        return s0, s1, s2, s3
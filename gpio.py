@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Waiters on the interrupt pins of the sensors (e.g. Data Ready), through the
+Linux GPIO character device or a threading.Event.
+"""
+
+# =============================================================================
+# GPIO INTERRUPT UTILITIES
+# =============================================================================
+import threading
+
+try:
+    import gpiod
+    from gpiod.line import Edge
+except ImportError:
+    gpiod = None
+
+class GPIOInterrupt:
+    """
+    Waiter blocking on the edges of a GPIO line through the Linux GPIO
+    character device (requires the "gpiod" package, version 2).
+    """
+    def __init__(self, line, chip="/dev/gpiochip0", rising=True):
+        """
+        Method to initialize the GPIOInterrupt object.
+
+        Parameters
+        ----------
+        line : int
+            Offset of the GPIO line connected to the INT pin.
+        chip : str, optional
+            Path of the GPIO chip. The default is "/dev/gpiochip0".
+        rising : bool, optional
+            Wait for rising edges (active high INT pin), falling edges otherwise.
+            The default is True.
+
+        Returns
+        -------
+        None.
+
+        """
+        if gpiod is None:
+            raise ImportError("GPIOInterrupt requires the gpiod package (pip install gpiod)")
+        edge = Edge.RISING if rising else Edge.FALLING
+        self.request = gpiod.request_lines(
+            chip,
+            consumer="mpu6050_python_rpi",
+            config={line: gpiod.LineSettings(edge_detection=edge)})
+
+    def wait(self, timeout=None):
+        """
+        Function to block until the next edge of the line.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Maximum waiting time in seconds. The default is None (no timeout).
+
+        Returns
+        -------
+        bool
+            True if an edge arrived, False on timeout.
+
+        """
+        if not self.request.wait_edge_events(timeout):
+            return False
+        self.request.read_edge_events()
+        return True
+
+    def close(self):
+        """
+        Function to release the GPIO line.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.request.release()
+
+class EventInterrupt:
+    """
+    Waiter driven from software by calling trigger(), used in place of
+    GPIOInterrupt by simulated devices and tests.
+    """
+    def __init__(self):
+        self.event = threading.Event()
+
+    def trigger(self):
+        """
+        Function to signal a new interrupt.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.event.set()
+
+    def wait(self, timeout=None):
+        """
+        Function to block until the next call of trigger().
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Maximum waiting time in seconds. The default is None (no timeout).
+
+        Returns
+        -------
+        bool
+            True if an interrupt arrived, False on timeout.
+
+        """
+        if not self.event.wait(timeout):
+            return False
+        self.event.clear()
+        return True
+
+    def close(self):
+        pass
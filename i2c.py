@@ -8,10 +8,17 @@ Created on Thu Feb 22 21:58:57 2024
 # =============================================================================
 # I2C BUS COMMUNICATION UTILITIES
 # =============================================================================
+import bisect
+import json
+import threading
+import time
+
 import smbus2
 
 class I2CInterface:
-    def __init__(self, bus_number):
+    BLOCK_SIZE = 32
+
+    def __init__(self, bus_number, bus=None):
         """
         Method to initialize the I2CInterface object.
 
@@ -19,13 +26,40 @@ class I2CInterface:
         ----------
         bus_number : int 1
             bus number.
+        bus : object, optional
+            Bus backend with the smbus2.SMBus methods (e.g. a SimulatedBus).
+            The default is None, which opens /dev/i2c-<bus_number>.
 
         Returns
         -------
         None.
 
         """
-        self.bus = smbus2.SMBus(bus_number)
+        self.bus_number = bus_number
+        self.bus = smbus2.SMBus(bus_number) if bus is None else bus
+        self.stats = None
+
+    def instrument(self, enabled=True):
+        """
+        Function to enable or disable the transaction statistics.
+        When disabled each transaction costs a single attribute check.
+
+        Parameters
+        ----------
+        enabled : bool, optional
+            Collect the statistics. The default is True.
+
+        Returns
+        -------
+        I2CStats or None
+            Statistics of the bus, see I2CStats.
+
+        """
+        if not enabled:
+            self.stats = None
+        elif self.stats is None:
+            self.stats = I2CStats(self.bus_number)
+        return self.stats
 
     def read_byte(self, address, register):
         """
@@ -44,7 +78,9 @@ class I2CInterface:
             Value of the red byte in decimal.
 
         """
-        return self.bus.read_byte_data(address, register)
+        if self.stats is None:
+            return self.bus.read_byte_data(address, register)
+        return self.stats.call("read", address, register, 1, self.bus.read_byte_data, address, register)
 
     def write_byte(self, address, register, value):
         """
@@ -64,8 +100,74 @@ class I2CInterface:
         None.
 
         """
-        self.bus.write_byte_data(address, register, value)
-        
+        if self.stats is None:
+            self.bus.write_byte_data(address, register, value)
+        else: self.stats.call("write", address, register, 1, self.bus.write_byte_data, address, register, value)
+
+    def read_block(self, address, register, length, increment=True):
+        """
+        The function read a block of consecutive registers.
+        The device auto-increments the register pointer, so the whole block
+        is transferred in a single I2C transaction (SMBus blocks are limited to
+        32 bytes, longer reads are split in 32-byte chunks).
+
+        Parameters
+        ----------
+        address : hex
+            Address of the device as an hex number.
+        register : hex
+            Address of the first register to read.
+        length : int
+            Number of bytes to read.
+        increment : bool, optional
+            False when reading a FIFO port that does not auto-increment
+            between chunks. The default is True.
+
+        Returns
+        -------
+        bytes
+            Values of the red registers.
+
+        """
+        read = self.bus.read_i2c_block_data
+        if self.stats is not None:
+            read = self.stats.wrap("read", read)
+        if length <= self.BLOCK_SIZE:
+            return bytes(read(address, register, length))
+        data = bytearray()
+        while len(data) < length:
+            chunk = min(self.BLOCK_SIZE, length - len(data))
+            data += bytes(read(address, register, chunk))
+            if increment:
+                register += chunk
+        return bytes(data)
+
+    def write_block(self, address, register, data):
+        """
+        The function write a block of consecutive registers in a single I2C
+        transaction (longer blocks are split in 32-byte chunks).
+
+        Parameters
+        ----------
+        address : hex
+            Address of the device as an hex number.
+        register : hex
+            Address of the first register to write.
+        data : list or bytes
+            Values to write.
+
+        Returns
+        -------
+        None.
+
+        """
+        write = self.bus.write_i2c_block_data
+        if self.stats is not None:
+            write = self.stats.wrap("write", write)
+        data = list(data)
+        for start in range(0, len(data), self.BLOCK_SIZE):
+            write(address, register + start, data[start:start + self.BLOCK_SIZE])
+
     def int_to_binary_string(self, number, length):
         """
         Utility function to transform an integer in a bit string.
@@ -150,34 +252,287 @@ class I2CInterface:
         combined_value = (high_bits << num_bits) | low_bits
       
         return combined_value
-    
-    def modify_bit_string(self, original_string, new_string, position):
+
+class I2CStats:
+    """
+    Statistics of the transactions of one bus: count, bytes, errors and a
+    latency histogram with fixed buckets, for each device address,
+    register and direction.
+    """
+    # upper bounds of the latency buckets in us, the last one is +Inf
+    BUCKETS_US = (10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000)
+
+    def __init__(self, bus_number=None):
+        self.bus_number = bus_number
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def record(self, op, address, register, length, latency_ns, error=False):
+        """
+        Function to record one transaction.
+
+        Parameters
+        ----------
+        op : str
+            "read" or "write".
+        address : hex
+            Address of the device.
+        register : hex
+            First register of the transaction.
+        length : int
+            Number of data bytes.
+        latency_ns : int
+            Duration of the transaction in ns.
+        error : bool, optional
+            The transaction failed. The default is False.
+
+        Returns
+        -------
+        None.
+
         """
-        Function to modify a portion of bits in a bit string
-        Example: original string = "00000"
-                new string = "11"
-                position = 2
-                Result = "00110"
+        bucket = bisect.bisect_left(self.BUCKETS_US, latency_ns/1000)
+        key = (address, register, op)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                # transactions, bytes, errors, latency sum (ns), histogram
+                entry = self.entries[key] = [0, 0, 0, 0, [0]*(len(self.BUCKETS_US) + 1)]
+            entry[0] += 1
+            entry[3] += latency_ns
+            entry[4][bucket] += 1
+            if error:
+                entry[2] += 1
+            else: entry[1] += length
+
+    def call(self, op, address, register, length, func, *args):
+        start = time.perf_counter_ns()
+        try:
+            result = func(*args)
+        except OSError:
+            self.record(op, address, register, length, time.perf_counter_ns() - start, True)
+            raise
+        self.record(op, address, register, length, time.perf_counter_ns() - start)
+        return result
+
+    def wrap(self, op, func):
+        # block transfer function (address, register, data or length) recorded
+        def transfer(address, register, data):
+            length = data if isinstance(data, int) else len(data)
+            return self.call(op, address, register, length, func, address, register, data)
+        return transfer
+
+    def snapshot(self, reset=False):
+        """
+        Function to get a copy of the statistics.
+
+        Parameters
+        ----------
+        reset : bool, optional
+            Clear the statistics after the copy. The default is False.
+
+        Returns
+        -------
+        dict
+            "buckets_us", "devices" with the totals of each address and
+            "registers" with the entries of each address, register and
+            direction. Each entry has transactions, bytes, errors, latency_us
+            (sum) and histogram (count of each bucket, the last is +Inf).
+
+        """
+        with self.lock:
+            entries = {key : [entry[0], entry[1], entry[2], entry[3], list(entry[4])]
+                       for key, entry in self.entries.items()}
+            if reset:
+                self.entries = {}
+        devices = {}
+        registers = {}
+        for (address, register, op), (count, length, errors, latency, histogram) in sorted(entries.items()):
+            values = {
+                "transactions" : count,
+                "bytes" : length,
+                "errors" : errors,
+                "latency_us" : latency/1000,
+                "histogram" : histogram}
+            registers.setdefault(f"{address:#04x}", {}).setdefault(f"{register:#04x}", {})[op] = values
+            total = devices.setdefault(f"{address:#04x}", {
+                "transactions" : 0, "bytes" : 0, "errors" : 0, "latency_us" : 0.0,
+                "histogram" : [0]*len(histogram)})
+            for name in ("transactions", "bytes", "errors", "latency_us"):
+                total[name] += values[name]
+            total["histogram"] = [a + b for a, b in zip(total["histogram"], histogram)]
+        return {"bus" : self.bus_number, "buckets_us" : list(self.BUCKETS_US), "devices" : devices, "registers" : registers}
+
+    def reset(self):
+        with self.lock:
+            self.entries = {}
+
+    def to_json(self, reset=False):
+        return json.dumps(self.snapshot(reset))
+
+    def to_prometheus(self, prefix="i2c"):
+        """
+        Function to export the statistics in the Prometheus text format.
 
         Parameters
         ----------
-        original_string : str
-            original bit string.
-        new_string : str
-            bit string to modify.
-        position : int
-            position of the first bit to modify in the original_string.
+        prefix : str, optional
+            Prefix of the metric names. The default is "i2c".
 
         Returns
         -------
         str
-            modified bit string.
+            Counters of transactions, bytes and errors and latency histograms,
+            labelled by bus, address, register and op.
 
         """
-        if position < 0 or position >= len(original_string):
-            print("Invalid position.")
-        elif position + len(new_string) > len(original_string):
-            print("Invalid length")
-        else:
-            return original_string[:position] + new_string + original_string[position + len(new_string):]
+        snapshot = self.snapshot()
+        bounds = [f"{bound/1e6:g}" for bound in self.BUCKETS_US] + ["+Inf"]
+        counters = [
+            ("transactions", "transactions_total", "I2C transactions."),
+            ("bytes", "bytes_total", "I2C data bytes transferred."),
+            ("errors", "errors_total", "Failed I2C transactions.")]
+        lines = []
+        rows = [(address, register, op, values)
+                for address, by_register in snapshot["registers"].items()
+                for register, by_op in by_register.items()
+                for op, values in by_op.items()]
+        for key, name, text in counters:
+            lines += [f"# HELP {prefix}_{name} {text}", f"# TYPE {prefix}_{name} counter"]
+            for address, register, op, values in rows:
+                labels = f'bus="{self.bus_number}",address="{address}",register="{register}",op="{op}"'
+                lines.append(f"{prefix}_{name}{{{labels}}} {values[key]}")
+        name = f"{prefix}_latency_seconds"
+        lines += [f"# HELP {name} I2C transaction latency.", f"# TYPE {name} histogram"]
+        for address, register, op, values in rows:
+            labels = f'bus="{self.bus_number}",address="{address}",register="{register}",op="{op}"'
+            cumulative = 0
+            for bound, count in zip(bounds, values["histogram"]):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {values['latency_us']/1e6:g}")
+            lines.append(f"{name}_count{{{labels}}} {values['transactions']}")
+        return "\n".join(lines) + "\n"
+
+class BitField:
+    """
+    Descriptor of a bit or a group of contiguous bits in a register.
+    
+    Attributes
+    ----------
+    register : hex
+        Address of the register holding the field.
+    offset : int
+        Position of the least significant bit of the field (bit 0 is the LSB
+        of the register, as in the datasheets).
+    width : int
+        Number of bits of the field.
+    values : dict
+        Optional mapping from the values of the field to the bit codes.
+    mask : int
+        Mask of the field in the register.
+    """
+    def __init__(self, register, offset, width=1, values=None):
+        self.register = register
+        self.offset = offset
+        self.width = width
+        self.values = values
+        self.codes = None if values is None else {code : value for value, code in values.items()}
+        self.mask = ((1 << width) - 1) << offset
+
+    def encode(self, value):
+        """
+        Function to encode a value in the position of the field.
+
+        Parameters
+        ----------
+        value : int or key of values
+            Value of the field.
+
+        Raises
+        ------
+        ValueError
+            If the value is not valid for the field.
+
+        Returns
+        -------
+        int
+            Value shifted in the position of the field.
+
+        """
+        if self.values is not None:
+            if value not in self.values:
+                raise ValueError(f"Invalid value {value!r}, valid values are {list(self.values)}")
+            value = self.values[value]
+        value = int(value)
+        if value < 0 or value >> self.width:
+            raise ValueError(f"Invalid value {value}, the field is {self.width} bit wide")
+        return value << self.offset
+
+    def decode(self, data):
+        """
+        Function to extract the value of the field from a register value.
+
+        Parameters
+        ----------
+        data : int
+            Value of the register.
+
+        Returns
+        -------
+        int or key of values
+            Value of the field.
+
+        """
+        code = (data & self.mask) >> self.offset
+        if self.codes is None:
+            return code
+        return self.codes.get(code, code)
+
+    def insert(self, data, value):
+        """
+        Function to replace the field in a register value.
+
+        Parameters
+        ----------
+        data : int
+            Value of the register.
+        value : int or key of values
+            New value of the field.
+
+        Returns
+        -------
+        int
+            Modified value of the register.
+
+        """
+        return (data & ~self.mask) | self.encode(value)
+
+def pack(values, data=0):
+    """
+    Utility function to pack several fields of the same register in one byte.
+
+    Parameters
+    ----------
+    values : dict
+        Mapping from BitField to the value of the field.
+    data : int, optional
+        Value of the bits not covered by the fields. The default is 0.
+
+    Raises
+    ------
+    ValueError
+        If the fields belong to different registers.
+
+    Returns
+    -------
+    int
+        Value of the register.
 
+    """
+    registers = {field.register for field in values}
+    if len(registers) > 1:
+        raise ValueError("Fields of different registers can not be packed together")
+    for field, value in values.items():
+        data = field.insert(data, value)
+    return data
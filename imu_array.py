@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Two MPU6050 on one bus (0x68 and 0x69) configured alike and read with
+aligned timestamps.
+"""
+
+# =============================================================================
+# SYNCHRONIZED MPU6050 ARRAY
+# =============================================================================
+import time
+
+import numpy as np
+
+from MPU6050.register_map import RegisterMap
+
+class MPU6050Array:
+    """
+    Group of MPU6050s (e.g. AD0 low and high, 0x68 and 0x69, on each bus)
+    configured identically and sampled back-to-back in the same slot.
+
+    Attributes
+    ----------
+    sensors : list
+        MPU6050 objects of the array.
+    """
+    def __init__(self, sensors):
+        self.sensors = list(sensors)
+        self.reads = [(sensor.i2c.read_block, sensor.address) for sensor in self.sensors]
+        self.frame = bytearray(RegisterMap.MOTION_LENGTH*len(self.sensors))
+
+    def configure(self, divider=0, dlpf=1, fs_sel=0, afs_sel=0, rate=None, bandwidth=None):
+        """
+        Function to wake up the sensors and apply the same sample rate, DLPF
+        and full scale ranges to all of them, with the setters of MPU6050.
+
+        Parameters
+        ----------
+        divider : int, optional
+            SMPLRT_DIV, see MPU6050.sample_rate_set. The default is 0.
+        dlpf : int, optional
+            DLPF_CFG. The default is 1.
+        fs_sel : int, optional
+            FS_SEL of the gyro. The default is 0.
+        afs_sel : int, optional
+            AFS_SEL of the accel. The default is 0.
+        rate : float, optional
+            Target sample rate in Hz, see MPU6050.output_rate_set, replacing
+            divider and dlpf. The default is None.
+        bandwidth : float, optional
+            Minimum bandwidth in Hz with rate. The default is None.
+
+        Returns
+        -------
+        None.
+
+        """
+        for sensor in self.sensors:
+            sensor.hold_changes()
+            sensor.field_set(RegisterMap.SLEEP, 0)
+            sensor.field_set(RegisterMap.FS_SEL, fs_sel)
+            sensor.field_set(RegisterMap.AFS_SEL, afs_sel)
+            if rate is None:
+                sensor.field_set(RegisterMap.DLPF_CFG, dlpf)
+                sensor.sample_rate_set(divider)
+            else: sensor.output_rate_set(rate, bandwidth)
+            sensor.apply_changes()
+            sensor.gyro_config_get()
+            sensor.accel_config_get()
+
+    def read(self, n=1, rate=None, out=None):
+        """
+        Function to read n samples of every sensor. In each slot the sensors
+        are red back-to-back with one burst read each and decoded together.
+
+        Parameters
+        ----------
+        n : int, optional
+            Number of samples. The default is 1.
+        rate : float, optional
+            Slot rate in Hz, the slots are scheduled on absolute deadlines.
+            The default is None (as fast as possible).
+        out : tuple, optional
+            Preallocated data (devices x n x 7, int16) and timestamps
+            (devices x n, int64) arrays. The default is None.
+
+        Returns
+        -------
+        data : numpy.ndarray
+            Raw samples (devices x n x 7), columns as RegisterMap.MOTION_COLUMNS.
+        timestamps : numpy.ndarray
+            time.monotonic_ns() at the middle of each read (devices x n).
+
+        """
+        devices = len(self.sensors)
+        if out is None:
+            data = np.empty((devices, n, 7), dtype=np.int16)
+            timestamps = np.empty((devices, n), dtype=np.int64)
+        else:
+            data, timestamps = out
+        frame = self.frame
+        length = RegisterMap.MOTION_LENGTH
+        clock = time.monotonic_ns
+        reads = self.reads
+
+        deadline = time.monotonic()
+        for j in range(n):
+            for i, (read_block, address) in enumerate(reads):
+                t0 = clock()
+                frame[i*length:(i + 1)*length] = read_block(address, RegisterMap.ACCEL_XOUT_H, length)
+                timestamps[i, j] = (t0 + clock())//2
+            data[:, j] = np.frombuffer(frame, dtype=">i2").reshape(devices, 7)
+            if rate is not None:
+                deadline += 1/rate
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+        return data, timestamps
+
+    def scale(self, data):
+        """
+        Function to convert raw samples in g, ºC and º/s with the full scale
+        range of each sensor.
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+            Raw samples (devices x n x 7).
+
+        Returns
+        -------
+        numpy.ndarray
+            Scaled samples (devices x n x 7).
+
+        """
+        scale = np.empty((len(self.sensors), 1, 7))
+        offset = np.zeros((1, 1, 7))
+        for i, sensor in enumerate(self.sensors):
+            scale[i, 0, 0:3] = 1/sensor.accel_fs
+            scale[i, 0, 4:7] = 1/sensor.gyro_fs
+        scale[:, 0, 3] = 1/340
+        offset[0, 0, 3] = 36.53
+        return data*scale + offset
+
+    def host_skew(self, timestamps):
+        """
+        Function to measure the skew of the host read times of each sensor
+        with respect to the first one of the array. The timestamps are taken
+        by the host around each burst read, so this is the spread of the
+        reads within a slot, not the skew of the sample clocks of the
+        devices (see timing.SampleClock).
+
+        Parameters
+        ----------
+        timestamps : numpy.ndarray
+            Timestamps returned by read (devices x n).
+
+        Returns
+        -------
+        dict
+            Per-device mean and max skew in us.
+
+        """
+        skew = (timestamps - timestamps[0])/1000
+        return {
+            "mean_us" : skew.mean(axis=1),
+            "max_us" : np.abs(skew).max(axis=1)}
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel acquisition on several I2C buses, one worker per bus writing in a
+shared memory ring.
+"""
+
+# =============================================================================
+# MULTI-BUS ACQUISITION
+# =============================================================================
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from i2c import I2CInterface
+from MPU6050.mpu6050 import MPU6050
+from MPU6050.register_map import RegisterMap
+from HMC5883L.hmc5883l import HMC5883L
+
+# class and columns of each supported sensor, both red with read_raw
+SENSORS = {
+    "mpu6050" : [MPU6050, list(RegisterMap.MOTION_COLUMNS)],
+    "hmc5883l" : [HMC5883L, ["mag_x", "mag_y", "mag_z"]]}
+
+class BusSpec:
+    """
+    Description of the sensors of one I2C bus, sent to its worker.
+    All the attributes must be picklable when the workers are processes
+    (functions defined at module level, functools.partial...).
+
+    Attributes
+    ----------
+    bus_number : int
+        Number of the bus (/dev/i2c-<bus_number>).
+    sensors : list
+        (kind, address) of the sensors, kind is "mpu6050" or "hmc5883l".
+    setup : callable
+        Optional function called in the worker with the list of sensor
+        objects, to configure them before the acquisition.
+    bus_factory : callable
+        Optional function returning the bus backend (e.g. a SimulatedBus).
+    """
+    def __init__(self, bus_number, sensors, setup=None, bus_factory=None):
+        self.bus_number = bus_number
+        self.sensors = list(sensors)
+        self.setup = setup
+        self.bus_factory = bus_factory
+
+    def columns(self):
+        return [f"{kind}_{address:#x}_{name}" for kind, address in self.sensors for name in SENSORS[kind][1]]
+
+class SharedRing:
+    """
+    Ring of int16 frames and int64 timestamps in shared memory, written by
+    one worker and red by the parent without copies through pipes.
+    The header holds the number of written frames and of bus errors.
+    """
+    def __init__(self, capacity, width, name=None):
+        size = 16 + 8*capacity + 2*capacity*width
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.capacity = capacity
+        self.width = width
+        buffer = self.shm.buf
+        self.header = np.ndarray(2, dtype=np.int64, buffer=buffer)
+        self.timestamps = np.ndarray(capacity, dtype=np.int64, buffer=buffer, offset=16)
+        self.frames = np.ndarray((capacity, width), dtype=np.int16, buffer=buffer, offset=16 + 8*capacity)
+        if name is None:
+            self.header[:] = 0
+
+    def write(self, timestamp, frame):
+        head = int(self.header[0])
+        self.timestamps[head % self.capacity] = timestamp
+        self.frames[head % self.capacity] = frame
+        # the frame is complete before the reader can see it
+        self.header[0] = head + 1
+
+    def read(self, cursor):
+        """
+        Function to copy the frames written after a cursor.
+
+        Parameters
+        ----------
+        cursor : int
+            Number of frames already red.
+
+        Returns
+        -------
+        tuple
+            timestamps (n), frames (n x width), new cursor and number of
+            frames lost because they were overwritten.
+
+        """
+        head = int(self.header[0])
+        start = max(cursor, head - self.capacity)
+        index = np.arange(start, head) % self.capacity
+        timestamps = self.timestamps[index]
+        frames = self.frames[index]
+        # frames overwritten by the worker during the copy are discarded,
+        # with the one whose slot may be in writing (frame header[0])
+        valid = min(max(int(self.header[0]) + 1 - self.capacity - start, 0), head - start)
+        lost = start - cursor + valid
+        return timestamps[valid:], frames[valid:], head, lost
+
+    def close(self, unlink=False):
+        self.header = self.timestamps = self.frames = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+def bus_worker(spec, ring_name, capacity, rate, stop_event, start):
+    """
+    Acquisition loop of one bus: every 1/rate seconds each sensor is red with
+    a burst read and the concatenated frame is written in the shared ring.
+    The reads are on the slots start + k/rate shared by all the workers, a
+    late worker skips the missed slots instead of shifting its phase.
+
+    Parameters
+    ----------
+    spec : BusSpec
+        Sensors of the bus.
+    ring_name : str
+        Name of the shared memory of the ring.
+    capacity : int
+        Number of frames of the ring.
+    rate : float
+        Read rate in Hz.
+    stop_event : Event
+        Event stopping the loop.
+    start : int
+        time.monotonic_ns() of the slot 0.
+
+    Returns
+    -------
+    None.
+
+    """
+    bus = spec.bus_factory() if spec.bus_factory is not None else None
+    i2c = I2CInterface(spec.bus_number, bus=bus)
+    sensors = [SENSORS[kind][0](address, i2c=i2c) for kind, address in spec.sensors]
+    reads = [sensor.read_raw for sensor in sensors]
+    if spec.setup is not None:
+        spec.setup(sensors)
+
+    width = len(spec.columns())
+    ring = SharedRing(capacity, width, name=ring_name)
+    frame = np.empty(width, dtype=np.int16)
+    period = int(round(1e9/rate))
+    slot = max(-(-(time.monotonic_ns() - start)//period), 0)
+    try:
+        while not stop_event.wait(max(start + slot*period - time.monotonic_ns(), 0)/1e9):
+            try:
+                i = 0
+                t0 = time.monotonic_ns()
+                for read in reads:
+                    raw = read()
+                    frame[i:i + len(raw)] = raw
+                    i += len(raw)
+                ring.write((t0 + time.monotonic_ns())//2, frame)
+            except OSError:
+                ring.header[1] += 1
+            slot = max(slot + 1, -(-(time.monotonic_ns() - start)//period))
+    finally:
+        ring.close()
+
+class MultiBusAcquisition:
+    """
+    Coordinator running one acquisition worker per I2C bus, as processes or
+    threads, and collecting their frames through shared memory.
+    The workers read on common slots (multiples of 1/rate from the start),
+    read merges the frames of the buses slot by slot in one batch.
+    """
+    def __init__(self, specs, rate=100, capacity=4096, mode="process", latency=0.1):
+        """
+        Method to initialize the MultiBusAcquisition object.
+
+        Parameters
+        ----------
+        specs : list
+            BusSpec of each bus.
+        rate : float, optional
+            Read rate of every bus in Hz. The default is 100.
+        capacity : int, optional
+            Number of frames of each shared ring. The default is 4096.
+        mode : str, optional
+            "process" or "thread". Processes run the buses in parallel on
+            several cores, threads avoid the start-up cost. The default is "process".
+        latency : float, optional
+            Maximum waiting time in seconds for the frames of a slow bus, its
+            missing frames are then NaN in the merged batches. The default is 0.1.
+
+        Returns
+        -------
+        None.
+
+        """
+        if mode not in ("process", "thread"):
+            raise ValueError(f"Invalid mode {mode!r}")
+        self.specs = list(specs)
+        self.rate = rate
+        self.capacity = capacity
+        self.mode = mode
+        self.latency = latency
+        self.period = int(round(1e9/rate))
+        self.rings = []
+        self.workers = []
+        self.cursors = []
+        self.pending = []
+        self.lost = [0]*len(self.specs)
+        self.stop_event = None
+        self.start_time = None
+        self.next_slot = None
+        self.pending = []
+
+    def columns(self):
+        """
+        Function to get the columns of the merged batches.
+
+        Returns
+        -------
+        list
+            Columns of every bus, in the order of the specs.
+
+        """
+        return [column for spec in self.specs for column in spec.columns()]
+
+    def start(self):
+        """
+        Function to create the shared rings and start the workers.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.mode == "process":
+            context = multiprocessing.get_context("spawn")
+            self.stop_event = context.Event()
+            worker = context.Process
+        else:
+            self.stop_event = threading.Event()
+            worker = threading.Thread
+        # slot 0 after the start of the workers, the late ones skip slots
+        self.start_time = time.monotonic_ns() + int(self.latency*1e9)
+        self.next_slot = None
+        for spec in self.specs:
+            ring = SharedRing(self.capacity, len(spec.columns()))
+            self.rings.append(ring)
+            self.cursors.append(0)
+            self.pending.append((np.empty(0, dtype=np.int64), np.empty((0, len(spec.columns())), dtype=np.int16)))
+            self.workers.append(worker(
+                target=bus_worker,
+                args=(spec, ring.shm.name, self.capacity, self.rate, self.stop_event, self.start_time),
+                name=f"i2c-{spec.bus_number}",
+                daemon=True))
+        for worker in self.workers:
+            worker.start()
+
+    def read_buses(self):
+        """
+        Function to collect the frames written by every worker since the
+        previous call, bus by bus. The cursors are those of read, so use
+        only one of the two.
+
+        Returns
+        -------
+        dict
+            (timestamps, frames) of each bus number, the columns of the frames
+            are given by BusSpec.columns().
+
+        """
+        batches = {}
+        for i, (spec, ring) in enumerate(zip(self.specs, self.rings)):
+            timestamps, frames, self.cursors[i], lost = ring.read(self.cursors[i])
+            self.lost[i] += lost
+            batches[spec.bus_number] = (timestamps, frames)
+        return batches
+
+    def read(self):
+        """
+        Function to collect the frames written by every worker since the
+        previous call, merged by slot. The batches start at the first slot
+        red by every bus, then a slot is returned once every bus has written
+        a later frame, or after the latency; the frames of a bus missing in a
+        slot (bus errors, lost frames) are NaN.
+
+        Returns
+        -------
+        timestamps : numpy.ndarray
+            time.monotonic_ns() of the slots (n).
+        data : numpy.ndarray
+            Raw values of every bus (n x columns), see columns().
+
+        """
+        now = (time.monotonic_ns() - self.start_time - int(self.latency*1e9))//self.period
+        for i, ring in enumerate(self.rings):
+            timestamps, frames, self.cursors[i], lost = ring.read(self.cursors[i])
+            self.lost[i] += lost
+            slots = np.rint((timestamps - self.start_time)/self.period).astype(np.int64)
+            self.pending[i] = (np.concatenate([self.pending[i][0], slots]), np.concatenate([self.pending[i][1], frames]))
+        if self.next_slot is None:
+            if not all(len(slots) for slots, frames in self.pending):
+                return np.empty(0, dtype=np.int64), np.empty((0, len(self.columns())))
+            self.next_slot = max(slots[0] for slots, frames in self.pending)
+        ready = min(slots[-1] if len(slots) else self.next_slot - 1 for slots, frames in self.pending)
+        ready = max(ready, now)
+        n = max(ready - self.next_slot + 1, 0)
+        data = np.full((n, len(self.columns())), np.nan)
+        column = 0
+        for i, (slots, frames) in enumerate(self.pending):
+            done = slots <= ready
+            rows = slots[done] - self.next_slot
+            valid = rows >= 0
+            data[rows[valid], column:column + frames.shape[1]] = frames[done][valid]
+            self.pending[i] = (slots[~done], frames[~done])
+            column += frames.shape[1]
+        timestamps = self.start_time + self.period*np.arange(self.next_slot, self.next_slot + n)
+        self.next_slot += n
+        return timestamps, data
+
+    def errors(self):
+        return {spec.bus_number : int(ring.header[1]) for spec, ring in zip(self.specs, self.rings)}
+
+    def stop(self):
+        """
+        Function to stop the workers and release the shared memory.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.stop_event is not None:
+            self.stop_event.set()
+        for worker in self.workers:
+            worker.join()
+        for ring in self.rings:
+            ring.close(unlink=True)
+        self.rings = []
+        self.workers = []
+        self.cursors = []
+        self.pending = []
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only binary recording of sample batches, with a JSON header and a
+numpy memmap reader.
+"""
+
+# =============================================================================
+# BINARY RECORDING
+# =============================================================================
+import json
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+from MPU6050.calibration import CalibrationProfile
+from MPU6050.register_map import RegisterMap
+
+# File layout:
+#   MAGIC (8 bytes), header length (uint32 little endian), JSON header padded
+#   with spaces to a multiple of ALIGN bytes, fixed-width records.
+# The records are the raw big-endian int16 words of the sensor, optionally
+# preceded by an int64 time.monotonic_ns() timestamp.
+MAGIC = b"MPUREC01"
+ALIGN = 64
+
+def record_dtype(columns, timestamps=False):
+    fields = [("t", "<i8")] if timestamps else []
+    return np.dtype(fields + [(name, ">i2") for name in columns])
+
+def sensor_header(sensor, columns=None):
+    """
+    Function to build the header of a recording of a MPU6050: columns,
+    scale and offset to physical units (calibration excluded), sample rate,
+    configuration registers and calibration profile, applied by
+    Recording.scaled.
+    The configuration is the shadow copy, pending changes included: only
+    the registers missing from it are red from the device.
+
+    Parameters
+    ----------
+    sensor : MPU6050
+        Sensor, with full scale ranges and sample rate known.
+    columns : list, optional
+        Names of the recorded columns. The default is the FIFO channels if
+        configured, otherwise RegisterMap.MOTION_COLUMNS.
+
+    Returns
+    -------
+    dict
+        Header fields, see Recorder.
+
+    """
+    if columns is None:
+        columns = sensor.fifo_channels or RegisterMap.MOTION_COLUMNS
+    columns = list(columns)
+    # scaling a zero and a unit sample gives the offset and scale of each column
+    profile, sensor.calibration = sensor.calibration, None
+    try:
+        points = sensor.fifo_scale(np.array([[0]*len(columns), [1]*len(columns)]), columns)
+    finally:
+        sensor.calibration = profile
+    config = {register : sensor.register_get(register) for register in sorted(RegisterMap.SHADOW_REGISTERS)}
+    return {
+        "columns" : columns,
+        "scale" : (points[1] - points[0]).tolist(),
+        "offset" : points[0].tolist(),
+        "sample_rate" : sensor.sr*1000,
+        "device" : {"bus" : sensor.i2c.bus_number, "address" : sensor.address},
+        "config" : {f"{register:#04x}" : value for register, value in config.items()},
+        "calibration" : profile.to_dict() if profile is not None else None}
+
+class Recorder:
+    """
+    Append-only recorder of raw samples. The batches passed to write are
+    queued and a writer thread copies them in a preallocated chunk, written
+    to the file when full, so the acquisition thread never waits for the disk.
+    If the writer fails, the following batches are discarded and the error
+    is raised by write and close.
+
+    Attributes
+    ----------
+    count : int
+        Number of records written to the file.
+    error : Exception
+        Error of the writer thread, None while it works.
+    """
+    def __init__(self, path, columns, scale=None, offset=None, sample_rate=None,
+                 timestamps=False, chunk=65536, queue_size=256, **metadata):
+        """
+        Method to initialize the Recorder object and write the header.
+
+        Parameters
+        ----------
+        path : str
+            Path of the recording, overwritten.
+        columns : list
+            Names of the raw int16 columns.
+        scale : list, optional
+            Scale of each column to physical units. The default is None (1).
+        offset : list, optional
+            Offset of each column. The default is None (0).
+        sample_rate : float, optional
+            Sample rate in Hz. The default is None.
+        timestamps : bool, optional
+            Store an int64 timestamp in each record. The default is False,
+            the times are then reconstructed from the start time and the
+            sample rate.
+        chunk : int, optional
+            Number of records written at once. The default is 65536.
+        queue_size : int, optional
+            Maximum number of queued batches, write blocks when the writer is
+            behind. The default is 256.
+        **metadata
+            Additional JSON serializable header fields (see sensor_header).
+
+        Returns
+        -------
+        None.
+
+        """
+        self.path = path
+        self.dtype = record_dtype(columns, timestamps)
+        self.columns = list(columns)
+        self.timestamps = timestamps
+        header = {
+            "columns" : self.columns,
+            "dtype" : [list(field) for field in self.dtype.descr],
+            "scale" : list(scale) if scale is not None else [1.0]*len(columns),
+            "offset" : list(offset) if offset is not None else [0.0]*len(columns),
+            "sample_rate" : sample_rate,
+            "start" : time.monotonic_ns(),
+            "created" : time.time()}
+        header.update(metadata)
+        self.header = header
+        text = json.dumps(header).encode()
+        length = -(-(len(MAGIC) + 4 + len(text))//ALIGN)*ALIGN - len(MAGIC) - 4
+        self.file = open(path, "wb")
+        self.file.write(MAGIC + struct.pack("<I", length) + text.ljust(length))
+
+        self.chunk = np.zeros(chunk, dtype=self.dtype)
+        self.fill = 0
+        self.count = 0
+        self.error = None
+        self.queue = queue.Queue(queue_size)
+        self.thread = threading.Thread(target=self.run, name="recorder", daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def for_sensor(cls, path, sensor, columns=None, **kwargs):
+        """
+        Function to create a recorder with the header of a MPU6050, see
+        sensor_header.
+
+        Parameters
+        ----------
+        path : str
+            Path of the recording.
+        sensor : MPU6050
+            Sensor.
+        columns : list, optional
+            Names of the recorded columns. The default is None.
+        **kwargs
+            Arguments of Recorder.
+
+        Returns
+        -------
+        Recorder
+            The recorder.
+
+        """
+        header = sensor_header(sensor, columns)
+        return cls(path, **header, **kwargs)
+
+    def write(self, data, timestamps=None):
+        """
+        Function to queue a batch of raw samples.
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+            Raw int16 samples (n x columns), e.g. from fifo_read or read_raw.
+        timestamps : numpy.ndarray, optional
+            time.monotonic_ns() of the samples (n), required when the
+            recording stores timestamps. The default is None.
+
+        Returns
+        -------
+        None.
+
+        Raises
+        ------
+        Exception
+            The error of the writer thread, if it failed.
+
+        """
+        if self.thread is None:
+            raise ValueError("Recorder closed")
+        if self.error is not None:
+            raise self.error
+        data = np.array(data, dtype=">i2", ndmin=2)
+        if self.timestamps:
+            if timestamps is None:
+                raise ValueError("The recording stores timestamps")
+            timestamps = np.array(timestamps, dtype=np.int64, ndmin=1)
+        self.queue.put((data, timestamps))
+
+    def run(self):
+        # after an error the queue is still drained, so write never blocks
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.error is None:
+                try:
+                    self.store(*item)
+                except Exception as error:
+                    self.error = error
+        if self.error is None:
+            try:
+                self.flush()
+            except Exception as error:
+                self.error = error
+
+    def store(self, data, timestamps):
+        stored = 0
+        while stored < len(data):
+            n = min(len(data) - stored, len(self.chunk) - self.fill)
+            records = self.chunk[self.fill:self.fill + n]
+            for i, name in enumerate(self.columns):
+                records[name] = data[stored:stored + n, i]
+            if self.timestamps:
+                records["t"] = timestamps[stored:stored + n]
+            self.fill += n
+            stored += n
+            if self.fill == len(self.chunk):
+                self.flush()
+
+    def flush(self):
+        self.file.write(self.chunk[:self.fill].tobytes())
+        self.count += self.fill
+        self.fill = 0
+
+    def close(self):
+        """
+        Function to write the queued samples and close the file.
+
+        Returns
+        -------
+        None.
+
+        Raises
+        ------
+        Exception
+            The error of the writer thread, if it failed.
+
+        """
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        self.file.close()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class Recording:
+    """
+    Reader of a recording, mapped in memory as a NumPy structured array.
+    Slicing does not copy nor read the rest of the file, so recordings
+    larger than the memory can be processed in blocks. A recording can be
+    opened while it is written: the records complete at opening are mapped.
+
+    Attributes
+    ----------
+    header : dict
+        Header of the recording.
+    records : numpy.memmap
+        Records, one field per column (and "t" with timestamps).
+    calibration : CalibrationProfile
+        Calibration profile of the sensor, None if not calibrated.
+    """
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a recording")
+            length, = struct.unpack("<I", f.read(4))
+            self.header = json.loads(f.read(length))
+            f.seek(0, 2)
+            size = f.tell()
+        self.path = path
+        self.columns = self.header["columns"]
+        self.dtype = np.dtype([tuple(field) for field in self.header["dtype"]])
+        offset = len(MAGIC) + 4 + length
+        n = (size - offset)//self.dtype.itemsize
+        if n:
+            self.records = np.memmap(path, dtype=self.dtype, mode="r", offset=offset, shape=(n,))
+        else:
+            self.records = np.zeros(0, dtype=self.dtype)
+        self.scale_factors = np.array(self.header["scale"])
+        self.offsets = np.array(self.header["offset"])
+        profile = self.header.get("calibration")
+        self.calibration = CalibrationProfile.from_dict(profile) if profile else None
+
+    def __len__(self):
+        return len(self.records)
+
+    def raw(self, start=0, stop=None, columns=None):
+        """
+        Function to get raw samples as a (n x columns) int16 array.
+
+        Parameters
+        ----------
+        start : int, optional
+            First record. The default is 0.
+        stop : int, optional
+            End record. The default is None (last).
+        columns : list, optional
+            Names of the columns. The default is None (all).
+
+        Returns
+        -------
+        numpy.ndarray
+            Raw samples (n x columns).
+
+        """
+        columns = self.columns if columns is None else list(columns)
+        records = self.records[start:stop]
+        out = np.empty((len(records), len(columns)), dtype=np.int16)
+        for i, name in enumerate(columns):
+            out[:, i] = records[name]
+        return out
+
+    def scaled(self, start=0, stop=None, columns=None, calibrated=True):
+        """
+        Function to get samples in physical units with the scale and offset
+        of the header, and the calibration profile.
+
+        Parameters
+        ----------
+        start : int, optional
+            First record. The default is 0.
+        stop : int, optional
+            End record. The default is None (last).
+        columns : list, optional
+            Names of the columns. The default is None (all).
+        calibrated : bool, optional
+            Apply the calibration profile of the header. The default is True.
+
+        Returns
+        -------
+        numpy.ndarray
+            Scaled samples (n x columns).
+
+        """
+        columns = self.columns if columns is None else list(columns)
+        index = [self.columns.index(name) for name in columns]
+        scale, offset = self.scale_factors[index], self.offsets[index]
+        if calibrated and self.calibration is not None:
+            self.calibration.adjust(columns, scale, offset)
+        return self.raw(start, stop, columns)*scale + offset
+
+    def times(self, start=0, stop=None):
+        """
+        Function to get the time of the samples, stored or reconstructed from
+        the sample rate.
+
+        Parameters
+        ----------
+        start : int, optional
+            First record. The default is 0.
+        stop : int, optional
+            End record. The default is None (last).
+
+        Returns
+        -------
+        numpy.ndarray
+            time.monotonic_ns() of the samples.
+
+        """
+        if "t" in self.dtype.names:
+            return np.array(self.records["t"][start:stop])
+        if not self.header["sample_rate"]:
+            raise ValueError("The recording has no timestamps nor sample rate")
+        index = np.arange(len(self.records))[start:stop]
+        return self.header["start"] + np.rint(index*1e9/self.header["sample_rate"]).astype(np.int64)
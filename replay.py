@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Replay of recordings through the I2C interface: the drivers read the
+recorded samples as from the sensors.
+"""
+
+# =============================================================================
+# REPLAY BUS
+# =============================================================================
+import time
+
+import numpy as np
+
+from recording import Recording
+from simulated_bus import SimulatedBus, MPU6050Model, HMC5883LModel
+from MPU6050.register_map import RegisterMap as MPURegisterMap
+from HMC5883L.register_map import RegisterMap as HMCRegisterMap
+
+class RecordingSource:
+    """
+    Motion and magnetic field sources of the simulated devices, taken from a
+    recording. The value at time t is the last recorded sample before t,
+    missing columns take the values of a device lying flat and still.
+    """
+    MOTION = {
+        "accel_x" : 0.0,
+        "accel_y" : 0.0,
+        "accel_z" : 1.0,
+        "temp" : 25.0,
+        "gyro_x" : 0.0,
+        "gyro_y" : 0.0,
+        "gyro_z" : 0.0}
+    MAG = {
+        "mag_x" : 0.2,
+        "mag_y" : -0.05,
+        "mag_z" : 0.4}
+
+    def __init__(self, recording):
+        """
+        Method to initialize the RecordingSource object.
+
+        Parameters
+        ----------
+        recording : Recording or str
+            Recording or its path.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.recording = Recording(recording) if isinstance(recording, str) else recording
+        if not len(self.recording):
+            raise ValueError("Empty recording")
+        self.stored_times = "t" in self.recording.dtype.names
+        if self.stored_times:
+            self.times = self.recording.records["t"]
+            self.duration = (int(self.times[-1]) - int(self.times[0]))/1e9
+        else:
+            self.rate = self.recording.header["sample_rate"]
+            if not self.rate:
+                raise ValueError("The recording has no timestamps nor sample rate")
+            self.duration = (len(self.recording) - 1)/self.rate
+        self.motion_plan = self.plan(self.MOTION)
+        # magnetometer columns are recorded in mGa
+        self.field_plan = self.plan(self.MAG, unit=1e-3)
+
+    def index(self, t):
+        """
+        Function to get the record of each time.
+
+        Parameters
+        ----------
+        t : numpy.ndarray
+            Times in seconds from the first record.
+
+        Returns
+        -------
+        numpy.ndarray
+            Index of the last record before each time.
+
+        """
+        t = np.asarray(t, dtype=float)
+        if self.stored_times:
+            index = np.searchsorted(self.times, self.times[0] + np.rint(t*1e9).astype(np.int64), side="right") - 1
+        else:
+            index = np.floor(t*self.rate + 1e-9).astype(np.int64)
+        return np.clip(index, 0, len(self.recording) - 1)
+
+    def plan(self, defaults, unit=1.0):
+        # (name, scale, offset) of the recorded columns, default of the others.
+        # The scale and offset of the header exclude the calibration, so the
+        # replayed device outputs the recorded raw values
+        header = self.recording.header
+        plan = []
+        for name, default in defaults.items():
+            if name in self.recording.columns:
+                k = self.recording.columns.index(name)
+                plan.append((name, header["scale"][k]*unit, header["offset"][k]*unit))
+            else:
+                plan.append((None, 0.0, default))
+        return plan
+
+    def columns(self, t, plan):
+        records = self.recording.records[self.index(t)]
+        out = np.empty((len(records), len(plan)))
+        for i, (name, scale, offset) in enumerate(plan):
+            out[:, i] = records[name]*scale + offset if name is not None else offset
+        return out
+
+    def motion(self, t):
+        data = self.columns(t, self.motion_plan)
+        return data[:, 0:3], data[:, 4:7], data[:, 3]
+
+    def field(self, t):
+        return self.columns(t, self.field_plan)
+
+class ReplayClock:
+    """
+    Time source of a replay, in seconds from the start.
+    With a speed the recording is replayed in scaled real time, without a
+    speed the time advances by a fixed step at each tick, so the replay runs
+    as fast as the code reading the bus.
+    """
+    def __init__(self, speed=1.0, step=0.001):
+        self.speed = speed
+        self.step = step
+        self.calls = 0
+        self.start = time.monotonic()
+
+    def reset(self):
+        self.calls = 0
+        self.start = time.monotonic()
+
+    def elapsed(self):
+        if self.speed is None:
+            return self.calls*self.step
+        return (time.monotonic() - self.start)*self.speed
+
+    def tick(self):
+        self.calls += 1
+
+    def __call__(self):
+        return self.elapsed()
+
+class ReplayBus(SimulatedBus):
+    """
+    SimulatedBus whose MPU6050 (and HMC5883L) replay a recording, usable as
+    the bus of I2CInterface so the unchanged sensor classes, and everything
+    built on them, run on recorded data.
+    The devices produce samples at the rate configured by the driver, with
+    the recorded values: configure the rate of the recording to replay it
+    sample by sample.
+    As fast as possible, the time advances by one step each time the driver
+    polls for new data, i.e. reads one of the polls registers: a burst read
+    of the MPU6050 data, the FIFO count, INT_STATUS, or the data and status
+    of a HMC5883L on the main bus.
+    """
+    def __init__(self, recording, mpu_address=0x68, hmc_address=None, aux=False,
+                 speed=1.0, step=None, **kwargs):
+        """
+        Method to initialize the ReplayBus object.
+
+        Parameters
+        ----------
+        recording : Recording or str
+            Recording or its path.
+        mpu_address : hex, optional
+            Address of the MPU6050. The default is 0x68.
+        hmc_address : hex, optional
+            Address of a HMC5883L replaying the mag columns. The default is None.
+        aux : bool, optional
+            Connect the HMC5883L to the auxiliary bus of the MPU6050 instead
+            of the main bus. The default is False.
+        speed : float, optional
+            Replay speed, 1.0 is real time, None is as fast as possible.
+            The default is 1.0.
+        step : float, optional
+            Time advanced by each poll when speed is None, in seconds.
+            The default is None, one sample period of the recording, which
+            suits burst reads. FIFO drains run faster with larger steps
+            (e.g. 0.02), below the FIFO capacity.
+        **kwargs
+            Arguments of SimulatedBus (latency, byte_time, error_rate, seed).
+
+        Returns
+        -------
+        None.
+
+        """
+        self.source = RecordingSource(recording)
+        if step is None:
+            rate = self.source.recording.header["sample_rate"]
+            step = 1/rate if rate else 0.001
+        super().__init__(clock=ReplayClock(speed, step), **kwargs)
+        self.mpu = self.add_device(mpu_address, MPU6050Model(motion=self.source.motion))
+        self.polls = {mpu_address : {MPURegisterMap.ACCEL_XOUT_H, MPURegisterMap.FIFO_COUNTH, MPURegisterMap.INT_STATUS}}
+        self.hmc = None
+        if hmc_address is not None:
+            self.hmc = HMC5883LModel(field=self.source.field)
+            if aux:
+                self.mpu.add_aux_device(hmc_address, self.hmc)
+            else:
+                self.add_device(hmc_address, self.hmc)
+                self.polls[hmc_address] = {HMCRegisterMap.DXRA, HMCRegisterMap.SR}
+
+    def poll(self, address, register):
+        if self.clock.speed is None and register in self.polls.get(address, ()):
+            self.clock.tick()
+
+    def read_byte_data(self, i2c_addr, register, force=None):
+        self.poll(i2c_addr, register)
+        return super().read_byte_data(i2c_addr, register, force)
+
+    def read_i2c_block_data(self, i2c_addr, register, length, force=None):
+        self.poll(i2c_addr, register)
+        return super().read_i2c_block_data(i2c_addr, register, length, force)
+
+    def rewind(self):
+        """
+        Function to restart the replay from the first record, e.g. after the
+        driver has configured the devices, keeping their configuration.
+        The FIFO is emptied and the first sample is the first record.
+
+        Returns
+        -------
+        None.
+
+        """
+        with self.lock:
+            self.clock.reset()
+            self.mpu.fifo = bytearray()
+            if self.mpu.last_sample is not None:
+                self.mpu.last_sample = -1/self.mpu.sample_rate()
+            if self.hmc is not None and self.hmc.next_measurement is not None:
+                self.hmc.next_measurement = 0.0
+
+    @property
+    def finished(self):
+        return self.clock.elapsed() > self.source.duration
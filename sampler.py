@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+Background acquisition in a thread writing in a preallocated numpy ring
+buffer.
+"""
+
+# =============================================================================
+# BACKGROUND ACQUISITION
+# =============================================================================
+import threading
+import time
+
+import numpy as np
+
+from MPU6050.register_map import RegisterMap
+
+class RingBuffer:
+    """
+    Fixed-size ring buffer of timestamped samples, preallocated as NumPy
+    arrays. Samples are indexed by their absolute position in the stream,
+    so a consumer keeps a cursor and reads everything written after it.
+    Only the default consumer, read_since without a cursor, releases the
+    samples for the writer; the readers with their own cursor and latest
+    never change what the writer may overwrite.
+
+    Attributes
+    ----------
+    data : numpy.ndarray
+        Samples (capacity x channels).
+    timestamps : numpy.ndarray
+        time.monotonic_ns() of the samples (capacity).
+    head : int
+        Number of samples written since the creation of the buffer.
+    tail : int
+        Position of the oldest sample not yet red by the default consumer.
+    policy : str
+        What happens when the unread samples fill the buffer:
+        "drop_oldest" overwrites them, "drop_newest" discards the new samples,
+        "block" makes the writer wait for the default consumer. With "block"
+        a buffer red only with cursors or latest stops the writer once full,
+        until close.
+    overruns : int
+        Number of samples lost because of a full buffer.
+    """
+    POLICIES = ("drop_oldest", "drop_newest", "block")
+
+    def __init__(self, capacity, channels, dtype=np.float64, policy="drop_oldest"):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Invalid policy {policy!r}, valid policies are {self.POLICIES}")
+        self.capacity = capacity
+        self.data = np.zeros((capacity, channels), dtype=dtype)
+        self.timestamps = np.zeros(capacity, dtype=np.int64)
+        self.policy = policy
+        self.head = 0
+        self.tail = 0
+        self.overruns = 0
+        self.condition = threading.Condition()
+        self.closed = False
+
+    def store(self, timestamps, data):
+        # copy in the ring, in two slices when the end of the arrays is crossed
+        start = self.head % self.capacity
+        first = min(len(data), self.capacity - start)
+        self.data[start:start + first] = data[:first]
+        self.timestamps[start:start + first] = timestamps[:first]
+        self.data[:len(data) - first] = data[first:]
+        self.timestamps[:len(data) - first] = timestamps[first:]
+        self.head += len(data)
+
+    def write(self, timestamps, data):
+        """
+        Function to append a batch of samples.
+
+        Parameters
+        ----------
+        timestamps : numpy.ndarray
+            time.monotonic_ns() of the samples (n).
+        data : numpy.ndarray
+            Samples (n x channels).
+
+        Returns
+        -------
+        int
+            Number of stored samples.
+
+        """
+        with self.condition:
+            if self.policy == "block":
+                stored = 0
+                while stored < len(data) and not self.closed:
+                    self.condition.wait_for(lambda: self.head - self.tail < self.capacity or self.closed)
+                    n = min(len(data) - stored, self.capacity - (self.head - self.tail))
+                    self.store(timestamps[stored:stored + n], data[stored:stored + n])
+                    stored += n
+                    self.condition.notify_all()
+                return stored
+
+            free = self.capacity - (self.head - self.tail)
+            if self.policy == "drop_newest":
+                if len(data) > free:
+                    self.overruns += len(data) - free
+                    timestamps = timestamps[:free]
+                    data = data[:free]
+                self.store(timestamps, data)
+            else:
+                self.overruns += max(len(data) - free, 0)
+                if len(data) > self.capacity:
+                    skip = len(data) - self.capacity
+                    self.head += skip
+                    timestamps = timestamps[skip:]
+                    data = data[skip:]
+                self.store(timestamps, data)
+                self.tail = max(self.tail, self.head - self.capacity)
+            self.condition.notify_all()
+            return len(data)
+
+    def latest(self, n):
+        """
+        Function to get a copy of the last n samples.
+
+        Parameters
+        ----------
+        n : int
+            Number of samples.
+
+        Returns
+        -------
+        tuple
+            timestamps (m) and samples (m x channels), with m <= n.
+
+        """
+        with self.condition:
+            n = min(n, self.head, self.capacity)
+            index = np.arange(self.head - n, self.head) % self.capacity
+            return self.timestamps[index], self.data[index]
+
+    def read_since(self, cursor=None):
+        """
+        Function to get a copy of the samples written after a cursor.
+
+        Parameters
+        ----------
+        cursor : int, optional
+            Position returned by the previous call of this reader. The default
+            is None, the default consumer: the read starts from the oldest
+            unread sample and the red samples are released for the writer.
+
+        Returns
+        -------
+        tuple
+            timestamps (n), samples (n x channels) and the new cursor. If the
+            samples after the cursor have been overwritten the read starts
+            from the oldest available one.
+
+        """
+        with self.condition:
+            start = self.tail if cursor is None else cursor
+            start = max(start, self.head - self.capacity)
+            index = np.arange(start, self.head) % self.capacity
+            if cursor is None:
+                self.tail = self.head
+                self.condition.notify_all()
+            return self.timestamps[index], self.data[index], self.head
+
+    def wait(self, cursor, timeout=None):
+        """
+        Function to block until samples are written after a cursor.
+
+        Parameters
+        ----------
+        cursor : int
+            Position returned by read_since.
+        timeout : float, optional
+            Maximum waiting time in seconds. The default is None (no timeout).
+
+        Returns
+        -------
+        bool
+            True if new samples are available.
+
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: self.head > cursor or self.closed, timeout) and self.head > cursor
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def open(self):
+        with self.condition:
+            self.closed = False
+            self.condition.notify_all()
+
+class BackgroundSampler:
+    """
+    Thread owning an MPU6050 and writing its samples, scaled in physical
+    units, in a RingBuffer.
+
+    Modes
+    -----
+    "burst" : one read_raw every 1/rate seconds, on absolute deadlines.
+    "fifo" : the FIFO (configured with fifo_config_set) is drained every
+        interval seconds, the samples are stamped by the sample clock of the
+        sensor (see MPU6050.fifo_read_timed).
+    "interrupt" : one sample for each Data Ready interrupt of the waiter.
+    """
+    def __init__(self, sensor, capacity=10000, mode="burst", rate=100, interval=0.02,
+                 waiter=None, policy="drop_oldest"):
+        """
+        Method to initialize the BackgroundSampler object.
+
+        Parameters
+        ----------
+        sensor : MPU6050
+            Sensor, used only by the sampler thread while it runs.
+        capacity : int, optional
+            Number of samples of the ring buffer. The default is 10000.
+        mode : str, optional
+            "burst", "fifo" or "interrupt". The default is "burst".
+        rate : float, optional
+            Read rate of the burst mode in Hz. The default is 100.
+        interval : float, optional
+            Drain interval of the fifo mode in seconds. The default is 0.02.
+        waiter : object, optional
+            Interrupt source of the interrupt mode (see MPU6050.wait_sample).
+        policy : str, optional
+            Overflow policy of the ring buffer, "block" requires a consumer
+            calling read_since without a cursor. The default is "drop_oldest".
+
+        Returns
+        -------
+        None.
+
+        """
+        if mode not in ("burst", "fifo", "interrupt"):
+            raise ValueError(f"Invalid mode {mode!r}")
+        if mode == "interrupt" and waiter is None:
+            raise ValueError("The interrupt mode requires a waiter")
+        self.sensor = sensor
+        self.mode = mode
+        self.rate = rate
+        self.interval = interval
+        self.waiter = waiter
+        self.columns = list(sensor.fifo_channels) if mode == "fifo" else list(RegisterMap.MOTION_COLUMNS)
+        self.buffer = RingBuffer(capacity, len(self.columns), policy=policy)
+        self.errors = 0
+        self.missed = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Function to start the acquisition thread.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.stop_event.clear()
+        self.buffer.open()
+        self.thread = threading.Thread(target=self.run, name=f"sampler-{self.sensor.address:#x}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Function to stop the acquisition thread and wake up the consumers.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.stop_event.set()
+        self.buffer.close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def read(self):
+        """
+        Function to read the new samples of the sensor.
+
+        Returns
+        -------
+        tuple
+            timestamps (n) and samples (n x channels).
+
+        """
+        if self.mode == "fifo":
+            timestamps, data = self.sensor.fifo_read_timed(scaled=True)
+            return timestamps, data
+        if self.mode == "interrupt":
+            if not self.waiter.wait(self.interval):
+                return np.empty(0, dtype=np.int64), np.empty((0, len(self.columns)))
+        raw = self.sensor.read_raw().reshape(1, -1)
+        now = time.monotonic_ns()
+        if self.mode == "interrupt" and not self.sensor.int_read_clear:
+            self.sensor.read_data(RegisterMap.INT_STATUS)
+        return np.array([now]), self.sensor.fifo_scale(raw, self.columns)
+
+    def run(self):
+        period = self.interval if self.mode == "fifo" else 1/self.rate
+        deadline = time.monotonic()
+        while not self.stop_event.is_set():
+            try:
+                timestamps, data = self.read()
+            except OSError:
+                self.errors += 1
+                timestamps = []
+            if len(timestamps):
+                self.buffer.write(timestamps, data)
+            if self.mode == "interrupt":
+                continue
+            deadline += period
+            delay = deadline - time.monotonic()
+            if delay < 0:
+                self.missed += int(-delay/period) + 1
+                deadline = time.monotonic()
+                delay = 0
+            self.stop_event.wait(delay)
+
+    def latest(self, n):
+        return self.buffer.latest(n)
+
+    def read_since(self, cursor=None):
+        return self.buffer.read_since(cursor)
+
+    def wait(self, cursor, timeout=None):
+        return self.buffer.wait(cursor, timeout)
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Polling on absolute deadlines for sensors without interrupt wiring.
+"""
+
+# =============================================================================
+# DEADLINE POLLING
+# =============================================================================
+import time
+
+import numpy as np
+
+class DeadlineScheduler:
+    """
+    Polling on absolute deadlines, start + k*period in time.monotonic_ns(),
+    for sensors without interrupt wiring. The time of the reads is not
+    added to the wait, so the rate does not drift.
+    The wait sleeps until a margin before the deadline and spins for the
+    rest. The margin follows the measured oversleep of time.sleep (its 99th
+    percentile), so the spin is as short as the scheduler of the host allows.
+    A deadline passed by more than one period is skipped and counted as
+    missed, the following ones keep the same phase.
+
+    Attributes
+    ----------
+    period : int
+        Period in ns.
+    count : int
+        Number of deadlines served since the last reset.
+    missed : int
+        Number of skipped deadlines since the last reset.
+    margin : int
+        Current spin margin in ns.
+    """
+    def __init__(self, rate, spin=True, max_spin=0.002, window=1024):
+        """
+        Method to initialize the DeadlineScheduler object.
+
+        Parameters
+        ----------
+        rate : float
+            Rate of the deadlines in Hz.
+        spin : bool, optional
+            Spin before the deadlines, False only sleeps (less CPU, more
+            jitter). The default is True.
+        max_spin : float, optional
+            Maximum spin margin in seconds. The default is 0.002.
+        window : int, optional
+            Number of oversleep and lateness measurements kept.
+            The default is 1024.
+
+        Returns
+        -------
+        None.
+
+        """
+        if rate <= 0:
+            raise ValueError(f"Invalid rate {rate}")
+        self.rate = rate
+        self.period = int(round(1e9/rate))
+        self.spin = spin
+        self.max_spin = int(max_spin*1e9)
+        self.oversleep = np.zeros(window, dtype=np.int64)
+        self.lateness = np.zeros(window, dtype=np.int64)
+        self.sleeps = 0
+        self.margin = min(self.max_spin, 200000) if spin else 0
+        self.reset()
+
+    @classmethod
+    def for_sensor(cls, sensor, **kwargs):
+        """
+        Function to create a scheduler at the sample rate configured in a
+        MPU6050.
+
+        Parameters
+        ----------
+        sensor : MPU6050
+            Sensor.
+        **kwargs
+            Arguments of DeadlineScheduler.
+
+        Returns
+        -------
+        DeadlineScheduler
+            The scheduler.
+
+        """
+        if not sensor.sr:
+            sensor.sample_rate_get()
+        return cls(sensor.sr*1000, **kwargs)
+
+    def reset(self, start=None):
+        """
+        Function to restart the deadlines and the statistics.
+
+        Parameters
+        ----------
+        start : int, optional
+            time.monotonic_ns() of the first deadline. The default is None
+            (now).
+
+        Returns
+        -------
+        None.
+
+        """
+        self.next = time.monotonic_ns() if start is None else start
+        self.count = 0
+        self.missed = 0
+
+    def wait(self):
+        """
+        Function to wait for the next deadline.
+
+        Returns
+        -------
+        int
+            time.monotonic_ns() of the deadline.
+
+        """
+        deadline = self.next
+        now = time.monotonic_ns()
+        if now - deadline >= self.period:
+            skipped = (now - deadline)//self.period
+            self.missed += skipped
+            deadline += skipped*self.period
+        remaining = deadline - now
+        if remaining > self.margin:
+            requested = remaining - self.margin
+            time.sleep(requested/1e9)
+            self.sleep_record(time.monotonic_ns() - now - requested)
+        now = time.monotonic_ns()
+        while now < deadline and self.spin:
+            now = time.monotonic_ns()
+        self.lateness[self.count % len(self.lateness)] = max(now - deadline, 0)
+        self.count += 1
+        self.next = deadline + self.period
+        return deadline
+
+    def sleep_record(self, oversleep):
+        # the margin is re-estimated every 64 sleeps
+        self.oversleep[self.sleeps % len(self.oversleep)] = oversleep
+        self.sleeps += 1
+        if self.spin and not self.sleeps % 64:
+            n = min(self.sleeps, len(self.oversleep))
+            self.margin = int(min(max(np.percentile(self.oversleep[:n], 99), 0), self.max_spin))
+
+    def ticks(self, n=None, stop=None):
+        """
+        Generator of the deadlines, e.g.
+            for t in scheduler.ticks(200):
+                sensor.gyro_get()
+
+        Parameters
+        ----------
+        n : int, optional
+            Number of deadlines. The default is None (endless).
+        stop : threading.Event, optional
+            Event ending the generator. The default is None.
+
+        Yields
+        ------
+        int
+            time.monotonic_ns() of each deadline, once it is reached.
+
+        """
+        i = 0
+        while (n is None or i < n) and not (stop is not None and stop.is_set()):
+            yield self.wait()
+            i += 1
+
+    def run(self, read, n, out=None):
+        """
+        Function to call a read function on n deadlines, e.g. read_raw.
+
+        Parameters
+        ----------
+        read : callable
+            Function without arguments returning a sample.
+        n : int
+            Number of samples.
+        out : numpy.ndarray, optional
+            Preallocated array for the samples (n x sample size).
+            The default is None.
+
+        Returns
+        -------
+        timestamps : numpy.ndarray
+            time.monotonic_ns() of the deadlines (n).
+        data : numpy.ndarray
+            Samples (n x sample size).
+
+        """
+        timestamps = np.empty(n, dtype=np.int64)
+        for i in range(n):
+            timestamps[i] = self.wait()
+            sample = read()
+            if out is None:
+                out = np.empty((n,) + np.shape(sample), dtype=np.asarray(sample).dtype)
+            out[i] = sample
+        return timestamps, out
+
+    def stats(self):
+        """
+        Function to get the statistics of the deadlines.
+
+        Returns
+        -------
+        dict
+            Served ("count") and missed ("missed") deadlines, spin margin
+            ("spin_us"), standard deviation, median, 99th percentile and
+            maximum of the lateness of the wake ups in us.
+
+        """
+        n = min(self.count, len(self.lateness))
+        lateness = self.lateness[:n]/1000 if n else np.zeros(1)
+        return {
+            "count" : self.count,
+            "missed" : self.missed,
+            "spin_us" : self.margin/1000,
+            "std_us" : float(lateness.std()),
+            "p50_us" : float(np.percentile(lateness, 50)),
+            "p99_us" : float(np.percentile(lateness, 99)),
+            "max_us" : float(lateness.max())}
@@ -14,6 +14,9 @@ setup(
     install_requires=[
         'smbus2',
     ],
+    extras_require={
+        'gpio': ['gpiod>=2'],
+    },
     description='Library for interfacing with MPU6050 over I2C',
     author='Eugenio Calandrini',
     author_email='calandrini.e@gmail.com',
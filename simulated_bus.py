@@ -0,0 +1,573 @@
+# -*- coding: utf-8 -*-
+"""
+In-memory I2C bus with register level models of the MPU6050 and HMC5883L,
+for tests and benchmarks without hardware.
+"""
+
+# =============================================================================
+# SIMULATED I2C BUS
+# =============================================================================
+import errno
+import threading
+import time
+
+import numpy as np
+
+from MPU6050.register_map import RegisterMap as MPURegisterMap
+from HMC5883L.register_map import RegisterMap as HMCRegisterMap
+
+def still_motion(t):
+    """
+    Default motion of the simulated MPU6050: device lying flat and still.
+
+    Parameters
+    ----------
+    t : numpy.ndarray
+        Times of the samples in seconds.
+
+    Returns
+    -------
+    tuple
+        accel (N x 3, g), gyro (N x 3, º/s) and temperature (N, ºC).
+
+    """
+    accel = np.zeros((len(t), 3))
+    accel[:, 2] = 1
+    return accel, np.zeros((len(t), 3)), np.full(len(t), 25.0)
+
+def earth_field(t):
+    """
+    Default field of the simulated HMC5883L, in Gauss.
+
+    Parameters
+    ----------
+    t : numpy.ndarray
+        Times of the samples in seconds.
+
+    Returns
+    -------
+    numpy.ndarray
+        Magnetic field (N x 3, Ga).
+
+    """
+    return np.tile([0.2, -0.05, 0.4], (len(t), 1))
+
+class DeviceModel:
+    """
+    Register file of a simulated I2C device with auto-increment block reads.
+    """
+    DEFAULTS = {}
+
+    def __init__(self):
+        self.registers = bytearray(256)
+        self.reset_registers()
+
+    def reset_registers(self):
+        self.registers[:] = bytes(256)
+        for register, value in self.DEFAULTS.items():
+            self.registers[register] = value
+
+    def update(self, now):
+        pass
+
+    def read(self, register, now):
+        return self.registers[register]
+
+    def write(self, register, value, now):
+        self.registers[register] = value
+
+    def read_block(self, register, length, now):
+        return [self.read(register + i, now) for i in range(length)]
+
+class MPU6050Model(DeviceModel):
+    """
+    Simulated MPU6050: sample rate timing, data registers, FIFO with count
+    and overflow, Data Ready flag and INT_STATUS clearing, slave 0 reads and
+    slave 4 transfers of the auxiliary I2C master.
+    """
+    DEFAULTS = {
+        MPURegisterMap.PWR_MGMT_1 : 0x40,
+        MPURegisterMap.WHO_AM_I : 0x68}
+
+    def __init__(self, motion=still_motion, noise=0.0, seed=None):
+        """
+        Method to initialize the MPU6050Model object.
+
+        Parameters
+        ----------
+        motion : callable, optional
+            Function of the sample times returning accel (g), gyro (º/s) and
+            temperature (ºC), see still_motion. The default is still_motion.
+        noise : float, optional
+            Standard deviation of the noise added to the samples, in LSB.
+            The default is 0.0.
+        seed : int, optional
+            Seed of the noise generator. The default is None.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.motion = motion
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        self.fifo = bytearray()
+        self.last_sample = None
+        self.aux = {}
+        super().__init__()
+
+    def add_aux_device(self, address, model):
+        """
+        Function to connect a device model to the auxiliary I2C bus, red by
+        the I2C master of the MPU6050. For the pass-through mode add the same
+        model to the SimulatedBus as well.
+
+        Parameters
+        ----------
+        address : hex
+            Address of the device.
+        model : DeviceModel
+            Simulated device.
+
+        Returns
+        -------
+        DeviceModel
+            The connected model.
+
+        """
+        self.aux[address] = model
+        return model
+
+    def reset_registers(self):
+        super().reset_registers()
+        self.fifo = bytearray()
+        self.last_sample = None
+
+    def field_get(self, field):
+        return field.decode(self.registers[field.register])
+
+    def sample_rate(self):
+        """
+        Function to compute the sample rate from SMPLRT_DIV and DLPF_CFG.
+
+        Returns
+        -------
+        float
+            Sample rate in Hz.
+
+        """
+        dlpf = self.field_get(MPURegisterMap.DLPF_CFG)
+        gyro_rate = 8000 if dlpf in (0, 7) else 1000
+        return gyro_rate/(1 + self.registers[MPURegisterMap.SMPLRT_DIV])
+
+    def next_sample_time(self, now):
+        """
+        Function to get the time of the next sample.
+
+        Returns
+        -------
+        float or None
+            Time of the next sample, None while the device sleeps.
+
+        """
+        self.update(now)
+        if self.last_sample is None:
+            return None
+        return self.last_sample + 1/self.sample_rate()
+
+    def raw_samples(self, t):
+        accel, gyro, temp = self.motion(t)
+        accel_lsb = MPURegisterMap.ACCEL_LSB[self.field_get(MPURegisterMap.AFS_SEL)]
+        gyro_lsb = MPURegisterMap.GYRO_LSB[self.field_get(MPURegisterMap.FS_SEL)]
+        raw = np.empty((len(t), 7))
+        raw[:, 0:3] = np.asarray(accel)*accel_lsb
+        raw[:, 3] = (np.asarray(temp) - 36.53)*340
+        raw[:, 4:7] = np.asarray(gyro)*gyro_lsb
+        if self.noise:
+            raw += self.rng.normal(0, self.noise, raw.shape)
+        return np.clip(np.rint(raw), -32768, 32767).astype(">i2")
+
+    def update(self, now):
+        """
+        Function to generate the samples produced since the last update.
+
+        Parameters
+        ----------
+        now : float
+            Current time in seconds.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.field_get(MPURegisterMap.SLEEP):
+            self.last_sample = None
+            return
+        if self.last_sample is None:
+            self.last_sample = now
+            return
+        period = 1/self.sample_rate()
+        n = int((now - self.last_sample)/period)
+        if n <= 0:
+            return
+        self.last_sample += n*period
+        # older samples would be lost in the FIFO anyway
+        n = min(n, MPURegisterMap.FIFO_SIZE)
+        t = self.last_sample - period*np.arange(n)[::-1]
+        raw = self.raw_samples(t)
+
+        self.registers[MPURegisterMap.ACCEL_XOUT_H:MPURegisterMap.GYRO_ZOUT_L + 1] = raw[-1].tobytes()
+        ext = self.aux_read(now)
+        self.registers[MPURegisterMap.INT_STATUS] |= MPURegisterMap.DATA_RDY_INT.mask
+        if self.field_get(MPURegisterMap.USER_FIFO_EN):
+            self.fifo_push(raw, ext)
+
+    def aux_read(self, now):
+        """
+        Function to run the slave 0 read of the I2C master, copying the data
+        of the auxiliary device in EXT_SENS_DATA.
+        All the samples generated by one update share the same external data.
+
+        Returns
+        -------
+        bytes
+            Data red from the device, empty if slave 0 is disabled.
+
+        """
+        if not (self.field_get(MPURegisterMap.I2C_MST_EN) and self.field_get(MPURegisterMap.I2C_SLV0_EN)
+                and self.field_get(MPURegisterMap.I2C_SLV0_RW)):
+            return b""
+        length = self.field_get(MPURegisterMap.I2C_SLV0_LEN)
+        device = self.aux.get(self.field_get(MPURegisterMap.I2C_SLV0_ID))
+        if device is None:
+            self.registers[MPURegisterMap.I2C_MST_STATUS] |= MPURegisterMap.I2C_SLV0_NACK.mask
+            return b""
+        device.update(now)
+        data = bytes(device.read_block(self.registers[MPURegisterMap.I2C_SLV0_REG], length, now))
+        start = MPURegisterMap.EXT_SENS_DATA_00
+        self.registers[start:start + length] = data
+        return data
+
+    def fifo_push(self, raw, ext=b""):
+        fifo_en = self.registers[MPURegisterMap.FIFO_EN]
+        columns = []
+        for bit, names in MPURegisterMap.FIFO_CHANNELS.values():
+            if fifo_en & bit:
+                columns += [MPURegisterMap.MOTION_COLUMNS.index(name) for name in names]
+        frames = np.ascontiguousarray(raw[:, columns]).view(np.uint8).reshape(len(raw), -1)
+        if fifo_en & MPURegisterMap.SLV0_FIFO_EN.mask and ext:
+            frames = np.hstack([frames, np.tile(np.frombuffer(ext, dtype=np.uint8), (len(raw), 1))])
+        self.fifo += frames.tobytes()
+        excess = len(self.fifo) - MPURegisterMap.FIFO_SIZE
+        if excess > 0:
+            del self.fifo[:excess]
+            self.registers[MPURegisterMap.INT_STATUS] |= MPURegisterMap.FIFO_OFLOW_INT.mask
+
+    def read(self, register, now):
+        if register == MPURegisterMap.FIFO_COUNTH:
+            value = len(self.fifo) >> 8
+        elif register == MPURegisterMap.FIFO_COUNTL:
+            value = len(self.fifo) & 0xFF
+        elif register == MPURegisterMap.FIFO_R_W:
+            value = self.fifo.pop(0) if self.fifo else 0xFF
+        else:
+            value = self.registers[register]
+        if register == MPURegisterMap.I2C_MST_STATUS:
+            self.registers[register] &= MPURegisterMap.PASS_THROUGH.mask
+        if register == MPURegisterMap.INT_STATUS or self.field_get(MPURegisterMap.INT_RD_CLEAR):
+            self.registers[MPURegisterMap.INT_STATUS] = 0
+        return value
+
+    def read_block(self, register, length, now):
+        if register == MPURegisterMap.FIFO_R_W:
+            data = list(self.fifo[:length])
+            del self.fifo[:length]
+            return data + [0xFF]*(length - len(data))
+        return super().read_block(register, length, now)
+
+    def write(self, register, value, now):
+        if register == MPURegisterMap.PWR_MGMT_1 and value & MPURegisterMap.DEVICE_RESET.mask:
+            self.reset_registers()
+            return
+        if register == MPURegisterMap.USER_CTRL and value & MPURegisterMap.FIFO_RESET.mask:
+            self.fifo = bytearray()
+        if register in MPURegisterMap.SHADOW_REGISTERS:
+            value &= ~MPURegisterMap.SHADOW_REGISTERS[register]
+        if register == MPURegisterMap.SIGNAL_PATH_RESET:
+            value = 0
+        if register == MPURegisterMap.I2C_SLV4_CTRL and value & MPURegisterMap.I2C_SLV4_EN.mask:
+            self.slave4_transfer(now)
+            value &= ~MPURegisterMap.I2C_SLV4_EN.mask
+        self.registers[register] = value
+
+    def slave4_transfer(self, now):
+        # single byte transfer of slave 4, only with the I2C master enabled
+        if not self.field_get(MPURegisterMap.I2C_MST_EN):
+            return
+        device = self.aux.get(self.field_get(MPURegisterMap.I2C_SLV4_ID))
+        status = MPURegisterMap.I2C_SLV4_DONE.mask
+        if device is None:
+            status |= MPURegisterMap.I2C_SLV4_NACK.mask
+        elif self.field_get(MPURegisterMap.I2C_SLV4_RW):
+            device.update(now)
+            self.registers[MPURegisterMap.I2C_SLV4_DI] = device.read(self.registers[MPURegisterMap.I2C_SLV4_REG], now)
+        else:
+            device.write(self.registers[MPURegisterMap.I2C_SLV4_REG], self.registers[MPURegisterMap.I2C_SLV4_DO], now)
+        self.registers[MPURegisterMap.I2C_MST_STATUS] |= status
+
+class HMC5883LModel(DeviceModel):
+    """
+    Simulated HMC5883L: continuous and single measurement modes, Ready and
+    Lock status bits, overflow of the output registers.
+    """
+    DEFAULTS = {
+        HMCRegisterMap.CRA : 0x10,
+        HMCRegisterMap.CRB : 0x20,
+        HMCRegisterMap.MR : 0x01,
+        HMCRegisterMap.IRA : ord("H"),
+        HMCRegisterMap.IRB : ord("4"),
+        HMCRegisterMap.IRC : ord("3")}
+    SINGLE_TIME = 1/160
+    OUTPUT = range(HMCRegisterMap.DXRA, HMCRegisterMap.DXRA + HMCRegisterMap.OUTPUT_LENGTH)
+
+    def __init__(self, field=earth_field, noise=0.0, seed=None):
+        """
+        Method to initialize the HMC5883LModel object.
+
+        Parameters
+        ----------
+        field : callable, optional
+            Function of the sample times returning the magnetic field in Ga,
+            see earth_field. The default is earth_field.
+        noise : float, optional
+            Standard deviation of the noise added to the samples, in LSB.
+            The default is 0.0.
+        seed : int, optional
+            Seed of the noise generator. The default is None.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.magnetic = field
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        self.next_measurement = None
+        self.pending = None
+        self.unread = set()
+        super().__init__()
+
+    def raw_sample(self, t):
+        gain = HMCRegisterMap.sensor_range[f"{HMCRegisterMap.GN.decode(self.registers[HMCRegisterMap.CRB]):03b}"][1]
+        raw = np.asarray(self.magnetic(np.array([t])))[0]*gain
+        if self.noise:
+            raw = raw + self.rng.normal(0, self.noise, 3)
+        raw = np.rint(raw)
+        raw[(raw < -2048) | (raw > 2047)] = -4096
+        # output registers are ordered X, Z, Y
+        return raw[[0, 2, 1]].astype(">i2").tobytes()
+
+    def store(self, data):
+        if self.unread:
+            self.pending = data
+            return
+        self.registers[HMCRegisterMap.DXRA:HMCRegisterMap.DXRA + HMCRegisterMap.OUTPUT_LENGTH] = data
+        self.registers[HMCRegisterMap.SR] |= HMCRegisterMap.RDY.mask
+
+    def update(self, now):
+        mode = HMCRegisterMap.MD.decode(self.registers[HMCRegisterMap.MR])
+        if self.next_measurement is None or mode not in ("Continuous", "Single"):
+            return
+        if mode == "Single":
+            if now >= self.next_measurement:
+                self.store(self.raw_sample(self.next_measurement))
+                self.registers[HMCRegisterMap.MR] = HMCRegisterMap.MD.insert(self.registers[HMCRegisterMap.MR], "Idle")
+                self.next_measurement = None
+            return
+        period = 1/HMCRegisterMap.DO.decode(self.registers[HMCRegisterMap.CRA])
+        if now >= self.next_measurement:
+            n = int((now - self.next_measurement)/period)
+            self.next_measurement += n*period
+            self.store(self.raw_sample(self.next_measurement))
+            self.next_measurement += period
+
+    def read(self, register, now):
+        if register in self.OUTPUT:
+            if not self.unread:
+                self.unread = set(self.OUTPUT)
+                self.registers[HMCRegisterMap.SR] |= HMCRegisterMap.LOCK.mask
+            self.unread.discard(register)
+            value = self.registers[register]
+            if not self.unread:
+                self.registers[HMCRegisterMap.SR] &= ~(HMCRegisterMap.LOCK.mask | HMCRegisterMap.RDY.mask)
+                if self.pending is not None:
+                    data, self.pending = self.pending, None
+                    self.store(data)
+            return value
+        return self.registers[register]
+
+    def read_block(self, register, length, now):
+        # the register pointer wraps from the last register to the first
+        return [self.read((register + i) % (HMCRegisterMap.IRC + 1), now) for i in range(length)]
+
+    def write(self, register, value, now):
+        self.registers[register] = value
+        if register == HMCRegisterMap.MR:
+            self.unread = set()
+            self.pending = None
+            # a new mode discards the measurement not red yet
+            self.registers[HMCRegisterMap.SR] &= ~(HMCRegisterMap.LOCK.mask | HMCRegisterMap.RDY.mask)
+            mode = HMCRegisterMap.MD.decode(value)
+            if mode == "Single":
+                self.next_measurement = now + self.SINGLE_TIME
+            elif mode == "Continuous":
+                self.next_measurement = now
+            else:
+                self.next_measurement = None
+
+class SimulatedBus:
+    """
+    In-memory bus with the smbus2.SMBus methods used by I2CInterface.
+    Each call is one transaction, with configurable latency and error rate.
+
+    Attributes
+    ----------
+    devices : dict
+        Device models by address.
+    latency : float
+        Time spent in each transaction, in seconds.
+    byte_time : float
+        Additional time per transferred byte, in seconds.
+    error_rate : float
+        Probability of a transaction failing with OSError (EREMOTEIO).
+    transactions : int
+        Number of transactions.
+    bytes : int
+        Number of transferred bytes.
+    busy_time : float
+        Time spent simulating the transactions, in seconds.
+    """
+    def __init__(self, latency=0.0, byte_time=0.0, error_rate=0.0, seed=None, clock=time.monotonic):
+        """
+        Method to initialize the SimulatedBus object.
+
+        Parameters
+        ----------
+        latency : float, optional
+            Time spent in each transaction, in seconds. The default is 0.0.
+        byte_time : float, optional
+            Time per transferred byte, in seconds. The default is 0.0.
+        error_rate : float, optional
+            Probability of a failing transaction. The default is 0.0.
+        seed : int, optional
+            Seed of the error generator. The default is None.
+        clock : callable, optional
+            Time source in seconds. The default is time.monotonic.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.devices = {}
+        self.latency = latency
+        self.byte_time = byte_time
+        self.error_rate = error_rate
+        self.rng = np.random.default_rng(seed)
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.transactions = 0
+        self.bytes = 0
+        self.busy_time = 0.0
+
+    def add_device(self, address, model):
+        """
+        Function to connect a device model to the bus.
+
+        Parameters
+        ----------
+        address : hex
+            Address of the device.
+        model : DeviceModel
+            Simulated device.
+
+        Returns
+        -------
+        DeviceModel
+            The connected model.
+
+        """
+        self.devices[address] = model
+        return model
+
+    def transaction(self, address, length):
+        wait = self.latency + self.byte_time*length
+        if wait:
+            end = time.perf_counter() + wait
+            while time.perf_counter() < end:
+                pass
+            self.busy_time += wait
+        self.transactions += 1
+        if address not in self.devices:
+            raise OSError(errno.ENXIO, "No such device or address")
+        if self.error_rate and self.rng.random() < self.error_rate:
+            raise OSError(errno.EREMOTEIO, "Remote I/O error")
+        self.bytes += length
+        device = self.devices[address]
+        now = self.clock()
+        device.update(now)
+        return device, now
+
+    def read_byte_data(self, i2c_addr, register, force=None):
+        with self.lock:
+            device, now = self.transaction(i2c_addr, 2)
+            return device.read(register, now)
+
+    def write_byte_data(self, i2c_addr, register, value, force=None):
+        with self.lock:
+            device, now = self.transaction(i2c_addr, 2)
+            device.write(register, value & 0xFF, now)
+
+    def read_i2c_block_data(self, i2c_addr, register, length, force=None):
+        with self.lock:
+            device, now = self.transaction(i2c_addr, 1 + length)
+            return device.read_block(register, length, now)
+
+    def write_i2c_block_data(self, i2c_addr, register, data, force=None):
+        with self.lock:
+            device, now = self.transaction(i2c_addr, 1 + len(data))
+            for i, value in enumerate(data):
+                device.write(register + i, value & 0xFF, now)
+
+    def close(self):
+        pass
+
+class SimulatedInterrupt:
+    """
+    Waiter returning at the Data Ready time of a simulated MPU6050, usable
+    in place of gpio.GPIOInterrupt.
+    """
+    def __init__(self, bus, model):
+        self.bus = bus
+        self.model = model
+
+    def wait(self, timeout=None):
+        start = self.bus.clock()
+        with self.bus.lock:
+            next_sample = self.model.next_sample_time(start)
+        if next_sample is None or not self.model.field_get(MPURegisterMap.DATA_RDY_EN):
+            if timeout is not None:
+                time.sleep(timeout)
+            return False
+        delay = next_sample - start
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            return False
+        time.sleep(max(delay, 0))
+        return True
+
+    def close(self):
+        pass
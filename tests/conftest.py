@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Fixtures of the tests: sensors on the simulated bus, with the real or a
+manually advanced clock.
+"""
+
+import os
+import sys
+
+import pytest
+
+# the modules of the repository are imported from its root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from i2c import I2CInterface
+from simulated_bus import SimulatedBus, MPU6050Model
+from MPU6050.mpu6050 import MPU6050
+
+class ManualClock:
+    """
+    Clock of a SimulatedBus advanced by the test.
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return ManualClock()
+
+@pytest.fixture
+def sensor():
+    bus = SimulatedBus()
+    bus.add_device(0x68, MPU6050Model())
+    sensor = MPU6050(0x68, i2c=I2CInterface(1, bus=bus))
+    sensor.bring_up()
+    return sensor
+
+@pytest.fixture
+def manual_sensor(clock):
+    bus = SimulatedBus(clock=clock)
+    bus.add_device(0x68, MPU6050Model())
+    sensor = MPU6050(0x68, i2c=I2CInterface(1, bus=bus))
+    # no bring_up, the first sample comes only when the test advances the clock
+    sensor.reset()
+    sensor.wakeup()
+    sensor.sample_rate_get()
+    sensor.gyro_config_get()
+    sensor.accel_config_get()
+    return sensor
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the asyncio interface of the sensors.
+"""
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from async_sensor import AsyncMPU6050, AsyncSensor, bus_executor
+from i2c import I2CInterface
+from MPU6050.mpu6050 import MPU6050
+from simulated_bus import MPU6050Model
+
+def test_executor_per_bus_number(sensor):
+    # a second interface on the same bus shares the executor
+    sensor.i2c.bus.add_device(0x69, MPU6050Model())
+    other = MPU6050(0x69, i2c=I2CInterface(sensor.i2c.bus_number, bus=sensor.i2c.bus))
+    assert AsyncMPU6050(other).executor is AsyncMPU6050(sensor).executor
+    assert bus_executor(I2CInterface(7, bus=sensor.i2c.bus)) is not bus_executor(sensor.i2c)
+
+def test_abstract():
+    with pytest.raises(TypeError):
+        AsyncSensor(None)
+
+def test_stream(sensor):
+    async def main():
+        device = AsyncMPU6050(sensor)
+        batches = []
+        async for data in device.stream(rate=500, batch=4):
+            batches.append(data)
+            if len(batches) == 3:
+                break
+        accel, temp, gyro = await device.sample_get()
+        return batches, accel
+    batches, accel = asyncio.run(main())
+    assert [batch.shape for batch in batches] == [(4, 7)]*3
+    np.testing.assert_allclose(np.vstack(batches)[:, 2], 1, atol=1e-3)
+    np.testing.assert_allclose(accel, [0, 0, 1], atol=1e-3)
+
+def test_stream_fifo(sensor):
+    sensor.fifo_config_set(accel=True, gyro=True)
+    sensor.fifo_enable()
+    async def main():
+        async for data in AsyncMPU6050(sensor, fifo=True).stream(rate=200, batch=2):
+            return data
+    data = asyncio.run(main())
+    assert data.shape[1] == 6 and len(data) > 2
+    assert sensor.fifo_overflows == 0
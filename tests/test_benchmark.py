@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the acquisition benchmark.
+"""
+
+import pytest
+
+from benchmark import benchmark
+
+@pytest.fixture(scope="module")
+def results():
+    return benchmark(duration=0.2, divider=1, fifo_interval=0.005)
+
+@pytest.mark.parametrize("path", ["per_axis", "full_sample", "fifo_drain"])
+def test_sample_rate(results, path):
+    # 500 Hz device: no sample counted twice
+    assert results[path]["samples_per_s"] <= 550
+    assert results[path]["polls_per_s"] >= 100
+
+def test_multi_device_rate(results):
+    assert results["multi_device"]["samples_per_s"] <= 1100
+
+def test_fifo_latency(results):
+    # the samples are at most one drain interval old, plus the read
+    fifo = results["fifo_drain"]
+    assert fifo["latency_p50_us"] < 5000
+    assert fifo["transactions_per_sample"] < results["full_sample"]["transactions_per_sample"]
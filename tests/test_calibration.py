@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the calibration of the MPU6050 on the simulated bus.
+"""
+
+import numpy as np
+import pytest
+
+from i2c import I2CInterface
+from MPU6050 import calibration
+from MPU6050.mpu6050 import MPU6050
+from MPU6050.register_map import RegisterMap
+from simulated_bus import SimulatedBus, MPU6050Model
+
+def test_calibrate_after_bring_up(sensor):
+    # 8 kHz after bring_up, the case that used to overflow forever
+    profile = sensor.calibrate(samples=200, rate=None)
+    np.testing.assert_allclose(profile.gyro_bias, 0, atol=0.01)
+    np.testing.assert_allclose(profile.accel_offset, 0, atol=0.001)
+    assert sensor.calibration is profile
+    assert sensor.fifo_overflows == 0
+
+def test_calibrate_restores_rate_and_fifo(sensor):
+    sensor.fifo_config_set(accel=False, gyro=True, temp=True)
+    channels = list(sensor.fifo_channels)
+    fifo_en = sensor.register_get(RegisterMap.FIFO_EN)
+    sensor.calibrate(samples=50, rate=500)
+    assert sensor.sr == 8
+    assert sensor.fifo_channels == channels
+    assert sensor.register_get(RegisterMap.FIFO_EN) == fifo_en
+    assert sensor.field_get(RegisterMap.USER_FIFO_EN) == 0
+    assert sensor.config_snapshot().sample_rate == 8000
+
+def test_collect_burst(sensor):
+    samples = calibration.collect(sensor, 20, fifo=False, rate=1000)
+    assert samples.shape == (20, 6)
+    np.testing.assert_allclose(samples[:, 2], 1)
+
+def test_collect_timeout(sensor):
+    with pytest.raises(OSError):
+        calibration.collect(sensor, 100000, rate=200, timeout=0.05)
+    assert sensor.sr == 8
+
+def test_accel_six_position():
+    scale = np.array([1.02, 0.98, 1.01])
+    offset = np.array([0.01, -0.02, 0.03])
+    means = calibration.ORIENTATIONS*scale + offset
+    fitted_offset, fitted_scale = calibration.accel_six_position(means)
+    np.testing.assert_allclose(fitted_offset, offset)
+    np.testing.assert_allclose(fitted_scale, scale)
+
+class BiasedMotion:
+    """
+    Still device with accel offset and scale errors and a gyro bias, turned
+    in the six orientations by the wait callback.
+    """
+    SCALE = np.array([1.02, 0.98, 1.01])
+    OFFSET = np.array([0.02, -0.03, 0.05])
+    BIAS = np.array([1.5, -0.5, 0.25])
+
+    def __init__(self):
+        self.labels = iter(range(6))
+        self.gravity = calibration.ORIENTATIONS[4]
+
+    def turn(self, message):
+        self.gravity = calibration.ORIENTATIONS[next(self.labels)]
+
+    def __call__(self, t):
+        accel = np.tile(self.gravity*self.SCALE + self.OFFSET, (len(t), 1))
+        return accel, np.tile(self.BIAS, (len(t), 1)), np.full(len(t), 25.0)
+
+@pytest.fixture
+def biased():
+    motion = BiasedMotion()
+    bus = SimulatedBus()
+    bus.add_device(0x68, MPU6050Model(motion=motion))
+    sensor = MPU6050(0x68, i2c=I2CInterface(1, bus=bus))
+    sensor.bring_up()
+    return sensor, motion
+
+def test_recalibrate(biased, tmp_path):
+    sensor, motion = biased
+    store = calibration.ProfileStore(tmp_path/"profiles.json")
+    first = sensor.calibrate(samples=100, store=store)
+    np.testing.assert_allclose(first.gyro_bias, motion.BIAS, atol=0.01)
+    # fitted again on raw samples, not on the calibrated ones
+    second = sensor.calibrate(samples=100)
+    np.testing.assert_allclose(second.gyro_bias, first.gyro_bias)
+    np.testing.assert_allclose(second.accel_offset, first.accel_offset)
+    assert sensor.calibration is second
+    np.testing.assert_allclose(sensor.gyro_get(), 0, atol=0.01)
+    assert store.load(first.key).to_dict() == first.to_dict()
+
+def test_calibration_kept_on_error(biased):
+    sensor, motion = biased
+    profile = sensor.calibrate(samples=100)
+    with pytest.raises(OSError):
+        calibration.collect(sensor, 100000, timeout=0.05)
+    assert sensor.calibration is profile
+
+def test_calibrate_six_position(biased, tmp_path):
+    sensor, motion = biased
+    sensor.calibrate(samples=100)
+    store = calibration.ProfileStore(tmp_path/"profiles.json")
+    profile = calibration.calibrate_six_position(sensor, n=100, wait=motion.turn, rate=500, store=store)
+    # accel quantization of 1/16384 g
+    np.testing.assert_allclose(profile.accel_offset, motion.OFFSET, atol=2e-4)
+    np.testing.assert_allclose(profile.accel_scale, motion.SCALE, atol=2e-4)
+    np.testing.assert_allclose(profile.gyro_bias, motion.BIAS, atol=0.01)
+    assert sensor.calibration is profile
+    assert store.load(profile.key) is not None
+    np.testing.assert_allclose(sensor.accel_get(), calibration.ORIENTATIONS[5], atol=1e-3)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the configuration snapshots and of the sample rate planner.
+"""
+
+import pytest
+
+from MPU6050.config import MPU6050Config, rate_plan, runs
+from MPU6050.register_map import RegisterMap
+
+@pytest.mark.parametrize("rate", [10, 50, 100, 200, 300, 500, 1000])
+def test_rate_plan_no_aliasing(rate):
+    plan = rate_plan(rate)
+    assert plan.rate >= rate
+    assert max(plan.accel_bandwidth, plan.gyro_bandwidth) <= plan.rate/2
+
+def test_rate_plan_300():
+    plan = rate_plan(300)
+    assert plan.dlpf_cfg == 2
+    assert plan.smplrt_div == 2
+
+def test_rate_plan_bandwidth():
+    plan = rate_plan(100, 40)
+    assert (plan.dlpf_cfg, plan.smplrt_div, plan.rate) == (3, 9, 100)
+    assert rate_plan(500, 200).dlpf_cfg == 0
+
+def test_rate_plan_unreachable():
+    with pytest.raises(ValueError):
+        rate_plan(9000, accel=False)
+    with pytest.raises(ValueError):
+        rate_plan(100, 300)
+
+def test_rate_plan_low_rate():
+    # below 10 Hz no bandwidth is under the Nyquist frequency, the lowest is kept
+    plan = rate_plan(5)
+    assert (plan.dlpf_cfg, plan.rate) == (6, 5)
+
+def test_rate_plan_accel_rate():
+    # the accel outputs 1 kHz: faster plans would repeat its samples
+    with pytest.raises(ValueError, match="accel"):
+        rate_plan(2000)
+    plan = rate_plan(2000, accel=False)
+    assert plan.dlpf_cfg == 0 and plan.rate == 2000 and plan.accel_rate == 1000
+    assert rate_plan(8000, accel=False).rate == 8000
+    assert rate_plan(500).accel_rate == 500
+
+def test_runs():
+    assert runs(RegisterMap.SHADOW_REGISTERS) == [(0x19, 4), (0x23, 5), (0x37, 2), (0x67, 1), (0x6A, 3)]
+
+def test_snapshot_apply(sensor):
+    stats = sensor.i2c.instrument()
+    config = sensor.config_snapshot().with_fields({RegisterMap.FS_SEL : 3, RegisterMap.AFS_SEL : 2})
+    config = MPU6050Config(**{**config.__dict__, "smplrt_div" : 9})
+    stats.reset()
+    sensor.config_apply(config, verify=True)
+    registers = stats.snapshot(reset=True)["registers"]["0x68"]
+    # one block write of SMPLRT_DIV..ACCEL_CONFIG, CONFIG rewritten with its
+    # shadow value to fill the gap, and the readback of the changed
+    # registers only: SMPLRT_DIV, then GYRO_CONFIG..ACCEL_CONFIG
+    assert registers["0x19"]["write"]["transactions"] == 1
+    assert registers["0x19"]["write"]["bytes"] == 4
+    assert registers["0x19"]["read"]["bytes"] == 1
+    assert registers["0x1b"]["read"]["bytes"] == 2
+    assert sum(len(by_op) for by_op in registers.values()) == 3
+    sensor.config_apply(config)
+    assert not stats.snapshot()["devices"]
+    assert sensor.config_snapshot() == config
+    assert sensor.gyro_fs == RegisterMap.GYRO_LSB[3]
+
+def test_output_rate_set(sensor):
+    plan = sensor.output_rate_set(200)
+    assert sensor.sr == plan.rate/1000
+    assert sensor.config_snapshot().sample_rate == plan.rate
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the FIFO streaming of the MPU6050.
+"""
+
+import numpy as np
+
+from MPU6050.register_map import RegisterMap
+
+def test_fifo_read_frames(manual_sensor, clock):
+    manual_sensor.fifo_config_set(accel=True, gyro=True, temp=False)
+    manual_sensor.fifo_enable()
+    # 8 kHz after a reset: 40 samples in 5 ms
+    clock.advance(0.005)
+    data = manual_sensor.fifo_read()
+    assert data.shape == (40, 6)
+    assert np.all(data[:, 2] == RegisterMap.ACCEL_LSB[0])
+    assert manual_sensor.fifo_overflows == 0
+
+def test_fifo_read_overflow(manual_sensor, clock):
+    manual_sensor.fifo_config_set(accel=True, gyro=True, temp=False)
+    manual_sensor.fifo_enable()
+    # 85 frames of 12 bytes fill the FIFO in about 10 ms at 8 kHz
+    clock.advance(0.05)
+    assert len(manual_sensor.fifo_read()) == 0
+    assert manual_sensor.fifo_overflows == 1
+    # the FIFO was reset, the acquisition goes on
+    clock.advance(0.001)
+    assert len(manual_sensor.fifo_read()) == 8
+    assert manual_sensor.fifo_overflows == 1
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the streaming filters and decimators.
+"""
+
+import time
+
+import numpy as np
+import pytest
+
+from filters import (BiquadFilter, FilterChain, FIRFilter, StreamFilter, butterworth_lowpass,
+                     decimator, fir_lowpass)
+
+def recursion(sections, x):
+    # direct form I, one sample at a time, started at the steady state of x[0]
+    for b0, b1, b2, a1, a2 in sections:
+        y = np.empty_like(x)
+        x1 = x2 = x[0]
+        y1 = y2 = x[0]*(b0 + b1 + b2)/(1 + a1 + a2)
+        for k in range(len(x)):
+            y[k] = b0*x[k] + b1*x1 + b2*x2 - a1*y1 - a2*y2
+            x2, x1, y2, y1 = x1, x[k], y1, y[k]
+        x = y
+    return x
+
+def convolution(taps, x):
+    xe = np.concatenate([np.repeat(x[:1], len(taps) - 1, axis=0), x])
+    return np.stack([np.convolve(xe[:, c], taps, mode="valid") for c in range(x.shape[1])], axis=1)
+
+@pytest.fixture
+def signal():
+    rng = np.random.default_rng(0)
+    return rng.normal(size=(2003, 3)) + [0, 0, 1]
+
+CHUNKS = [1, 2, 70, 500, 1777]
+
+@pytest.mark.parametrize("factor", [1, 8, 40])
+def test_biquad(signal, factor):
+    sections = butterworth_lowpass(80, 8000, 5)
+    expected = recursion(sections, signal)[::factor]
+    np.testing.assert_allclose(BiquadFilter(sections, factor).process(signal), expected, atol=1e-9)
+    stream = BiquadFilter(sections, factor)
+    chunks = np.vstack([stream.process(chunk) for chunk in np.array_split(signal, CHUNKS)])
+    np.testing.assert_allclose(chunks, expected, atol=1e-9)
+
+@pytest.mark.parametrize("factor", [1, 5])
+def test_fir(signal, factor):
+    taps = fir_lowpass(100, 1000, 31)
+    expected = convolution(taps, signal)[::factor]
+    np.testing.assert_allclose(FIRFilter(taps, factor).process(signal), expected, atol=1e-12)
+    stream = FIRFilter(taps, factor)
+    chunks = np.vstack([stream.process(chunk) for chunk in np.array_split(signal, CHUNKS)])
+    np.testing.assert_allclose(chunks, expected, atol=1e-12)
+
+def test_decimator_still():
+    # the gravity offset starts without a transient
+    out = decimator(8000, 200).process(np.tile([0.0, 0.0, 1.0], (400, 1)))
+    assert out.shape == (10, 3)
+    np.testing.assert_allclose(out, [[0, 0, 1]]*10, atol=1e-12)
+    with pytest.raises(ValueError):
+        decimator(1000, 300)
+
+def test_chain_timed(signal):
+    chain = FilterChain(BiquadFilter(butterworth_lowpass(400, 8000), 8), FIRFilter(fir_lowpass(80, 1000, 41), 5))
+    timestamps = np.arange(len(signal))
+    first = chain.process_timed(timestamps[:1000], signal[:1000])
+    second = chain.process_timed(timestamps[1000:], signal[1000:])
+    kept = np.concatenate([first[0], second[0]])
+    np.testing.assert_array_equal(kept, timestamps[::40])
+    assert len(first[1]) + len(second[1]) == len(kept)
+
+def test_abstract():
+    with pytest.raises(TypeError):
+        StreamFilter()
+
+def test_chain_initial():
+    taps = fir_lowpass(80, 1000, 41)
+    # the stages keep their own initial state by default
+    chain = FilterChain(FIRFilter(taps, initial="zero"), FIRFilter(taps))
+    assert [stage.initial for stage in chain.stages] == ["zero", "first"]
+    chain = FilterChain(FIRFilter(taps), FIRFilter(taps), initial="zero")
+    assert [stage.initial for stage in chain.stages] == ["zero", "zero"]
+    # from zero the constant input rises through the transient
+    out = chain.process(np.ones((100, 1)))
+    assert out[0, 0] < 0.1 and abs(out[-1, 0] - 1) < 1e-3
+    with pytest.raises(ValueError):
+        FilterChain(FIRFilter(taps), initial="last")
+
+def test_fifo_stream(sensor):
+    # the decimator on the 8 kHz FIFO stream of a still sensor
+    stage = decimator(sensor.sr*1000, 200)
+    sensor.fifo_config_set(accel=True, gyro=True)
+    sensor.fifo_enable()
+    out = []
+    for _ in range(100):
+        time.sleep(0.002)
+        out.append(stage.process(sensor.fifo_read(scaled=True)))
+        if sum(map(len, out)) >= 10:
+            break
+    assert sensor.fifo_overflows == 0
+    np.testing.assert_allclose(np.vstack(out)[:, 2], 1, atol=1e-3)
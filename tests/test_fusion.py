@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the attitude filters.
+"""
+
+import numpy as np
+import pytest
+
+from MPU6050.calibration import collect
+from fusion import (AttitudeFilter, ComplementaryFilter, MadgwickFilter, MahonyFilter,
+                    euler_to_quaternion, tilt)
+
+def motion(n, seed=0):
+    rng = np.random.default_rng(seed)
+    gyro = rng.normal(0, 5, (n, 3))
+    accel = rng.normal(0, 0.05, (n, 3)) + [0, 0, 1]
+    return gyro, accel
+
+def recursion(alpha, gyro, accel, dt):
+    # reference: the filter sample by sample, without magnetometer the yaw
+    # is the integrated gyro
+    angles = np.zeros(3)
+    out = np.empty((len(gyro), 3))
+    for k in range(len(gyro)):
+        angles[:2] = alpha*(angles[:2] + gyro[k, :2]*dt) + (1 - alpha)*tilt(accel[k])[0]
+        angles[2] += gyro[k, 2]*dt
+        out[k] = angles
+    return euler_to_quaternion(out)
+
+def test_abstract():
+    with pytest.raises(TypeError):
+        AttitudeFilter()
+
+def test_complementary_without_mag():
+    n, dt = 1000, 0.005
+    gyro = np.tile([0.0, 0.0, 10.0], (n, 1))
+    accel = np.tile([0.0, 0.0, 1.0], (n, 1))
+    fusion = ComplementaryFilter()
+    quaternions = fusion.update(gyro, accel, dt)
+    assert np.isfinite(quaternions).all()
+    roll, pitch, yaw = fusion.euler()
+    np.testing.assert_allclose([roll, pitch], 0, atol=1e-9)
+    # the yaw is the integrated gyro, 10 º/s for 5 s
+    np.testing.assert_allclose(yaw, 50, atol=1e-6)
+
+@pytest.mark.parametrize("alpha", [0.98, 0.5, 1e-3, 0.0])
+def test_complementary_recursion(alpha):
+    gyro, accel = motion(300)
+    quaternions = ComplementaryFilter(alpha).update(gyro, accel, 0.01)
+    assert np.isfinite(quaternions).all()
+    expected = recursion(alpha, gyro, accel, 0.01)
+    np.testing.assert_allclose(np.abs(np.sum(quaternions*expected, axis=1)), 1, atol=1e-9)
+
+def test_complementary_alpha_zero():
+    # only the accel: the roll and pitch are the measured tilt
+    gyro, accel = motion(50)
+    fusion = ComplementaryFilter(0.0)
+    fusion.update(gyro, accel, 0.01)
+    np.testing.assert_allclose(fusion.euler()[:2], tilt(accel[-1])[0], atol=1e-9)
+
+def test_complementary_chunks():
+    gyro, accel = motion(700)
+    one = ComplementaryFilter().update(gyro, accel, 0.01)
+    fusion = ComplementaryFilter()
+    chunks = np.vstack([fusion.update(gyro[i:i + 97], accel[i:i + 97], 0.01) for i in range(0, 700, 97)])
+    np.testing.assert_allclose(np.abs(np.sum(one*chunks, axis=1)), 1, atol=1e-9)
+
+def test_filters_on_sensor(sensor):
+    data = collect(sensor, 200, fifo=False)
+    for fusion in (ComplementaryFilter(), MahonyFilter(), MadgwickFilter()):
+        quaternions = fusion.update(data[:, 3:], data[:, :3], 0.005)
+        assert np.isfinite(quaternions).all()
+        np.testing.assert_allclose(fusion.euler()[:2], 0, atol=1e-6)
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the HMC5883L driver on the simulated bus.
+"""
+
+import numpy as np
+import pytest
+
+from i2c import I2CInterface
+from simulated_bus import SimulatedBus, HMC5883LModel
+from HMC5883L.hmc5883l import HMC5883L
+from HMC5883L.register_map import RegisterMap
+
+class NeverReady:
+    # DRDY not wired
+    def wait(self, timeout):
+        return False
+
+@pytest.fixture
+def magnetometer():
+    bus = SimulatedBus()
+    bus.add_device(0x1E, HMC5883LModel())
+    magnetometer = HMC5883L(0x1E, i2c=I2CInterface(1, bus=bus))
+    magnetometer.wakeup()
+    return magnetometer
+
+def test_read_raw(magnetometer):
+    transactions = magnetometer.i2c.bus.transactions
+    raw = magnetometer.read_raw()
+    # one block read, the X, Z, Y registers ordered as x, y, z
+    assert magnetometer.i2c.bus.transactions == transactions + 1
+    np.testing.assert_array_equal(raw, np.rint(np.array([0.2, -0.05, 0.4])*magnetometer.gain))
+    np.testing.assert_allclose(magnetometer.read_mag(), [200, -50, 400], atol=2)
+
+def test_overflow(magnetometer):
+    model = magnetometer.i2c.bus.devices[0x1E]
+    model.magnetic = lambda t: np.tile([0.2, 9.0, 0.4], (len(t), 1))
+    magnetometer.read_mag()
+    mag = magnetometer.read_mag()
+    np.testing.assert_array_equal(magnetometer.overflow, [False, True, False])
+    np.testing.assert_allclose(mag[[0, 2]], [200, 400], atol=2)
+
+def test_single_measurement(magnetometer):
+    mag = magnetometer.single_measurement(timeout=0.05)
+    np.testing.assert_allclose(mag, [200, -50, 400], atol=2)
+    # back to idle after the measurement
+    assert RegisterMap.MD.decode(magnetometer.read_data(RegisterMap.MR)) == "Idle"
+
+def test_read_high_rate(magnetometer):
+    data, timestamps, stats = magnetometer.read_high_rate(10)
+    assert data.shape == (10, 3) and timestamps.shape == (10,)
+    assert np.isfinite(data).all()
+    assert stats["missed"] == 0
+    # above the 75 Hz of the continuous mode
+    assert stats["rate_hz"] > 75
+    np.testing.assert_allclose(data, np.tile([200, -50, 400], (10, 1)), atol=2)
+
+def test_read_high_rate_overflow(magnetometer):
+    model = magnetometer.i2c.bus.devices[0x1E]
+    model.magnetic = lambda t: np.tile([0.2, 9.0, 0.4], (len(t), 1))
+    data, timestamps, stats = magnetometer.read_high_rate(3)
+    assert np.isnan(data[:, 1]).all() and np.isfinite(data[:, [0, 2]]).all()
+    assert stats["overflows"] == 3
+
+def test_read_high_rate_never_ready(magnetometer):
+    data, timestamps, stats = magnetometer.read_high_rate(1000, waiter=NeverReady(), max_missed=5)
+    assert data.shape == (0, 3) and timestamps.shape == (0,)
+    assert stats == {"rate_hz" : 0.0, "missed" : 5, "overflows" : 0}
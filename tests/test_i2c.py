@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the register field codec and of the I2C interface.
+"""
+
+import pytest
+
+from i2c import BitField, I2CInterface, I2CStats, pack
+from simulated_bus import SimulatedBus, MPU6050Model
+from HMC5883L.register_map import RegisterMap as HMCRegisterMap
+from MPU6050.register_map import RegisterMap
+
+def test_bitfield():
+    field = BitField(0x1B, 3, 2)
+    assert field.mask == 0b00011000
+    assert field.encode(3) == 0b00011000
+    assert field.decode(0b11110111) == 2
+    assert field.insert(0b11111111, 0) == 0b11100111
+    with pytest.raises(ValueError):
+        field.encode(4)
+    with pytest.raises(ValueError):
+        field.encode(-1)
+
+def test_bitfield_values():
+    mode = HMCRegisterMap.MD
+    code = mode.encode("Single")
+    assert mode.decode(code) == "Single"
+    with pytest.raises(ValueError):
+        mode.encode("Fast")
+
+def test_pack():
+    data = pack({RegisterMap.FS_SEL : 3, RegisterMap.XG_ST : 1})
+    assert data == 0b10011000
+    # bits outside the fields are kept
+    assert pack({RegisterMap.FS_SEL : 0}, data) == 0b10000000
+    with pytest.raises(ValueError):
+        pack({RegisterMap.FS_SEL : 0, RegisterMap.AFS_SEL : 0})
+
+def test_modify_register(sensor):
+    # bit strings indexed from the MSB, as before the codec
+    sensor.modify_register(RegisterMap.GYRO_CONFIG, "11", 3)
+    assert sensor.field_get(RegisterMap.FS_SEL) == 3
+    with pytest.raises(ValueError):
+        sensor.modify_register(RegisterMap.GYRO_CONFIG, "111", 6)
+
+def test_stats_instrument(sensor):
+    stats = sensor.i2c.instrument()
+    assert sensor.i2c.instrument() is stats
+    sensor.read_raw()
+    sensor.read_raw()
+    entry = stats.snapshot()["registers"]["0x68"][f"{RegisterMap.ACCEL_XOUT_H:#04x}"]["read"]
+    assert entry["transactions"] == 2 and entry["bytes"] == 28 and entry["errors"] == 0
+    assert sum(entry["histogram"]) == 2
+    assert sensor.i2c.instrument(False) is None
+    sensor.read_raw()
+    assert stats.snapshot()["devices"]["0x68"]["transactions"] == 2
+
+def test_stats_errors():
+    bus = SimulatedBus(error_rate=1.0)
+    bus.add_device(0x68, MPU6050Model())
+    i2c = I2CInterface(1, bus=bus)
+    stats = i2c.instrument()
+    with pytest.raises(OSError):
+        i2c.read_byte(0x68, RegisterMap.WHO_AM_I)
+    device = stats.snapshot()["devices"]["0x68"]
+    assert device["transactions"] == 1 and device["errors"] == 1 and device["bytes"] == 0
+
+def test_stats_snapshot_reset():
+    stats = I2CStats(1)
+    stats.record("read", 0x68, 0x3B, 14, 30_000)
+    stats.record("read", 0x68, 0x3B, 14, 1_000_000_000)
+    stats.record("write", 0x68, 0x6B, 1, 5_000)
+    snapshot = stats.snapshot(reset=True)
+    entry = snapshot["registers"]["0x68"]["0x3b"]["read"]
+    # 30 us in the 50 us bucket, 1 s in +Inf
+    assert entry["histogram"][2] == 1 and entry["histogram"][-1] == 1
+    assert entry["latency_us"] == 1_000_030
+    assert snapshot["devices"]["0x68"]["transactions"] == 3
+    assert snapshot["devices"]["0x68"]["bytes"] == 29
+    assert stats.snapshot()["devices"] == {}
+
+def test_stats_prometheus():
+    stats = I2CStats(1)
+    stats.record("read", 0x68, 0x3B, 14, 30_000)
+    stats.record("read", 0x68, 0x3B, 14, 150_000)
+    lines = stats.to_prometheus().splitlines()
+    labels = 'bus="1",address="0x68",register="0x3b",op="read"'
+    assert f"i2c_transactions_total{{{labels}}} 2" in lines
+    assert f"i2c_bytes_total{{{labels}}} 28" in lines
+    assert f'i2c_latency_seconds_bucket{{{labels},le="5e-05"}} 1' in lines
+    assert f'i2c_latency_seconds_bucket{{{labels},le="+Inf"}} 2' in lines
+    assert f"i2c_latency_seconds_count{{{labels}}} 2" in lines
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the synchronized MPU6050 array.
+"""
+
+import numpy as np
+import pytest
+
+from imu_array import MPU6050Array
+from MPU6050.mpu6050 import MPU6050
+from MPU6050.register_map import RegisterMap
+from simulated_bus import MPU6050Model
+
+@pytest.fixture
+def array(sensor):
+    sensor.i2c.bus.add_device(0x69, MPU6050Model())
+    return MPU6050Array([sensor, MPU6050(0x69, i2c=sensor.i2c)])
+
+def test_configure(array):
+    array.configure(divider=4, dlpf=3, fs_sel=1, afs_sel=2)
+    for sensor in array.sensors:
+        config = sensor.config_snapshot()
+        assert (config.smplrt_div, config.dlpf_cfg, config.fs_sel, config.afs_sel, config.sleep) == (4, 3, 1, 2, 0)
+        assert sensor.sr == 0.2
+        assert sensor.gyro_fs == RegisterMap.GYRO_LSB[1]
+        assert sensor.accel_fs == RegisterMap.ACCEL_LSB[2]
+
+def test_configure_rate(array):
+    array.configure(rate=100)
+    for sensor in array.sensors:
+        assert sensor.config_snapshot().sample_rate == 100
+        assert sensor.sr == 0.1
+
+def test_read(array):
+    array.configure(afs_sel=1)
+    data, timestamps = array.read(5, rate=500)
+    assert data.shape == (2, 5, 7) and timestamps.shape == (2, 5)
+    # the first slot can hold the samples of the previous configuration
+    scaled = array.scale(data)[:, 1:]
+    np.testing.assert_allclose(scaled[:, :, 2], 1, atol=1e-3)
+    np.testing.assert_allclose(scaled[:, :, 3], 25, atol=0.01)
+    skew = array.host_skew(timestamps)
+    assert skew["max_us"][0] == 0
+    # the second sensor is red after the first one in each slot
+    assert skew["mean_us"][1] > 0
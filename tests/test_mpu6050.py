@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the MPU6050 driver on the simulated bus.
+"""
+
+import time
+
+import numpy as np
+import pytest
+
+from MPU6050.config import MPU6050Config
+from MPU6050.register_map import RegisterMap
+from simulated_bus import HMC5883LModel
+
+def test_status_without_print(sensor, capsys):
+    assert sensor.who_am_i()
+    sensor.temp_disable()
+    assert sensor.field_get(RegisterMap.TEMP_DIS) == 1
+    sensor.temp_enable()
+    assert sensor.field_get(RegisterMap.TEMP_DIS) == 0
+    assert not sensor.pass_through_mode_get()
+    sensor.pass_through_mode_set(True)
+    assert sensor.pass_through_mode_get()
+    assert capsys.readouterr().out == ""
+
+def test_who_am_i_other_device(sensor):
+    sensor.i2c.bus.devices[0x68].registers[RegisterMap.WHO_AM_I] = 0x72
+    assert not sensor.who_am_i()
+
+def test_shadow_write_only(sensor):
+    bus = sensor.i2c.bus
+    transactions = bus.transactions
+    # the configuration comes from the shadow copy, one write per field
+    sensor.field_set(RegisterMap.DLPF_CFG, 3)
+    sensor.fields_set({RegisterMap.FS_SEL : 2, RegisterMap.XG_ST : 0})
+    assert bus.transactions == transactions + 2
+    assert sensor.field_get(RegisterMap.DLPF_CFG) == 3
+    assert bus.transactions == transactions + 2
+    assert bus.devices[0x68].registers[RegisterMap.CONFIG] == 3
+
+def test_shadow_hold(sensor):
+    bus = sensor.i2c.bus
+    transactions = bus.transactions
+    sensor.hold_changes()
+    sensor.hold_changes()
+    sensor.field_set(RegisterMap.FS_SEL, 1)
+    sensor.field_set(RegisterMap.AFS_SEL, 1)
+    sensor.apply_changes()
+    # nested: still held
+    assert bus.transactions == transactions
+    assert bus.devices[0x68].registers[RegisterMap.GYRO_CONFIG] == 0
+    sensor.field_set(RegisterMap.FS_SEL, 3)
+    sensor.apply_changes()
+    # GYRO_CONFIG and ACCEL_CONFIG in one block write
+    assert bus.transactions == transactions + 1
+    assert bus.devices[0x68].registers[RegisterMap.GYRO_CONFIG] == RegisterMap.FS_SEL.encode(3)
+    assert bus.devices[0x68].registers[RegisterMap.ACCEL_CONFIG] == RegisterMap.AFS_SEL.encode(1)
+    assert not sensor.dirty
+
+def test_shadow_reload(sensor):
+    # a change behind the driver is seen after the shadow copy is discarded
+    bus = sensor.i2c.bus
+    bus.devices[0x68].registers[RegisterMap.SMPLRT_DIV] = 7
+    assert sensor.register_get(RegisterMap.SMPLRT_DIV) != 7
+    sensor.shadow_invalidate()
+    assert sensor.register_get(RegisterMap.SMPLRT_DIV) == 7
+    transactions = bus.transactions
+    sensor.shadow_load()
+    assert bus.transactions == transactions + len(RegisterMap.SHADOW_REGISTERS)
+    assert set(sensor.shadow) == set(RegisterMap.SHADOW_REGISTERS)
+
+def test_shadow_self_clearing(sensor):
+    # the reset bits are written but never kept in the shadow copy
+    sensor.field_set(RegisterMap.FIFO_RESET, 1)
+    assert sensor.field_get(RegisterMap.FIFO_RESET) == 0
+
+def test_bring_up(sensor):
+    # from any state: asleep, on the internal oscillator, other ranges
+    sensor.sleep()
+    sensor.field_set(RegisterMap.CLKSEL, RegisterMap.CLOCK_INTERNAL)
+    sensor.gyro_config_set(0, 0, 0, 2)
+    config = MPU6050Config().with_fields({RegisterMap.FS_SEL : 3, RegisterMap.DLPF_CFG : 3})
+    durations = sensor.bring_up(config, verify=True)
+    assert set(durations) == {"reset_ms", "config_ms", "first_sample_ms", "total_ms"}
+    power = sensor.read_data(RegisterMap.PWR_MGMT_1)
+    assert RegisterMap.SLEEP.decode(power) == 0
+    assert RegisterMap.CLKSEL.decode(power) == RegisterMap.CLOCK_PLL
+    assert sensor.config_snapshot() == config.with_fields({RegisterMap.SLEEP : 0, RegisterMap.CLKSEL : RegisterMap.CLOCK_PLL})
+    assert sensor.gyro_fs == RegisterMap.GYRO_LSB[3]
+    np.testing.assert_allclose(sensor.accel, [0, 0, 1], atol=1e-3)
+
+def test_wakeup_keeps_clock(sensor):
+    sensor.sleep()
+    sensor.field_set(RegisterMap.CLKSEL, RegisterMap.CLOCK_INTERNAL)
+    sensor.wakeup()
+    power = sensor.read_data(RegisterMap.PWR_MGMT_1)
+    assert RegisterMap.SLEEP.decode(power) == 0
+    assert RegisterMap.CLKSEL.decode(power) == RegisterMap.CLOCK_INTERNAL
+
+def test_mode_aolp(sensor):
+    sensor.mode_AOLP()
+    power = sensor.read_data(RegisterMap.PWR_MGMT_1)
+    assert RegisterMap.CYCLE.decode(power) == 1 and RegisterMap.SLEEP.decode(power) == 0
+    assert RegisterMap.CLKSEL.decode(power) == RegisterMap.CLOCK_INTERNAL
+
+def aux_magnetometer(sensor, field):
+    model = HMC5883LModel(field=lambda t: np.tile(field, (len(t), 1)))
+    sensor.i2c.bus.devices[0x68].add_aux_device(0x1E, model)
+    sensor.aux_magnetometer_enable()
+    end = time.monotonic() + 1
+    while not sensor.read_raw_aux()[7:].any() and time.monotonic() < end:
+        time.sleep(0.002)
+
+def test_sample_aux(sensor):
+    aux_magnetometer(sensor, [0.2, -0.4, 0.5])
+    accel, temp, gyro, mag = sensor.sample_aux_get()
+    np.testing.assert_allclose(accel, [0, 0, 1], atol=1e-3)
+    np.testing.assert_allclose(mag, [200, -400, 500], atol=1)
+
+def test_sample_aux_overflow(sensor):
+    # 5 Ga on y is out of the 1.3 Ga range of the default gain
+    aux_magnetometer(sensor, [0.2, 5.0, 0.5])
+    mag = sensor.sample_aux_get()[3]
+    assert np.isnan(mag[1])
+    np.testing.assert_allclose(mag[[0, 2]], [200, 500], atol=1)
+    frames = sensor.fifo_scale(sensor.read_raw_aux()[None, 7:], ["mag_x", "mag_z", "mag_y"])
+    assert np.isnan(frames[0, 2]) and np.isfinite(frames[0, :2]).all()
+
+def test_sample_aux_without_gain(sensor):
+    # slave 0 programmed by hand: the gain of the magnetometer is unknown
+    sensor.aux_read_set(0x1E, 0x03, ["mag_x", "mag_z", "mag_y"])
+    with pytest.raises(ValueError, match="gain"):
+        sensor.sample_aux_get()
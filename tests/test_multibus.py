@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the shared memory ring of the multi-bus acquisition.
+"""
+
+import functools
+import time
+
+import numpy as np
+import pytest
+
+from multibus import BusSpec, MultiBusAcquisition, SharedRing
+from simulated_bus import SimulatedBus, MPU6050Model
+
+@pytest.fixture
+def ring():
+    ring = SharedRing(16, 3)
+    yield ring
+    ring.close(unlink=True)
+
+def fill(ring, n):
+    for i in range(n):
+        ring.write(i, [i, -i, 2*i])
+
+def test_ring_read(ring):
+    fill(ring, 10)
+    timestamps, frames, cursor, lost = ring.read(0)
+    assert (cursor, lost) == (10, 0)
+    np.testing.assert_array_equal(timestamps, np.arange(10))
+    np.testing.assert_array_equal(frames[:, 2], 2*np.arange(10))
+    assert len(ring.read(cursor)[0]) == 0
+
+def test_ring_wrap(ring):
+    fill(ring, ring.capacity + 5)
+    timestamps, frames, cursor, lost = ring.read(0)
+    # the 5 overwritten frames and the one whose slot is the next written
+    assert (cursor, lost) == (ring.capacity + 5, 6)
+    np.testing.assert_array_equal(timestamps, np.arange(6, ring.capacity + 5))
+    np.testing.assert_array_equal(frames[:, 1], -timestamps)
+    assert len(timestamps) + lost == cursor
+
+def test_ring_attach(ring):
+    fill(ring, 3)
+    other = SharedRing(ring.capacity, ring.width, name=ring.shm.name)
+    try:
+        timestamps, frames, cursor, lost = other.read(1)
+        np.testing.assert_array_equal(timestamps, [1, 2])
+        assert (cursor, lost) == (3, 0)
+    finally:
+        other.close()
+
+def simulated_bus(addresses=(0x68,)):
+    bus = SimulatedBus()
+    for address in addresses:
+        bus.add_device(address, MPU6050Model())
+    return bus
+
+def bring_up(sensors):
+    for sensor in sensors:
+        sensor.bring_up()
+
+@pytest.mark.parametrize("mode", ["thread", "process"])
+def test_merged_read(mode):
+    specs = [BusSpec(1, [("mpu6050", 0x68)], setup=bring_up, bus_factory=simulated_bus),
+             BusSpec(3, [("mpu6050", 0x68), ("mpu6050", 0x69)], setup=bring_up,
+                     bus_factory=functools.partial(simulated_bus, (0x68, 0x69)))]
+    acquisition = MultiBusAcquisition(specs, rate=200, mode=mode, latency=0.05)
+    acquisition.start()
+    try:
+        batches = []
+        complete = 0
+        end = time.monotonic() + 10
+        while complete < 20 and time.monotonic() < end:
+            time.sleep(0.02)
+            timestamps, data = acquisition.read()
+            batches.append(data)
+            complete += int((~np.isnan(data).any(axis=1)).sum())
+            if len(timestamps) > 1:
+                assert np.all(np.diff(timestamps) == acquisition.period)
+        errors = acquisition.errors()
+    finally:
+        acquisition.stop()
+    data = np.vstack(batches)
+    assert data.shape[1] == len(acquisition.columns()) == 21
+    # the slots where every bus was running hold a frame of each sensor
+    complete = data[~np.isnan(data).any(axis=1)]
+    assert len(complete) >= 20
+    np.testing.assert_array_equal(complete[:, [2, 9, 16]], 16384)
+    assert errors == {1 : 0, 3 : 0}
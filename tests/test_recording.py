@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the binary recordings.
+"""
+
+import numpy as np
+import pytest
+
+from MPU6050.register_map import RegisterMap
+from recording import Recorder, Recording, sensor_header
+
+COLUMNS = ["accel_x", "accel_y", "accel_z"]
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "test.rec"
+    data = np.arange(30, dtype=np.int16).reshape(10, 3) - 15
+    with Recorder(path, COLUMNS, scale=[2.0]*3, offset=[1.0]*3, sample_rate=100, chunk=4) as recorder:
+        recorder.write(data[:7])
+        recorder.write(data[7:])
+    recording = Recording(path)
+    assert len(recording) == 10
+    np.testing.assert_array_equal(recording.raw(), data)
+    np.testing.assert_allclose(recording.scaled(2, 4, ["accel_y"]), data[2:4, [1]]*2 + 1)
+    np.testing.assert_array_equal(np.diff(recording.times()), 10_000_000)
+
+def test_timestamps(tmp_path):
+    path = tmp_path / "test.rec"
+    with Recorder(path, COLUMNS, timestamps=True) as recorder:
+        with pytest.raises(ValueError):
+            recorder.write(np.zeros((2, 3)))
+        recorder.write(np.zeros((2, 3)), [5, 7])
+    np.testing.assert_array_equal(Recording(path).times(), [5, 7])
+
+def test_writer_error(tmp_path):
+    recorder = Recorder(tmp_path / "test.rec", COLUMNS, queue_size=1)
+    # two columns instead of three: the writer thread fails
+    recorder.write(np.zeros((4, 2)))
+    with pytest.raises(IndexError):
+        # never blocks on the full queue
+        for _ in range(100):
+            recorder.write(np.zeros((4, 3)))
+    with pytest.raises(IndexError):
+        recorder.close()
+
+def test_sensor_header_keeps_held_changes(sensor):
+    sensor.hold_changes()
+    sensor.field_set(RegisterMap.DLPF_CFG, 5)
+    transactions = sensor.i2c.bus.transactions
+    header = sensor_header(sensor)
+    # the shadow copy is complete after bring_up, nothing is red
+    assert sensor.i2c.bus.transactions == transactions
+    assert header["config"][f"{RegisterMap.CONFIG:#04x}"] & 0x07 == 5
+    sensor.apply_changes()
+    assert sensor.field_get(RegisterMap.DLPF_CFG) == 5
+    assert header["columns"] == RegisterMap.MOTION_COLUMNS
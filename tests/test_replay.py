@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the replay of recordings.
+"""
+
+import numpy as np
+
+from i2c import I2CInterface
+from MPU6050.calibration import CalibrationProfile
+from MPU6050.mpu6050 import MPU6050
+from MPU6050.register_map import RegisterMap
+from recording import Recorder, Recording
+from replay import ReplayBus
+
+def test_replay_calibrated(sensor, tmp_path):
+    path = str(tmp_path / "test.rec")
+    sensor.calibration = CalibrationProfile(gyro_bias=[1.0, -2.0, 0.5], accel_offset=[0.02, 0.0, -0.03],
+                                            accel_scale=[1.01, 0.99, 1.0])
+    raw = np.array([[100, -200, 16000, 1000, 30, -40, 50],
+                    [-300, 400, 16500, 1100, -60, 70, -80]], dtype=np.int16)
+    with Recorder.for_sensor(path, sensor) as recorder:
+        recorder.write(np.repeat(raw, 100, axis=0))
+    recording = Recording(path)
+    expected = sensor.fifo_scale(raw, RegisterMap.MOTION_COLUMNS)
+    np.testing.assert_allclose(recording.scaled(99, 101), expected)
+
+    bus = ReplayBus(path, speed=None)
+    replayed = MPU6050(0x68, i2c=I2CInterface(1, bus=bus))
+    replayed.bring_up()
+    bus.rewind()
+    # the uncalibrated values are replayed: the raw values are the recorded ones
+    motion = [0, 1, 2, 4, 5, 6]
+    samples = np.array([replayed.read_raw() for _ in range(150)])
+    np.testing.assert_array_equal(samples[0, motion], raw[0, motion])
+    np.testing.assert_array_equal(samples[-1, motion], raw[1, motion])
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the ring buffer and of the background sampler.
+"""
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from sampler import BackgroundSampler, RingBuffer
+
+def batch(start, n):
+    index = np.arange(start, start + n)
+    return index, np.stack([index, -index], axis=1).astype(float)
+
+def test_ring_wrap():
+    ring = RingBuffer(8, 2)
+    ring.write(*batch(0, 5))
+    ring.write(*batch(5, 6))
+    assert ring.overruns == 3
+    timestamps, data, cursor = ring.read_since()
+    np.testing.assert_array_equal(timestamps, np.arange(3, 11))
+    np.testing.assert_array_equal(data[:, 1], -timestamps)
+    assert cursor == 11
+    # larger than the buffer: only the last samples are kept
+    ring.write(*batch(11, 20))
+    np.testing.assert_array_equal(ring.read_since(cursor)[0], np.arange(23, 31))
+    np.testing.assert_array_equal(ring.latest(3)[0], [28, 29, 30])
+
+def test_ring_cursors_independent():
+    ring = RingBuffer(8, 2, policy="drop_newest")
+    ring.write(*batch(0, 6))
+    # a reader with a cursor does not release the samples of the others
+    assert len(ring.read_since(0)[0]) == 6
+    assert ring.tail == 0
+    assert len(ring.read_since(2)[0]) == 4
+    ring.write(*batch(6, 4))
+    assert ring.overruns == 2
+    timestamps, data, cursor = ring.read_since()
+    np.testing.assert_array_equal(timestamps, np.arange(8))
+    ring.write(*batch(8, 4))
+    assert ring.overruns == 2
+
+def test_ring_block():
+    ring = RingBuffer(4, 2, policy="block")
+    ring.write(*batch(0, 4))
+    writer = threading.Thread(target=ring.write, args=batch(4, 3))
+    writer.start()
+    writer.join(0.05)
+    # full: the writer waits for the default consumer
+    assert writer.is_alive()
+    ring.latest(4)
+    ring.read_since(0)
+    assert writer.is_alive()
+    received = [ring.read_since()[0]]
+    writer.join(1)
+    assert not writer.is_alive()
+    received.append(ring.read_since()[0])
+    np.testing.assert_array_equal(np.concatenate(received), np.arange(7))
+    assert ring.overruns == 0
+
+def test_ring_block_close():
+    ring = RingBuffer(2, 2, policy="block")
+    ring.write(*batch(0, 2))
+    stored = []
+    writer = threading.Thread(target=lambda: stored.append(ring.write(*batch(2, 2))))
+    writer.start()
+    ring.close()
+    writer.join(1)
+    assert stored == [0]
+
+def test_ring_wait():
+    ring = RingBuffer(4, 2)
+    assert not ring.wait(0, timeout=0.01)
+    threading.Timer(0.01, ring.write, batch(0, 1)).start()
+    assert ring.wait(0, timeout=1)
+
+def test_invalid_policy():
+    with pytest.raises(ValueError):
+        RingBuffer(4, 2, policy="drop")
+
+def test_sampler_burst(sensor):
+    sampler = BackgroundSampler(sensor, capacity=100, rate=200)
+    sampler.start()
+    cursor = 0
+    received = []
+    for _ in range(3):
+        assert sampler.wait(cursor, timeout=1)
+        timestamps, data, cursor = sampler.read_since(cursor)
+        received.append(data)
+    sampler.stop()
+    data = np.vstack(received)
+    assert data.shape[1] == 7
+    np.testing.assert_allclose(data[:, 2], 1, atol=1e-3)
+    assert sampler.errors == 0
+
+def test_sampler_fifo(sensor):
+    sensor.fifo_config_set(accel=True, gyro=True)
+    sensor.fifo_enable()
+    sampler = BackgroundSampler(sensor, capacity=1000, mode="fifo", interval=0.005)
+    sampler.start()
+    time.sleep(0.05)
+    sampler.stop()
+    timestamps, data, cursor = sampler.read_since()
+    assert data.shape[1] == 6 and len(data) > 100
+    assert np.all(np.diff(timestamps) > 0)
+    assert sensor.fifo_overflows == 0
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the deadline polling scheduler.
+"""
+
+import time
+
+import numpy as np
+import pytest
+
+from scheduler import DeadlineScheduler
+
+def test_invalid_rate():
+    with pytest.raises(ValueError):
+        DeadlineScheduler(0)
+
+def test_deadlines_do_not_drift():
+    scheduler = DeadlineScheduler(500)
+    start = time.monotonic_ns()
+    scheduler.reset(start)
+    # the read time is not added to the period
+    timestamps, data = scheduler.run(lambda: time.sleep(0.0005) or [1, 2], 50)
+    # on the grid of the start, a late host only skips deadlines
+    steps = np.diff(timestamps)//scheduler.period
+    assert np.all((timestamps - start) % scheduler.period == 0) and np.all(steps >= 1)
+    assert timestamps[-1] == start + (49 + scheduler.missed)*scheduler.period
+    assert data.shape == (50, 2)
+    assert scheduler.count == 50 and scheduler.missed <= 5
+    assert time.monotonic_ns() >= timestamps[-1]
+
+def test_missed_deadlines_keep_phase():
+    scheduler = DeadlineScheduler(1000)
+    start = time.monotonic_ns()
+    scheduler.reset(start)
+    scheduler.wait()
+    time.sleep(0.0105)
+    deadline = scheduler.wait()
+    assert scheduler.missed >= 9
+    assert (deadline - start) % scheduler.period == 0
+    assert deadline == start + (scheduler.missed + 1)*scheduler.period
+
+def test_ticks_and_stats():
+    scheduler = DeadlineScheduler(1000, spin=False)
+    assert scheduler.margin == 0
+    ticks = list(scheduler.ticks(20))
+    assert np.all(np.diff(ticks) % scheduler.period == 0)
+    stats = scheduler.stats()
+    assert stats["count"] == 20 and stats["spin_us"] == 0
+    assert set(stats) == {"count", "missed", "spin_us", "std_us", "p50_us", "p99_us", "max_us"}
+
+def test_for_sensor(sensor):
+    sensor.output_rate_set(100)
+    assert DeadlineScheduler.for_sensor(sensor).period == 10_000_000
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the simulated I2C bus and of its device models.
+"""
+
+import errno
+
+import numpy as np
+import pytest
+
+from i2c import I2CInterface
+from simulated_bus import SimulatedBus, MPU6050Model
+from MPU6050.mpu6050 import MPU6050
+from MPU6050.register_map import RegisterMap
+
+def moving(t):
+    accel = np.zeros((len(t), 3))
+    accel[:, 0] = 0.5
+    gyro = np.zeros((len(t), 3))
+    gyro[:, 2] = 100
+    return accel, gyro, np.full(len(t), 30.0)
+
+def test_burst_read(sensor):
+    transactions = sensor.i2c.bus.transactions
+    accel, temp, gyro = sensor.sample_get()
+    # accel, temperature and gyro in one transaction
+    assert sensor.i2c.bus.transactions == transactions + 1
+    np.testing.assert_allclose(accel, [0, 0, 1], atol=1e-3)
+    np.testing.assert_allclose(gyro, 0, atol=0.01)
+    assert temp == pytest.approx(25, abs=0.01)
+
+def test_motion():
+    bus = SimulatedBus()
+    bus.add_device(0x69, MPU6050Model(motion=moving))
+    sensor = MPU6050(0x69, i2c=I2CInterface(1, bus=bus))
+    sensor.bring_up()
+    accel, temp, gyro = sensor.sample_get()
+    np.testing.assert_allclose(accel, [0.5, 0, 0], atol=1e-3)
+    np.testing.assert_allclose(gyro, [0, 0, 100], atol=0.01)
+    assert temp == pytest.approx(30, abs=0.01)
+
+def test_sleep_after_reset(manual_sensor, clock):
+    manual_sensor.sleep()
+    clock.advance(0.01)
+    assert not manual_sensor.field_get(RegisterMap.DATA_RDY_INT)
+    manual_sensor.wakeup()
+    # the sample clock starts with the first transaction after the wake up
+    assert not manual_sensor.field_get(RegisterMap.DATA_RDY_INT)
+    clock.advance(0.01)
+    assert manual_sensor.field_get(RegisterMap.DATA_RDY_INT)
+
+def test_errors():
+    bus = SimulatedBus(error_rate=1.0, seed=0)
+    bus.add_device(0x68, MPU6050Model())
+    with pytest.raises(OSError) as error:
+        bus.read_byte_data(0x68, RegisterMap.WHO_AM_I)
+    assert error.value.errno == errno.EREMOTEIO
+    with pytest.raises(OSError) as error:
+        bus.read_byte_data(0x1E, 0)
+    assert error.value.errno == errno.ENXIO
+    assert bus.transactions == 2 and bus.bytes == 0
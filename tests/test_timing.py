@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the sample clock.
+"""
+
+import numpy as np
+
+from timing import SampleClock
+
+def batches(clock, period, n=100, size=10, jitter=0, seed=0):
+    # batches of a device with the given period (ns), counted at the end
+    rng = np.random.default_rng(seed)
+    out = []
+    for i in range(n):
+        host = 1_000_000 + (i + 1)*size*period + rng.normal(0, jitter)
+        out.append(clock.stamp(size, int(host)))
+    return np.concatenate(out)
+
+def test_drift():
+    clock = SampleClock(1000)
+    # the device is 100 ppm slower than nominal
+    stamps = batches(clock, 1_000_100, jitter=20_000)
+    np.testing.assert_allclose(clock.drift_ppm(), 100, atol=20)
+    assert clock.count == 1000
+    assert np.all(np.diff(stamps) > 0)
+    assert clock.jitter()["std_us"] < 40
+
+def test_stamps_on_the_line():
+    clock = SampleClock(1000)
+    stamps = batches(clock, 1_000_000)
+    # half a period before the count of each sample
+    np.testing.assert_allclose(stamps[-10:], 1_000_000 + (np.arange(990, 1000) + 0.5)*1_000_000, atol=1)
+
+def test_advance_and_reset():
+    clock = SampleClock(1000)
+    clock.stamp(10, 10_000_000)
+    clock.advance(10, 20_000_000)
+    stamps = clock.stamp(10, 30_000_000)
+    assert clock.count == 30
+    np.testing.assert_allclose(stamps, 10_000_000 + (np.arange(20, 30) + 0.5 - 10)*1_000_000, atol=1)
+    clock.reset()
+    assert clock.count == 0 and clock.period() == clock.nominal
+    assert clock.stamp(0, 40_000_000).shape == (0,)
+
+def test_fifo_read_counted(manual_sensor, clock):
+    manual_sensor.fifo_config_set(accel=True, gyro=True, temp=False)
+    manual_sensor.fifo_enable()
+    total = 0
+    for timed in (True, False, True, False, True):
+        clock.advance(0.002)
+        if timed:
+            timestamps, data = manual_sensor.fifo_read_timed()
+            assert len(timestamps) == len(data)
+        else:
+            data = manual_sensor.fifo_read()
+        total += len(data)
+    # the frames red without timestamps are counted as well
+    assert manual_sensor.sample_clock.count == total
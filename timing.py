@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Timestamps of FIFO samples from a fitted device sample clock, and the drift
+between the host and device clocks.
+"""
+
+# =============================================================================
+# SAMPLE TIMESTAMPS
+# =============================================================================
+import numpy as np
+
+class SampleClock:
+    """
+    Timestamps of the samples produced by the clock of a device, anchored to
+    time.monotonic_ns() of the host.
+    Each batch gives an observation (number of samples produced so far, host
+    time of the count). A line is fitted on the observations with
+    exponentially weighted least squares: its slope is the actual sample
+    period, so the drift of the device oscillator is tracked, and the
+    residuals measure the jitter of the reads. The samples of a batch are
+    stamped on the line, without one clock call per sample.
+
+    Attributes
+    ----------
+    rate : float
+        Nominal sample rate in Hz.
+    count : int
+        Number of samples stamped since the last reset.
+    """
+    def __init__(self, rate, forget=0.995, window=1024):
+        """
+        Method to initialize the SampleClock object.
+
+        Parameters
+        ----------
+        rate : float
+            Nominal sample rate in Hz.
+        forget : float, optional
+            Weight of the previous observations at each new one, the memory
+            is about 1/(1 - forget) batches. The default is 0.995.
+        window : int, optional
+            Number of residuals kept for the jitter statistics.
+            The default is 1024.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.rate = rate
+        self.nominal = 1e9/rate
+        self.forget = forget
+        self.residuals = np.zeros(window)
+        self.reset()
+
+    def reset(self):
+        """
+        Function to restart the stamping, e.g. after a FIFO reset, when the
+        samples counted by the host no longer match the device.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.count = 0
+        self.origin = None
+        self.weight = 0.0
+        self.mean_x = self.mean_y = 0.0
+        self.var_x = self.cov_xy = 0.0
+        self.observations = 0
+        self.last = None
+
+    def period(self):
+        """
+        Function to get the estimated sample period.
+
+        Returns
+        -------
+        float
+            Sample period in ns, the nominal one until the fit is possible.
+
+        """
+        if self.observations < 3 or self.var_x <= 0:
+            return self.nominal
+        return self.cov_xy/self.var_x
+
+    def predict(self, x):
+        # host time, from the origin, at which x samples had been produced
+        if self.observations < 3 or self.var_x <= 0:
+            x_last, y_last = self.last
+            return y_last + (np.asarray(x) - x_last)*self.nominal
+        return self.mean_y + (np.asarray(x) - self.mean_x)*self.period()
+
+    def observe(self, x, y):
+        if self.observations:
+            self.residuals[(self.observations - 1) % len(self.residuals)] = y - self.predict(x)
+        self.weight = self.forget*self.weight + 1
+        a = 1/self.weight
+        dx = x - self.mean_x
+        dy = y - self.mean_y
+        self.mean_x += a*dx
+        self.mean_y += a*dy
+        self.var_x = (1 - a)*(self.var_x + a*dx*dx)
+        self.cov_xy = (1 - a)*(self.cov_xy + a*dx*dy)
+        self.observations += 1
+        self.last = (x, y)
+
+    def advance(self, n, host_ns, pending=0):
+        """
+        Function to count a batch of consecutive samples without stamping
+        them, e.g. when the batch was red without timestamps.
+
+        Parameters
+        ----------
+        n : int
+            Number of samples of the batch.
+        host_ns : int
+            time.monotonic_ns() at which the samples were counted (e.g. the
+            FIFO count read).
+        pending : int, optional
+            Samples already produced at host_ns but left for the next batch.
+            The default is 0.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.origin is None:
+            self.origin = host_ns
+        self.count += n
+        if n or pending:
+            self.observe(self.count + pending, host_ns - self.origin)
+
+    def timestamps(self, first, n):
+        """
+        Function to get the timestamps of counted samples.
+
+        Parameters
+        ----------
+        first : int
+            Index of the first sample since the last reset.
+        n : int
+            Number of samples.
+
+        Returns
+        -------
+        numpy.ndarray
+            time.monotonic_ns() of the samples (n).
+
+        """
+        if self.last is None:
+            return np.empty(0, dtype=np.int64)
+        # sample j is counted when it is complete, on average half a period
+        # before the read
+        k = first + np.arange(n) + 0.5
+        return self.origin + np.rint(self.predict(k)).astype(np.int64)
+
+    def stamp(self, n, host_ns, pending=0):
+        """
+        Function to count and stamp a batch of consecutive samples.
+
+        Parameters
+        ----------
+        n : int
+            Number of samples of the batch.
+        host_ns : int
+            time.monotonic_ns() at which the samples were counted (e.g. the
+            FIFO count read).
+        pending : int, optional
+            Samples already produced at host_ns but left for the next batch.
+            The default is 0.
+
+        Returns
+        -------
+        numpy.ndarray
+            time.monotonic_ns() of the samples (n).
+
+        """
+        self.advance(n, host_ns, pending)
+        return self.timestamps(self.count - n, n)
+
+    def drift_ppm(self):
+        """
+        Function to get the drift of the device clock against the host clock.
+
+        Returns
+        -------
+        float
+            Relative error of the sample period in ppm, positive when the
+            device is slower than nominal.
+
+        """
+        return (self.period()/self.nominal - 1)*1e6
+
+    def jitter(self):
+        """
+        Function to get the statistics of the read jitter, the deviation of
+        the read times from the fitted line.
+
+        Returns
+        -------
+        dict
+            Standard deviation, median, 99th percentile and maximum of the
+            absolute deviation in us.
+
+        """
+        n = min(max(self.observations - 1, 0), len(self.residuals))
+        if not n:
+            return {"std_us" : 0.0, "p50_us" : 0.0, "p99_us" : 0.0, "max_us" : 0.0}
+        residuals = self.residuals[:n]/1000
+        absolute = np.abs(residuals)
+        return {
+            "std_us" : float(residuals.std()),
+            "p50_us" : float(np.percentile(absolute, 50)),
+            "p99_us" : float(np.percentile(absolute, 99)),
+            "max_us" : float(absolute.max())}